@@ -0,0 +1,99 @@
+import time
+from datetime import datetime, timedelta
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import and_, exists, insert
+from models import db, Client, Credit, PaymentSchedule, Notification
+from jobs import acquire_job_lock
+from reference_data import user_ids_with_roles
+
+ALERT_RECIPIENT_ROLES = ['administrateur', 'gestionnaire']
+REMINDER_WINDOW_DAYS = 7
+
+
+def _missing_alerts(notification_type, *conditions):
+    """Unpaid installments matching ``conditions`` with no unread alert of this type (one anti-join)."""
+    already_alerted = exists().where(and_(
+        Notification.notification_type == notification_type,
+        Notification.related_entity_type == 'PaymentSchedule',
+        Notification.related_entity_id == PaymentSchedule.id,
+        Notification.is_read == False
+    ))
+    return db.session.query(
+        PaymentSchedule.id,
+        PaymentSchedule.due_date,
+        PaymentSchedule.expected_amount,
+        Credit.credit_number,
+        Client.first_name,
+        Client.last_name
+    ).join(Credit, PaymentSchedule.credit_id == Credit.id).join(Client, Credit.client_id == Client.id).filter(
+        PaymentSchedule.paid == False,
+        ~already_alerted,
+        *conditions
+    ).all()
+
+
+def generate_payment_alerts(today=None):
+    """Create reminder and overdue notifications for every installment that lacks one.
+
+    Safe to run concurrently from several workers: the job lock makes the
+    second run wait for the first and then find nothing left to insert.
+    Returns the number of notifications created.
+    """
+    today = today or datetime.now().date()
+    acquire_job_lock('payment_alerts')
+
+    recipient_ids = user_ids_with_roles(ALERT_RECIPIENT_ROLES)
+    rows = []
+
+    if recipient_ids:
+        upcoming = _missing_alerts(
+            'payment_reminder',
+            PaymentSchedule.due_date >= today,
+            PaymentSchedule.due_date <= today + timedelta(days=REMINDER_WINDOW_DAYS)
+        )
+        for payment in upcoming:
+            days_until_due = (payment.due_date - today).days
+            title = f'Échéance dans {days_until_due} jour(s)'
+            message = f'Le crédit {payment.credit_number} de {payment.first_name} {payment.last_name} a une échéance de {payment.expected_amount} FCFA le {payment.due_date.strftime("%d/%m/%Y")}'
+            rows.extend({
+                'user_id': user_id,
+                'title': title,
+                'message': message,
+                'notification_type': 'payment_reminder',
+                'related_entity_type': 'PaymentSchedule',
+                'related_entity_id': payment.id
+            } for user_id in recipient_ids)
+
+        overdue = _missing_alerts('payment_overdue', PaymentSchedule.due_date < today)
+        for payment in overdue:
+            days_overdue = (today - payment.due_date).days
+            title = f'⚠️ Paiement en retard de {days_overdue} jour(s)'
+            message = f'ALERTE: Le crédit {payment.credit_number} de {payment.first_name} {payment.last_name} a un paiement en retard depuis le {payment.due_date.strftime("%d/%m/%Y")}. Montant: {payment.expected_amount} FCFA'
+            rows.extend({
+                'user_id': user_id,
+                'title': title,
+                'message': message,
+                'notification_type': 'payment_overdue',
+                'related_entity_type': 'PaymentSchedule',
+                'related_entity_id': payment.id
+            } for user_id in recipient_ids)
+
+    if rows:
+        db.session.execute(insert(Notification), rows)
+    db.session.commit()
+    return len(rows)
+
+
+@click.command('generate-payment-alerts')
+@click.option('--every', type=int, default=0, help='Relancer toutes les N secondes (0 = une seule exécution).')
+@with_appcontext
+def generate_payment_alerts_command(every):
+    """Génère les alertes d'échéances à venir et de paiements en retard."""
+    while True:
+        started = time.perf_counter()
+        created = generate_payment_alerts()
+        click.echo(f'{created} notification(s) créée(s) en {time.perf_counter() - started:.2f}s')
+        if every <= 0:
+            break
+        time.sleep(every)
@@ -0,0 +1,133 @@
+from datetime import date
+from functools import lru_cache
+import numpy as np
+
+DEFAULT_GRID_DURATIONS = (6, 12, 18, 24, 36, 48)
+
+MAX_DURATION = 360  # months, for products without a maximum duration
+MAX_GRID_AMOUNTS = 50
+MAX_GRID_DURATIONS = 24
+
+
+def monthly_payments(amounts, annual_rates, durations):
+    """Annuity installment for every (amount, annual rate %, months) combination.
+
+    Arguments broadcast against each other like any NumPy expression, so
+    a column of amounts against a row of durations yields a full grid.
+    """
+    amounts = np.asarray(amounts, dtype=float)
+    rates = np.asarray(annual_rates, dtype=float) / 100 / 12
+    durations = np.asarray(durations, dtype=float)
+    amounts, rates, durations = np.broadcast_arrays(amounts, rates, durations)
+
+    growth = np.power(1 + rates, durations)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        annuity = amounts * rates * growth / (growth - 1)
+    return np.where(rates > 0, annuity, amounts / durations)
+
+
+def loan_terms(amounts, annual_rates, durations):
+    """Rounded monthly payment, total cost and total interest arrays, as stored on a Credit."""
+    payment = monthly_payments(amounts, annual_rates, durations)
+    total = payment * np.asarray(durations, dtype=float)
+    return {
+        'monthly_payment': np.round(payment, 2),
+        'total_amount': np.round(total, 2),
+        'total_interest': np.round(total - np.asarray(amounts, dtype=float), 2)
+    }
+
+
+def amortization_table(amount, annual_rate, duration):
+    """Per-installment interest, principal and remaining balance of one loan.
+
+    Uses the closed form of the outstanding balance after ``k`` payments
+    instead of a running loop.
+    """
+    rate = annual_rate / 100 / 12
+    payment = float(monthly_payments(amount, annual_rate, duration))
+    k = np.arange(0, duration + 1, dtype=float)
+    if rate > 0:
+        growth = np.power(1 + rate, k)
+        balances = amount * growth - payment * (growth - 1) / rate
+    else:
+        balances = amount - payment * k
+    balances = np.maximum(balances, 0)
+    interest = balances[:-1] * rate
+    principal = payment - interest
+    return {
+        'installment': np.arange(1, duration + 1),
+        'payment': np.full(duration, payment),
+        'interest': interest,
+        'principal': principal,
+        'balance': balances[1:]
+    }
+
+
+def amortization_rows(amount, annual_rate, duration):
+    """``amortization_table`` as one dict per installment, for templates."""
+    table = amortization_table(amount, annual_rate, duration)
+    return [dict(zip(table, values)) for values in zip(*(column.tolist() for column in table.values()))]
+
+
+def duration_limits(products):
+    """Shortest minimum and longest maximum duration over ``products``, within 1..MAX_DURATION."""
+    minimum = min((p.min_duration or 1 for p in products), default=1)
+    maximum = max((min(p.max_duration or MAX_DURATION, MAX_DURATION) for p in products), default=MAX_DURATION)
+    return max(minimum, 1), maximum
+
+
+def due_dates(start, duration):
+    """Due dates one to ``duration`` months after ``start``.
+
+    Same calendar rule as ``start + relativedelta(months=i)``: the day of
+    month is kept and clamped to the last day of shorter months.
+    """
+    start_month = np.datetime64(date(start.year, start.month, 1), 'M')
+    months = start_month + np.arange(1, duration + 1)
+    month_starts = months.astype('datetime64[D]')
+    month_lengths = ((months + 1).astype('datetime64[D]') - month_starts).astype(int)
+    days = np.minimum(start.day, month_lengths) - 1
+    return (month_starts + days).astype(date).tolist()
+
+
+@lru_cache(maxsize=4096)
+def _simulate(amount, annual_rate, duration):
+    terms = loan_terms(amount, annual_rate, duration)
+    return tuple((key, float(value)) for key, value in terms.items())
+
+
+def simulate(amount, annual_rate, duration):
+    """Scalar terms for one (amount, rate, duration) request, memoized; callers get their own dict."""
+    return dict(_simulate(amount, annual_rate, duration))
+
+
+@lru_cache(maxsize=256)
+def _comparison_grid(amount, products, durations):
+    rates = np.array([rate for _, _, rate, _, _ in products], dtype=float)[:, None]
+    grid = loan_terms(amount, rates, np.array(durations, dtype=float)[None, :])
+    rows = []
+    for i, (product_id, name, rate, min_duration, max_duration) in enumerate(products):
+        cells = []
+        for j, duration in enumerate(durations):
+            allowed = (min_duration is None or duration >= min_duration) and (max_duration is None or duration <= max_duration)
+            cells.append({
+                'duration': duration,
+                'allowed': allowed,
+                'monthly_payment': float(grid['monthly_payment'][i, j]),
+                'total_amount': float(grid['total_amount'][i, j]),
+                'total_interest': float(grid['total_interest'][i, j])
+            })
+        rows.append({'product_id': product_id, 'product_name': name, 'interest_rate': rate, 'cells': cells})
+    return rows
+
+
+def comparison_grid(amount, products, durations=DEFAULT_GRID_DURATIONS):
+    """Terms of ``amount`` for every product and duration, computed as one array expression.
+
+    ``products`` are Product rows; cells outside a product's duration
+    bounds are flagged ``allowed=False`` rather than dropped.
+    """
+    key = tuple((p.id, p.name, p.interest_rate, p.min_duration, p.max_duration) for p in products)
+    rows = _comparison_grid(float(amount), key, tuple(int(d) for d in durations))
+    # The cached rows are shared: hand out copies
+    return [dict(row, cells=[dict(cell) for cell in row['cells']]) for row in rows]
@@ -1,232 +1,193 @@
+import time
+BOOT_STARTED = time.perf_counter()
+
+import math
 import os
+import subprocess
+import sys
 from datetime import datetime
+from importlib import import_module
+import click
 from dotenv import load_dotenv
-from flask import Flask, render_template, redirect, url_for, flash, request
+from flask import Flask, Response, current_app, render_template, redirect, url_for, flash, request, jsonify
+from flask.cli import AppGroup, with_appcontext
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from models import db, User, Client, Product, Credit, CreditPayment, SavingsAccount, SavingsTransaction, PaymentSchedule, AuditLog, ClientInteraction, SystemSettings, Notification, CreditDocument
-from forms import LoginForm, ClientForm, ProductForm, CreditForm, CreditPaymentForm, SavingsAccountForm, SavingsTransactionForm, ProfileForm, ChangePasswordForm, LoanSimulationForm, ClientInteractionForm, SystemSettingsForm, UserForm
-from sqlalchemy import func
-import random
-import string
+from models import db, User, Client, Product, Credit, CreditPayment, SavingsAccount, SavingsTransaction, PaymentSchedule, AuditLog, ClientInteraction, SystemSettings, Notification, CreditDocument, MobilePayment, ClientSummary, SettlementFile, SettlementLine
+from forms import LoginForm, ClientForm, ProductForm, CreditForm, CreditPaymentForm, SavingsAccountForm, SavingsTransactionForm, ProfileForm, ChangePasswordForm, LoanSimulationForm, ClientInteractionForm, SystemSettingsForm, UserForm, SettlementFileForm
+from sqlalchemy import func, case
+from sqlalchemy.orm import joinedload
+from snapshot import get_dashboard_snapshot
+from alerts import generate_payment_alerts
+from jobs import start_periodic_job
+from rollups import monthly_rollup
+from pagination import keyset_paginate
+from loaders import CREDIT_ROW, SAVINGS_ROW, CLIENT_DETAIL, CREDIT_DETAIL, SAVINGS_DETAIL, CREDIT_HISTORY_ROW, AUDIT_ROW
+from query_budget import query_budget, init_query_budget
+from exports import ExportFilters, CLIENT_HEADER, CREDIT_HEADER, SAVINGS_HEADER, client_rows, credit_rows, savings_rows, csv_response, wants_gzip
+from penalties import run_penalties
+from scoring import get_client_score
+from geo import viewport, located_bounds, COLORS as MAP_COLORS, DEFAULT_CENTER
+from payments import MOBILE_MONEY_METHODS, create_mobile_payment, notify_payment_worker, payment_status, start_payment_worker
+from par import portfolio_at_risk
+from identifiers import next_id
+from reference_data import get_system_settings, active_products
+from user_cache import load_cached_user, user_cache_stats
+from database import configure_engines, read_replica, pool_stats
+from metrics import init_metrics, metrics_authorized, render_metrics, PROMETHEUS_CONTENT_TYPE
+from summaries import get_client_summary, refresh_queued_summaries
+from search import search_clients, client_search_condition, credit_search_condition
 from dateutil.relativedelta import relativedelta
 from werkzeug.utils import secure_filename
 import uuid
+import tempfile
 
-load_dotenv()
-
-# Configuration de l'application
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get('SESSION_SECRET', 'dev-key-change-in-production')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'mysql+pymysql://root:@localhost/financier_db')
-app.config['UPLOAD_FOLDER'] = os.path.join('static', 'uploads')
-app.config['CLIENT_PHOTOS_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], 'client_photos')
-app.config['CLIENT_ID_CARDS_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], 'client_id_cards')
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+IMPORT_SECONDS = time.perf_counter() - BOOT_STARTED
 
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(app.config['CLIENT_PHOTOS_FOLDER'], exist_ok=True)
-os.makedirs(app.config['CLIENT_ID_CARDS_FOLDER'], exist_ok=True)
+load_dotenv()
 
-db.init_app(app)
+# CLI commands, imported when run so that web workers never load numpy or the batch engines
+CLI_COMMANDS = {
+    'generate-payment-alerts': 'alerts:generate_payment_alerts_command',
+    'rebuild-monthly-summary': 'rollups:rebuild_monthly_summary_command',
+    'rebuild-search-index': 'search:rebuild_search_index_command',
+    'run-penalties': 'penalties:run_penalties_command',
+    'rescore-clients': 'scoring:rescore_clients_command',
+    'accrue-savings-interest': 'interest:accrue_savings_interest_command',
+    'process-mobile-payments': 'payments:process_mobile_payments_command',
+    'import-client-locations': 'geo:import_client_locations_command',
+    'rebuild-client-summaries': 'summaries:rebuild_client_summaries_command',
+    'refresh-client-summaries': 'summaries:refresh_client_summaries_command',
+    'generate-synthetic-data': 'synthetic:generate_synthetic_data_command',
+    'benchmark': 'benchmarks:benchmark_command',
+    'import-clients': 'client_import:import_clients_command',
+    'post-settlement-file': 'settlements:post_settlement_file_command',
+}
 
 login_manager = LoginManager()
-login_manager.init_app(app)
 login_manager.login_view = 'login'
 login_manager.login_message = 'Veuillez vous connecter pour accéder à cette page.'
 
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
-
-def generate_unique_id(prefix, model, field):
-    while True:
-        random_part = ''.join(random.choices(string.digits, k=8))
-        unique_id = f"{prefix}{random_part}"
-        if not model.query.filter(getattr(model, field) == unique_id).first():
-            return unique_id
-
-def log_audit(action, entity_type=None, entity_id=None, details=None):
-    log = AuditLog(
-        user_id=current_user.id if current_user.is_authenticated else None,
-        action=action,
-        entity_type=entity_type,
-        entity_id=entity_id,
-        details=details,
-        ip_address=request.remote_addr
-    )
-    db.session.add(log)
-
-def save_uploaded_file(file, folder):
-    """Save uploaded file with secure filename and return relative path"""
-    if file and file.filename:
-        filename = secure_filename(file.filename)
-        unique_filename = f"{uuid.uuid4().hex}_{filename}"
-        file_path = os.path.join(folder, unique_filename)
-        file.save(file_path)
-        # Return path with forward slashes for web compatibility
-        return f"uploads/{os.path.basename(folder)}/{unique_filename}"
-    return None
-
-def generate_payment_schedule(credit):
-    if not credit.disbursement_date:
-        return
-
-    PaymentSchedule.query.filter_by(credit_id=credit.id).delete()
-
-    start_date = credit.disbursement_date
-    for i in range(1, credit.duration_months + 1):
-        due_date = start_date + relativedelta(months=i)
-        schedule = PaymentSchedule(
-            credit_id=credit.id,
-            installment_number=i,
-            due_date=due_date.date(),
-            expected_amount=credit.monthly_payment
-        )
-        db.session.add(schedule)
-
-def calculate_penalties(credit):
-    from datetime import datetime, timedelta
-    penalty_rate = 0.05
-    total_penalty = 0
-    
-    for installment in credit.payment_schedule:
-        if not installment.paid and installment.due_date < datetime.now().date():
-            days_late = (datetime.now().date() - installment.due_date).days
-            if days_late > 0:
-                penalty = installment.expected_amount * penalty_rate * (days_late / 30)
-                total_penalty += penalty
-    
-    return round(total_penalty, 2)
-
-def calculate_client_credit_score(client):
-    total_credits = Credit.query.filter_by(client_id=client.id).count()
-    if total_credits == 0:
-        return 50
-    
-    completed_credits = Credit.query.filter_by(client_id=client.id, status='completed').count()
-    active_credits = Credit.query.filter_by(client_id=client.id, status='active').all()
-    
-    score = 50
-    
-    if total_credits > 0:
-        completion_rate = completed_credits / total_credits
-        score += completion_rate * 30
-    
-    for credit in active_credits:
-        if credit.amount_paid > 0:
-            payment_ratio = credit.amount_paid / credit.total_amount
-            score += payment_ratio * 10
-        
-        overdue_count = len(credit.overdue_installments)
-        if overdue_count > 0:
-            score -= overdue_count * 5
-    
-    return max(0, min(100, round(score, 2)))
-
-def apply_savings_interest(account):
-    if account.status != 'active':
-        return
-    
-    from datetime import datetime
-    from dateutil.relativedelta import relativedelta
-    
-    last_transaction = SavingsTransaction.query.filter_by(
-        account_id=account.id,
-        transaction_type='interest'
-    ).order_by(SavingsTransaction.transaction_date.desc()).first()
-    
-    current_date = datetime.now()
-    last_interest_date = last_transaction.transaction_date if last_transaction else account.opening_date
-    
-    delta = relativedelta(current_date, last_interest_date)
-    months_passed = delta.years * 12 + delta.months
-    
-    if months_passed >= 1 and account.balance > 0:
-        monthly_rate = account.interest_rate / 100 / 12
-        interest_amount = account.balance * monthly_rate * months_passed
-        
-        account.balance += interest_amount
-        
-        transaction = SavingsTransaction(
-            account_id=account.id,
-            transaction_type='interest',
-            amount=interest_amount,
-            balance_after=account.balance,
-            notes=f'Intérêts calculés pour {months_passed} mois'
-        )
-        db.session.add(transaction)
-
-def generate_payment_alerts():
-    from datetime import datetime, timedelta
-    
-    today = datetime.now().date()
-    alert_window = today + timedelta(days=7)
-    
-    upcoming_payments = PaymentSchedule.query.filter(
-        PaymentSchedule.due_date <= alert_window,
-        PaymentSchedule.due_date >= today,
-        PaymentSchedule.paid == False
-    ).all()
-    
-    for payment in upcoming_payments:
-        credit = payment.credit
-        days_until_due = (payment.due_date - today).days
-        
-        existing_alert = Notification.query.filter_by(
-            notification_type='payment_reminder',
-            related_entity_type='PaymentSchedule',
-            related_entity_id=payment.id,
-            is_read=False
-        ).first()
-        
-        if not existing_alert:
-            all_admins = User.query.filter(User.role.in_(['administrateur', 'gestionnaire'])).all()
-            
-            for admin in all_admins:
-                notification = Notification(
-                    user_id=admin.id,
-                    title=f'Échéance dans {days_until_due} jour(s)',
-                    message=f'Le crédit {credit.credit_number} de {credit.client.full_name} a une échéance de {payment.expected_amount} FCFA le {payment.due_date.strftime("%d/%m/%Y")}',
-                    notification_type='payment_reminder',
-                    related_entity_type='PaymentSchedule',
-                    related_entity_id=payment.id
-                )
-                db.session.add(notification)
-    
-    overdue_payments = PaymentSchedule.query.filter(
-        PaymentSchedule.due_date < today,
-        PaymentSchedule.paid == False
-    ).all()
-    
-    for payment in overdue_payments:
-        credit = payment.credit
-        days_overdue = (today - payment.due_date).days
-        
-        existing_alert = Notification.query.filter_by(
-            notification_type='payment_overdue',
-            related_entity_type='PaymentSchedule',
-            related_entity_id=payment.id,
-            is_read=False
-        ).first()
-        
-        if not existing_alert:
-            all_admins = User.query.filter(User.role.in_(['administrateur', 'gestionnaire'])).all()
-            
-            for admin in all_admins:
-                notification = Notification(
-                    user_id=admin.id,
-                    title=f'⚠️ Paiement en retard de {days_overdue} jour(s)',
-                    message=f'ALERTE: Le crédit {credit.credit_number} de {credit.client.full_name} a un paiement en retard depuis le {payment.due_date.strftime("%d/%m/%Y")}. Montant: {payment.expected_amount} FCFA',
-                    notification_type='payment_overdue',
-                    related_entity_type='PaymentSchedule',
-                    related_entity_id=payment.id
-                )
-                db.session.add(notification)
-    
-    db.session.commit()
-
-with app.app_context():
+_routes = []
+
+
+def route(rule, **options):
+    """Same as ``app.route``; ``create_app`` binds the views to every application it builds."""
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
+
+
+class LazyCommandGroup(AppGroup):
+    """``app.cli`` importing a command's module only when that command is looked up."""
+
+    def __init__(self, lazy_commands, **kwargs):
+        super().__init__(**kwargs)
+        self.lazy_commands = lazy_commands
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, name):
+        if name not in self.commands and name in self.lazy_commands:
+            module_name, _, attribute = self.lazy_commands[name].partition(':')
+            self.add_command(getattr(import_module(module_name), attribute), name)
+        return super().get_command(ctx, name)
+
+
+def create_app(config=None):
+    """Build the application: configuration, extensions, views and CLI.
+
+    Neither the database nor the filesystem is touched and no thread is
+    started, so web workers, CLI commands and tests boot quickly;
+    ``flask --app app setup`` creates the schema, upload folders and
+    default accounts once per deployment, and ``start_workers`` starts
+    the background jobs of a web server process.
+    """
+    started = time.perf_counter()
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.environ.get('SESSION_SECRET', 'dev-key-change-in-production')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'mysql+pymysql://root:@localhost/financier_db')
+    app.config['DATABASE_REPLICA_URL'] = os.environ.get('DATABASE_REPLICA_URL')
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 5))
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('DB_POOL_TIMEOUT', 30))  # seconds waiting for a free connection
+    app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 280))  # seconds, below MySQL's wait_timeout
+    app.config['DB_POOL_PRE_PING'] = os.environ.get('DB_POOL_PRE_PING', '1').lower() in ('1', 'true', 'yes')
+    app.config['REPLICA_RETRY_INTERVAL'] = int(os.environ.get('REPLICA_RETRY_INTERVAL', 30))  # seconds
+    app.config['UPLOAD_FOLDER'] = os.path.join('static', 'uploads')
+    app.config['CLIENT_PHOTOS_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], 'client_photos')
+    app.config['CLIENT_ID_CARDS_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], 'client_id_cards')
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    app.config['CLIENT_IMPORT_FOLDER'] = os.environ.get('CLIENT_IMPORT_FOLDER', os.path.join(app.instance_path, 'imports'))
+    app.config['DASHBOARD_SNAPSHOT_MAX_AGE'] = int(os.environ.get('DASHBOARD_SNAPSHOT_MAX_AGE', 300))  # seconds
+    app.config['PAYMENT_ALERTS_INTERVAL'] = int(os.environ.get('PAYMENT_ALERTS_INTERVAL', 0))  # seconds, 0 = disabled
+    app.config['LIST_PAGE_SIZE'] = int(os.environ.get('LIST_PAGE_SIZE', 50))
+    app.config['SEARCH_RESULT_LIMIT'] = int(os.environ.get('SEARCH_RESULT_LIMIT', 20))
+    app.config['PENALTY_RUN_INTERVAL'] = int(os.environ.get('PENALTY_RUN_INTERVAL', 0))  # seconds, 0 = disabled
+    app.config['SUMMARY_REFRESH_INTERVAL'] = int(os.environ.get('SUMMARY_REFRESH_INTERVAL', 60))  # seconds, 0 = disabled
+    app.config['CLIENT_SCORE_MAX_AGE'] = int(os.environ.get('CLIENT_SCORE_MAX_AGE', 86400))  # seconds
+    app.config['PAYMENT_GATEWAY'] = os.environ.get('PAYMENT_GATEWAY', 'stub')
+    app.config['PAYMENT_GATEWAY_TIMEOUT'] = float(os.environ.get('PAYMENT_GATEWAY_TIMEOUT', 10))  # seconds per gateway call
+    app.config['PAYMENT_MAX_ATTEMPTS'] = int(os.environ.get('PAYMENT_MAX_ATTEMPTS', 5))
+    app.config['PAYMENT_WORKER_INTERVAL'] = float(os.environ.get('PAYMENT_WORKER_INTERVAL', 2))  # seconds, 0 = no in-process worker
+    app.config['MAP_MAX_MARKERS'] = int(os.environ.get('MAP_MAX_MARKERS', 1000))
+    app.config['MAP_CLUSTER_ZOOM'] = int(os.environ.get('MAP_CLUSTER_ZOOM', 12))
+    app.config['ID_BLOCK_SIZE'] = int(os.environ.get('ID_BLOCK_SIZE', 20))
+    app.config['CLIENT_ID_FORMAT'] = os.environ.get('CLIENT_ID_FORMAT', 'CLT{number:08d}')
+    app.config['CREDIT_NUMBER_FORMAT'] = os.environ.get('CREDIT_NUMBER_FORMAT', 'CRD{number:08d}')
+    app.config['SAVINGS_ACCOUNT_FORMAT'] = os.environ.get('SAVINGS_ACCOUNT_FORMAT', 'SAV{number:08d}')
+    app.config['USER_CACHE_TTL'] = float(os.environ.get('USER_CACHE_TTL', 60))  # seconds, 0 = disabled
+    app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 1024))
+    app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+    app.config['SLOW_REQUEST_THRESHOLD'] = float(os.environ.get('SLOW_REQUEST_THRESHOLD', 1.0))  # seconds, 0 = no slow log
+    app.config['SLOW_REQUEST_STATEMENTS'] = int(os.environ.get('SLOW_REQUEST_STATEMENTS', 3))
+    app.config['SLOW_REQUEST_LOG'] = os.environ.get('SLOW_REQUEST_LOG')
+    app.config['MONTHLY_SUMMARY_ENABLED'] = os.environ.get('MONTHLY_SUMMARY_ENABLED', '').lower() in ('1', 'true', 'yes')
+    if config:
+        app.config.update(config)
+
+    configure_engines(app)
+    db.init_app(app)
+    login_manager.init_app(app)
+    login_manager.user_loader(load_user)
+    init_query_budget(app)
+    init_metrics(app)
+
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    app.context_processor(inject_unread_notifications)
+    app.add_template_filter(currency_filter, 'currency')
+
+    app.cli = LazyCommandGroup(CLI_COMMANDS)
+    app.cli.add_command(setup_command)
+    app.cli.add_command(startup_time_command)
+
+    app.config['STARTUP_SECONDS'] = time.perf_counter() - started
+    app.logger.info('Application prête : imports %.0f ms, create_app %.0f ms',
+                    IMPORT_SECONDS * 1000, app.config['STARTUP_SECONDS'] * 1000)
+    return app
+
+
+def start_workers(app):
+    """Start the in-process background jobs whose interval is set; for web server processes only.
+
+    Called by the development server and by the ``post_worker_init`` hook
+    of gunicorn.conf.py, never by ``create_app``: CLI commands and tests
+    must not poll the database behind the caller's back.
+    """
+    start_periodic_job(app, 'payment_alerts', app.config['PAYMENT_ALERTS_INTERVAL'], generate_payment_alerts)
+    start_periodic_job(app, 'penalties', app.config['PENALTY_RUN_INTERVAL'], run_penalties)
+    start_periodic_job(app, 'client_summaries', app.config['SUMMARY_REFRESH_INTERVAL'], refresh_queued_summaries)
+    start_payment_worker(app)
+
+
+def setup_database():
+    """Create the tables, upload folders, default users and system settings; safe to run again."""
+    for key in ('UPLOAD_FOLDER', 'CLIENT_PHOTOS_FOLDER', 'CLIENT_ID_CARDS_FOLDER'):
+        os.makedirs(current_app.config[key], exist_ok=True)
     db.create_all()
     
     admin_username = os.environ.get("ADMIN_USERNAME", "admin")
@@ -238,7 +199,7 @@ with app.app_context():
         admin.set_password(admin_password)
         db.session.add(admin)
         db.session.commit()
-        print(f"Utilisateur administrateur '{admin_username}' créé avec succès (mot de passe: {admin_password})")
+        click.echo(f"Utilisateur administrateur '{admin_username}' créé avec succès (mot de passe: {admin_password})")
     
     default_users = [
         {'username': 'gestionnaire1', 'email': 'gestionnaire1@finance.com', 'password': 'Manager@123', 'role': 'gestionnaire'},
@@ -248,8 +209,10 @@ with app.app_context():
         {'username': 'agent3', 'email': 'agent3@finance.com', 'password': 'Agent@123', 'role': 'agent'},
     ]
     
+    existing = {username for (username,) in db.session.query(User.username).filter(
+        User.username.in_([user_data['username'] for user_data in default_users]))}
     for user_data in default_users:
-        if not User.query.filter_by(username=user_data['username']).first():
+        if user_data['username'] not in existing:
             user = User(
                 username=user_data['username'],
                 email=user_data['email'],
@@ -264,20 +227,94 @@ with app.app_context():
         default_settings = SystemSettings()
         db.session.add(default_settings)
         db.session.commit()
-        print("Paramètres système par défaut créés")
+        click.echo("Paramètres système par défaut créés")
+
+
+@click.command('startup-time')
+@click.option('--runs', type=int, default=5)
+def startup_time_command(runs):
+    """Mesure le temps de démarrage d'un worker (import + create_app) dans des processus neufs."""
+    script = (
+        'import time; started = time.perf_counter(); import app; '
+        'app.create_app(); print(time.perf_counter() - started)'
+    )
+    timings = sorted(
+        float(subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__))).stdout)
+        for _ in range(runs)
+    )
+    click.echo(f'Démarrage d\'un worker : médiane {timings[len(timings) // 2] * 1000:.0f} ms, '
+               f'min {timings[0] * 1000:.0f} ms, max {timings[-1] * 1000:.0f} ms ({runs} essais)')
+
+
+@click.command('setup')
+@with_appcontext
+def setup_command():
+    """Crée le schéma, les dossiers d'upload, les utilisateurs par défaut et les paramètres système."""
+    setup_database()
+    click.echo('Installation terminée')
+
+
+def inject_unread_notifications():
+    if not current_user.is_authenticated:
+        return {}
+    count = Notification.query.filter_by(user_id=current_user.id, is_read=False).count()
+    return {'unread_notifications_count': count}
+
+def load_user(user_id):
+    return load_cached_user(int(user_id))
+
+def log_audit(action, entity_type=None, entity_id=None, details=None):
+    log = AuditLog(
+        user_id=current_user.id if current_user.is_authenticated else None,
+        action=action,
+        entity_type=entity_type,
+        entity_id=entity_id,
+        details=details,
+        ip_address=request.remote_addr
+    )
+    db.session.add(log)
+
+def save_uploaded_file(file, folder):
+    """Save uploaded file with secure filename and return relative path"""
+    if file and file.filename:
+        filename = secure_filename(file.filename)
+        unique_filename = f"{uuid.uuid4().hex}_{filename}"
+        file_path = os.path.join(folder, unique_filename)
+        os.makedirs(folder, exist_ok=True)
+        file.save(file_path)
+        # Return path with forward slashes for web compatibility
+        return f"uploads/{os.path.basename(folder)}/{unique_filename}"
+    return None
+
+def generate_payment_schedule(credit):
+    from amortization import due_dates
+
+    if not credit.disbursement_date:
+        return
+
+    PaymentSchedule.query.filter_by(credit_id=credit.id).delete()
+
+    dates = due_dates(credit.disbursement_date, credit.duration_months)
+    db.session.add_all([PaymentSchedule(
+        credit_id=credit.id,
+        installment_number=i,
+        due_date=due_date,
+        expected_amount=credit.monthly_payment
+    ) for i, due_date in enumerate(dates, 1)])
 
-@app.route('/')
+@route('/')
 def index():
     if current_user.is_authenticated:
         return redirect(url_for('dashboard'))
     return redirect(url_for('login'))
 
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('dashboard'))
 
-    system_settings = SystemSettings.query.first()
+    system_settings = get_system_settings()
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
@@ -290,130 +327,27 @@ def login():
             flash('Nom d\'utilisateur ou mot de passe incorrect', 'danger')
     return render_template('login.html', form=form, system_settings=system_settings)
 
-@app.route('/logout')
+@route('/logout')
 @login_required
 def logout():
     logout_user()
     flash('Déconnexion réussie', 'info')
     return redirect(url_for('login'))
 
-@app.route('/dashboard')
+@route('/dashboard')
 @login_required
+@query_budget(20)
 def dashboard():
-    generate_payment_alerts()
-
-    system_settings = SystemSettings.query.first()
-    
-    from datetime import datetime, timedelta
-    from sqlalchemy import extract
-    
-    total_clients = Client.query.count()
-    total_credits = Credit.query.count()
-    active_credits = Credit.query.filter_by(status='active').count()
-    total_savings = SavingsAccount.query.count()
-    
-    total_credit_amount = db.session.query(func.sum(Credit.amount)).filter(Credit.status.in_(['active', 'approved', 'disbursed'])).scalar() or 0
-    total_credit_paid = db.session.query(func.sum(Credit.amount_paid)).filter(Credit.status.in_(['active', 'approved', 'disbursed'])).scalar() or 0
-    total_savings_balance = db.session.query(func.sum(SavingsAccount.balance)).filter_by(status='active').scalar() or 0
-    
-    recent_credits = Credit.query.order_by(Credit.application_date.desc()).limit(5).all()
-    recent_clients = Client.query.order_by(Client.created_at.desc()).limit(5).all()
-    
-    pending_credits = Credit.query.filter_by(status='pending').count()
-    approved_credits = Credit.query.filter_by(status='approved').count()
-    completed_credits = Credit.query.filter_by(status='completed').count()
-    rejected_credits = Credit.query.filter_by(status='rejected').count()
-    
-    credit_products = Product.query.filter_by(product_type='credit', active=True).count()
-    savings_products = Product.query.filter_by(product_type='savings', active=True).count()
-    
-    upcoming_due = PaymentSchedule.query.filter(
-        PaymentSchedule.due_date <= datetime.now().date() + timedelta(days=7),
-        PaymentSchedule.due_date >= datetime.now().date(),
-        PaymentSchedule.paid == False
-    ).count()
-    
-    overdue = PaymentSchedule.query.filter(
-        PaymentSchedule.due_date < datetime.now().date(),
-        PaymentSchedule.paid == False
-    ).count()
-    
-    thirty_days_ago = datetime.now() - timedelta(days=30)
-    new_clients_month = Client.query.filter(Client.created_at >= thirty_days_ago).count()
-    new_credits_month = Credit.query.filter(Credit.application_date >= thirty_days_ago).count()
-    
-    monthly_data = []
-    monthly_labels = []
-    for i in range(5, -1, -1):
-        month_date = datetime.now() - timedelta(days=30*i)
-        month_name = month_date.strftime('%B')
-        month_num = month_date.month
-        year = month_date.year
-        
-        credits_count = Credit.query.filter(
-            func.extract('month', Credit.application_date) == month_num,
-            func.extract('year', Credit.application_date) == year
-        ).count()
-
-        credits_amount = db.session.query(func.sum(Credit.amount)).filter(
-            func.extract('month', Credit.application_date) == month_num,
-            func.extract('year', Credit.application_date) == year
-        ).scalar() or 0
-
-        payments_amount = db.session.query(func.sum(CreditPayment.amount)).join(Credit).filter(
-            func.extract('month', CreditPayment.payment_date) == month_num,
-            func.extract('year', CreditPayment.payment_date) == year
-        ).scalar() or 0
-        
-        monthly_labels.append(month_name[:3])
-        monthly_data.append({
-            'credits_count': credits_count,
-            'credits_amount': float(credits_amount),
-            'payments_amount': float(payments_amount)
-        })
-    
-    total_payments = db.session.query(func.sum(CreditPayment.amount)).scalar() or 0
-    avg_credit_amount = db.session.query(func.avg(Credit.amount)).filter(Credit.status.in_(['active', 'approved', 'disbursed'])).scalar() or 0
-    avg_savings_balance = db.session.query(func.avg(SavingsAccount.balance)).filter_by(status='active').scalar() or 0
-    
-    repayment_rate = (total_credit_paid / total_credit_amount * 100) if total_credit_amount > 0 else 0
-    
-    risk_clients = Credit.query.filter(
-        Credit.status == 'active',
-        Credit.penalty_amount > 0
-    ).count()
+    system_settings = get_system_settings()
+    snapshot = get_dashboard_snapshot()
     
     return render_template('dashboard.html',
-                          total_clients=total_clients,
-                          total_credits=total_credits,
-                          active_credits=active_credits,
-                          total_savings=total_savings,
-                          total_credit_amount=total_credit_amount,
-                          total_credit_paid=total_credit_paid,
-                          total_savings_balance=total_savings_balance,
-                          recent_credits=recent_credits,
-                          recent_clients=recent_clients,
-                          pending_credits=pending_credits,
-                          approved_credits=approved_credits,
-                          completed_credits=completed_credits,
-                          rejected_credits=rejected_credits,
-                          credit_products=credit_products,
-                          savings_products=savings_products,
-                          upcoming_due=upcoming_due,
-                          overdue=overdue,
-                          new_clients_month=new_clients_month,
-                          new_credits_month=new_credits_month,
-                          monthly_labels=monthly_labels,
-                          monthly_data=monthly_data,
-                          total_payments=total_payments,
-                          avg_credit_amount=avg_credit_amount,
-                          avg_savings_balance=avg_savings_balance,
-                          repayment_rate=repayment_rate,
-                          risk_clients=risk_clients,
-                          system_settings=system_settings)
-
-@app.route('/clients')
+                          system_settings=system_settings,
+                          **snapshot.as_template_context())
+
+@route('/clients')
 @login_required
+@query_budget(5)
 def clients():
     search_query = request.args.get('search', '')
     filter_status = request.args.get('status', '')
@@ -421,31 +355,37 @@ def clients():
     query = Client.query
     
     if search_query:
-        search_pattern = f'%{search_query}%'
-        query = query.filter(
-            db.or_(
-                Client.first_name.ilike(search_pattern),
-                Client.last_name.ilike(search_pattern),
-                Client.client_id.ilike(search_pattern),
-                Client.email.ilike(search_pattern),
-                Client.phone.ilike(search_pattern)
-            )
-        )
+        condition = client_search_condition(search_query)
+        query = query.filter(condition if condition is not None else Client.id.is_(None))
     
-    clients_list = query.order_by(Client.created_at.desc()).all()
-    return render_template('clients.html', clients=clients_list, search_query=search_query)
+    page = keyset_paginate(query, Client.created_at, Client.id, after=request.args.get('after'), before=request.args.get('before'))
+    return render_template('clients.html', clients=page.items, page=page, search_query=search_query)
 
-@app.route('/clients/new', methods=['GET', 'POST'])
+@route('/clients/search')
+@login_required
+@query_budget(5)
+def search_clients_json():
+    limit = min(request.args.get('limit', current_app.config['SEARCH_RESULT_LIMIT'], type=int), 100)
+    results = search_clients(request.args.get('q', ''), limit=limit)
+    return jsonify([{
+        'id': client.id,
+        'client_id': client.client_id,
+        'name': client.full_name,
+        'phone': client.phone,
+        'url': url_for('client_detail', id=client.id)
+    } for client in results])
+
+@route('/clients/new', methods=['GET', 'POST'])
 @login_required
 def new_client():
     form = ClientForm()
     if form.validate_on_submit():
         # Handle file uploads
-        photo_path = save_uploaded_file(form.photo.data, app.config['CLIENT_PHOTOS_FOLDER'])
-        id_card_path = save_uploaded_file(form.id_card.data, app.config['CLIENT_ID_CARDS_FOLDER'])
+        photo_path = save_uploaded_file(form.photo.data, current_app.config['CLIENT_PHOTOS_FOLDER'])
+        id_card_path = save_uploaded_file(form.id_card.data, current_app.config['CLIENT_ID_CARDS_FOLDER'])
 
         client = Client(
-            client_id=generate_unique_id('CLT', Client, 'client_id'),
+            client_id=next_id('client'),
             first_name=form.first_name.data,
             last_name=form.last_name.data,
             email=form.email.data,
@@ -456,6 +396,8 @@ def new_client():
             photo_path=photo_path,
             id_card_path=id_card_path
         )
+        client.latitude = form.latitude.data
+        client.longitude = form.longitude.data
         db.session.add(client)
         log_audit('Client créé', 'Client', None, f'Client {client.full_name} créé')
         db.session.commit()
@@ -463,7 +405,7 @@ def new_client():
         return redirect(url_for('clients'))
     return render_template('client_form.html', form=form, title='Nouveau Client')
 
-@app.route('/clients/<int:id>/edit', methods=['GET', 'POST'])
+@route('/clients/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_client(id):
     client = Client.query.get_or_404(id)
@@ -471,12 +413,12 @@ def edit_client(id):
     if form.validate_on_submit():
         # Handle file uploads - only update if new files are provided
         if form.photo.data:
-            photo_path = save_uploaded_file(form.photo.data, app.config['CLIENT_PHOTOS_FOLDER'])
+            photo_path = save_uploaded_file(form.photo.data, current_app.config['CLIENT_PHOTOS_FOLDER'])
             if photo_path:
                 client.photo_path = photo_path
 
         if form.id_card.data:
-            id_card_path = save_uploaded_file(form.id_card.data, app.config['CLIENT_ID_CARDS_FOLDER'])
+            id_card_path = save_uploaded_file(form.id_card.data, current_app.config['CLIENT_ID_CARDS_FOLDER'])
             if id_card_path:
                 client.id_card_path = id_card_path
 
@@ -492,15 +434,18 @@ def edit_client(id):
         return redirect(url_for('client_detail', id=id))
     return render_template('client_form.html', form=form, title='Modifier Client', client=client)
 
-@app.route('/clients/<int:id>')
+@route('/clients/<int:id>')
 @login_required
+@query_budget(12)
 def client_detail(id):
-    client = Client.query.get_or_404(id)
+    # Checked first: get_client_score would store a score for a missing client
+    db.session.query(Client.id).filter_by(id=id).first_or_404()
+    score = get_client_score(id)
+    client = Client.query.options(*CLIENT_DETAIL).filter_by(id=id).first_or_404()
     interaction_form = ClientInteractionForm()
-    credit_score = calculate_client_credit_score(client)
-    return render_template('client_detail.html', client=client, interaction_form=interaction_form, credit_score=credit_score)
+    return render_template('client_detail.html', client=client, interaction_form=interaction_form, credit_score=score.score)
 
-@app.route('/clients/<int:id>/interaction', methods=['POST'])
+@route('/clients/<int:id>/interaction', methods=['POST'])
 @login_required
 def add_client_interaction(id):
     client = Client.query.get_or_404(id)
@@ -521,7 +466,7 @@ def add_client_interaction(id):
     
     return redirect(url_for('client_detail', id=id))
 
-@app.route('/clients/<int:id>/delete', methods=['POST'])
+@route('/clients/<int:id>/delete', methods=['POST'])
 @login_required
 def delete_client(id):
     if current_user.role != 'administrateur':
@@ -534,13 +479,13 @@ def delete_client(id):
     flash(f'Client {client.full_name} supprimé avec succès!', 'success')
     return redirect(url_for('clients'))
 
-@app.route('/products')
+@route('/products')
 @login_required
 def products():
     products_list = Product.query.order_by(Product.created_at.desc()).all()
     return render_template('products.html', products=products_list)
 
-@app.route('/products/new', methods=['GET', 'POST'])
+@route('/products/new', methods=['GET', 'POST'])
 @login_required
 def new_product():
     form = ProductForm()
@@ -562,7 +507,7 @@ def new_product():
         return redirect(url_for('products'))
     return render_template('product_form.html', form=form, title='Nouveau Produit')
 
-@app.route('/products/<int:id>/edit', methods=['GET', 'POST'])
+@route('/products/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_product(id):
     product = Product.query.get_or_404(id)
@@ -574,63 +519,52 @@ def edit_product(id):
         return redirect(url_for('products'))
     return render_template('product_form.html', form=form, title='Modifier Produit', product=product)
 
-@app.route('/credits')
+@route('/credits')
 @login_required
+@query_budget(5)
 def credits():
     search_query = request.args.get('search', '')
     status_filter = request.args.get('status', '')
     
-    query = Credit.query.join(Client)
+    query = Credit.query
     
     if search_query:
-        search_pattern = f'%{search_query}%'
-        query = query.filter(
-            db.or_(
-                Credit.credit_number.ilike(search_pattern),
-                Client.first_name.ilike(search_pattern),
-                Client.last_name.ilike(search_pattern),
-                Client.client_id.ilike(search_pattern)
-            )
-        )
+        query = query.filter(credit_search_condition(search_query))
     
     if status_filter:
         query = query.filter(Credit.status == status_filter)
     
-    credits_list = query.order_by(Credit.application_date.desc()).all()
-    return render_template('credits.html', credits=credits_list, search_query=search_query, status_filter=status_filter)
+    query = query.options(*CREDIT_ROW)
+    page = keyset_paginate(query, Credit.application_date, Credit.id, after=request.args.get('after'), before=request.args.get('before'))
+    return render_template('credits.html', credits=page.items, page=page, search_query=search_query, status_filter=status_filter)
 
-@app.route('/credits/new', methods=['GET', 'POST'])
+@route('/credits/new', methods=['GET', 'POST'])
 @login_required
 def new_credit():
+    from amortization import simulate
+
     form = CreditForm()
     form.client_id.choices = [(c.id, c.full_name) for c in Client.query.order_by(Client.last_name).all()]
-    form.product_id.choices = [(p.id, p.name) for p in Product.query.filter_by(product_type='credit', active=True).all()]
+    form.product_id.choices = [(p.id, p.name) for p in active_products('credit')]
     
     if form.validate_on_submit():
+        credit_score = get_client_score(form.client_id.data).score
         client = Client.query.get(form.client_id.data)
-        credit_score = calculate_client_credit_score(client)
         
         product = Product.query.get(form.product_id.data)
         amount = form.amount.data
         duration = form.duration_months.data
-        rate = product.interest_rate / 100 / 12
-        
-        if rate > 0:
-            monthly_payment = (amount * rate * (1 + rate)**duration) / ((1 + rate)**duration - 1)
-        else:
-            monthly_payment = amount / duration
-        
-        total_amount = monthly_payment * duration
+        terms = simulate(amount, product.interest_rate, duration)
         
         credit = Credit(
-            credit_number=generate_unique_id('CRD', Credit, 'credit_number'),
+            credit_number=next_id('credit'),
             client_id=form.client_id.data,
             product_id=form.product_id.data,
             amount=amount,
             interest_rate=product.interest_rate,
             duration_months=duration,
-            monthly_payment=round(monthly_payment, 2),
-            total_amount=round(total_amount, 2),
+            monthly_payment=terms['monthly_payment'],
+            total_amount=terms['total_amount'],
             notes=form.notes.data,
             credit_score=credit_score,
             status='pending'
@@ -643,21 +577,15 @@ def new_credit():
     
     return render_template('credit_form.html', form=form, title='Nouvelle Demande de Crédit')
 
-@app.route('/credits/<int:id>')
+@route('/credits/<int:id>')
 @login_required
+@query_budget(12)
 def credit_detail(id):
-    credit = Credit.query.get_or_404(id)
+    credit = Credit.query.options(*CREDIT_DETAIL).filter_by(id=id).first_or_404()
     payment_form = CreditPaymentForm()
-    
-    if credit.status == 'active':
-        penalty = calculate_penalties(credit)
-        if penalty != credit.penalty_amount:
-            credit.penalty_amount = penalty
-            db.session.commit()
-    
     return render_template('credit_detail.html', credit=credit, payment_form=payment_form)
 
-@app.route('/credits/<int:id>/approve', methods=['POST'])
+@route('/credits/<int:id>/approve', methods=['POST'])
 @login_required
 def approve_credit(id):
     if current_user.role not in ['administrateur', 'gestionnaire']:
@@ -671,7 +599,7 @@ def approve_credit(id):
     flash(f'Crédit {credit.credit_number} approuvé avec succès!', 'success')
     return redirect(url_for('credit_detail', id=id))
 
-@app.route('/credits/<int:id>/disburse', methods=['POST'])
+@route('/credits/<int:id>/disburse', methods=['POST'])
 @login_required
 def disburse_credit(id):
     if current_user.role not in ['administrateur', 'gestionnaire']:
@@ -688,7 +616,28 @@ def disburse_credit(id):
         flash(f'Crédit {credit.credit_number} décaissé avec succès!', 'success')
     return redirect(url_for('credit_detail', id=id))
 
-@app.route('/credits/<int:id>/payment', methods=['POST'])
+@route('/credits/disburse-batch', methods=['POST'])
+@login_required
+def disburse_credits_batch():
+    from disbursement import disburse_credits
+
+    if current_user.role not in ['administrateur', 'gestionnaire']:
+        flash('Accès non autorisé', 'danger')
+        return redirect(url_for('credits'))
+    
+    batch = disburse_credits(request.form.getlist('credit_ids', type=int), approve=request.form.get('approve') == '1')
+    if not batch.ok:
+        db.session.rollback()
+        flash('Décaissement groupé refusé: ' + '; '.join(batch.errors[:10]), 'danger')
+        return redirect(request.referrer or url_for('credits'))
+    
+    log_audit('Décaissement groupé', 'Credit', None,
+              f'{len(batch.credit_numbers)} crédit(s) décaissé(s), {batch.installments} échéance(s): ' + ', '.join(batch.credit_numbers))
+    db.session.commit()
+    flash(f'{len(batch.credit_numbers)} crédit(s) décaissé(s) avec succès!', 'success')
+    return redirect(url_for('credits', status='active'))
+
+@route('/credits/<int:id>/payment', methods=['POST'])
 @login_required
 def add_credit_payment(id):
     credit = Credit.query.get_or_404(id)
@@ -713,56 +662,151 @@ def add_credit_payment(id):
     
     return redirect(url_for('credit_detail', id=id))
 
-@app.route('/loan-simulation', methods=['GET', 'POST'])
+SETTLEMENT_LINES_SHOWN = 500
+
+@route('/settlements')
+@login_required
+@query_budget(4)
+def settlements():
+    if current_user.role not in ['administrateur', 'gestionnaire']:
+        flash('Accès non autorisé', 'danger')
+        return redirect(url_for('dashboard'))
+
+    query = SettlementFile.query.options(joinedload(SettlementFile.creator))
+    page = keyset_paginate(query, SettlementFile.created_at, SettlementFile.id, after=request.args.get('after'), before=request.args.get('before'))
+    return render_template('settlements.html', files=page.items, page=page, form=SettlementFileForm())
+
+@route('/settlements/post', methods=['POST'])
+@login_required
+def post_settlement():
+    from client_import import ImportFileError
+    from settlements import post_settlement_file
+
+    if current_user.role not in ['administrateur', 'gestionnaire']:
+        flash('Accès non autorisé', 'danger')
+        return redirect(url_for('dashboard'))
+
+    form = SettlementFileForm()
+    if not form.validate_on_submit():
+        for errors in form.errors.values():
+            flash(errors[0], 'danger')
+        return redirect(url_for('settlements'))
+
+    upload = form.settlement_file.data
+    file_name = os.path.basename(upload.filename)
+    handle, path = tempfile.mkstemp(suffix=os.path.splitext(file_name)[1].lower())
+    os.close(handle)
+    try:
+        upload.save(path)
+        result = post_settlement_file(path, form.provider.data, current_user.id, file_name=file_name)
+    except ImportFileError as error:
+        flash(f'Relevé refusé: {error}', 'danger')
+        return redirect(url_for('settlements'))
+    finally:
+        os.remove(path)
+
+    record = result.record
+    flash(f'{record.lines_posted} paiement(s) enregistré(s), {record.credits_completed} crédit(s) soldé(s), '
+          f'{record.lines_unmatched} ligne(s) non rapprochée(s)', 'warning' if record.lines_unmatched else 'success')
+    return redirect(url_for('settlement_detail', id=record.id))
+
+@route('/settlements/<int:id>')
+@login_required
+@query_budget(5)
+def settlement_detail(id):
+    if current_user.role not in ['administrateur', 'gestionnaire']:
+        flash('Accès non autorisé', 'danger')
+        return redirect(url_for('dashboard'))
+
+    record = SettlementFile.query.get_or_404(id)
+    lines = SettlementLine.query.filter_by(settlement_file_id=id).order_by(SettlementLine.line_number).limit(SETTLEMENT_LINES_SHOWN).all()
+    return render_template('settlement_detail.html', record=record, lines=lines)
+
+@route('/loan-simulation', methods=['GET', 'POST'])
 @login_required
 def loan_simulation():
+    from amortization import simulate, comparison_grid, amortization_rows, DEFAULT_GRID_DURATIONS, MAX_DURATION
+
     form = LoanSimulationForm()
-    form.product_id.choices = [(p.id, p.name) for p in Product.query.filter_by(product_type='credit', active=True).all()]
+    products = active_products('credit')
+    form.product_id.choices = [(p.id, p.name) for p in products]
     
     simulation_result = None
+    schedule = None
+    grid = None
+    grid_durations = None
     if form.validate_on_submit():
         product = Product.query.get(form.product_id.data)
         amount = form.amount.data
         duration = form.duration_months.data
-        rate = product.interest_rate / 100 / 12
-        
-        if rate > 0:
-            monthly_payment = (amount * rate * (1 + rate)**duration) / ((1 + rate)**duration - 1)
-        else:
-            monthly_payment = amount / duration
-        
-        total_amount = monthly_payment * duration
-        total_interest = total_amount - amount
+        min_duration = product.min_duration or 1
+        max_duration = min(product.max_duration or MAX_DURATION, MAX_DURATION)
+        if not min_duration <= duration <= max_duration:
+            flash(f'La durée doit être comprise entre {min_duration} et {max_duration} mois pour ce produit', 'danger')
+            return render_template('loan_simulation.html', form=form, simulation=None, schedule=None, grid=None, grid_durations=None)
+        terms = simulate(amount, product.interest_rate, duration)
         
         simulation_result = {
             'product_name': product.name,
             'amount': amount,
             'duration': duration,
             'interest_rate': product.interest_rate,
-            'monthly_payment': round(monthly_payment, 2),
-            'total_amount': round(total_amount, 2),
-            'total_interest': round(total_interest, 2)
+            'monthly_payment': terms['monthly_payment'],
+            'total_amount': terms['total_amount'],
+            'total_interest': terms['total_interest']
         }
+        schedule = amortization_rows(amount, product.interest_rate, duration)
+        grid_durations = sorted(set(DEFAULT_GRID_DURATIONS) | {duration})
+        grid = comparison_grid(amount, products, grid_durations)
     
-    return render_template('loan_simulation.html', form=form, simulation=simulation_result)
+    return render_template('loan_simulation.html', form=form, simulation=simulation_result, schedule=schedule, grid=grid, grid_durations=grid_durations)
 
-@app.route('/savings')
+@route('/loan-simulation/grid')
 @login_required
+def loan_simulation_grid():
+    """Comparison grid as JSON: ?amount=...&durations=6,12,24 (every active credit product).
+
+    Several ``amount`` values may be given to price a whole batch at once,
+    up to MAX_GRID_AMOUNTS amounts and MAX_GRID_DURATIONS durations.
+    """
+    from amortization import comparison_grid, duration_limits, DEFAULT_GRID_DURATIONS, MAX_GRID_AMOUNTS, MAX_GRID_DURATIONS
+
+    try:
+        amounts = [float(a) for a in request.args.getlist('amount')]
+        durations = [int(d) for d in request.args.get('durations', '').split(',') if d.strip()] or list(DEFAULT_GRID_DURATIONS)
+    except ValueError:
+        return jsonify({'error': 'Paramètres invalides'}), 400
+    if not amounts or any(not math.isfinite(a) or a <= 0 for a in amounts):
+        return jsonify({'error': 'Paramètres invalides'}), 400
+    if len(amounts) > MAX_GRID_AMOUNTS or len(durations) > MAX_GRID_DURATIONS:
+        return jsonify({'error': f'Au plus {MAX_GRID_AMOUNTS} montants et {MAX_GRID_DURATIONS} durées'}), 400
+    products = active_products('credit')
+    min_duration, max_duration = duration_limits(products)
+    if any(not min_duration <= d <= max_duration for d in durations):
+        return jsonify({'error': f'Durées autorisées : de {min_duration} à {max_duration} mois'}), 400
+    return jsonify({
+        'durations': durations,
+        'results': [{'amount': amount, 'products': comparison_grid(amount, products, durations)} for amount in amounts]
+    })
+
+@route('/savings')
+@login_required
+@query_budget(5)
 def savings():
-    savings_list = SavingsAccount.query.order_by(SavingsAccount.opening_date.desc()).all()
-    return render_template('savings.html', savings=savings_list)
+    page = keyset_paginate(SavingsAccount.query.options(*SAVINGS_ROW), SavingsAccount.opening_date, SavingsAccount.id, after=request.args.get('after'), before=request.args.get('before'))
+    return render_template('savings.html', savings=page.items, page=page)
 
-@app.route('/savings/new', methods=['GET', 'POST'])
+@route('/savings/new', methods=['GET', 'POST'])
 @login_required
 def new_savings():
     form = SavingsAccountForm()
     form.client_id.choices = [(c.id, c.full_name) for c in Client.query.order_by(Client.last_name).all()]
-    form.product_id.choices = [(p.id, p.name) for p in Product.query.filter_by(product_type='savings', active=True).all()]
+    form.product_id.choices = [(p.id, p.name) for p in active_products('savings')]
     
     if form.validate_on_submit():
         product = Product.query.get(form.product_id.data)
         account = SavingsAccount(
-            account_number=generate_unique_id('SAV', SavingsAccount, 'account_number'),
+            account_number=next_id('savings'),
             client_id=form.client_id.data,
             product_id=form.product_id.data,
             interest_rate=product.interest_rate,
@@ -786,14 +830,26 @@ def new_savings():
     
     return render_template('savings_form.html', form=form, title='Nouveau Compte d\'Épargne')
 
-@app.route('/savings/<int:id>')
+@route('/savings/<int:id>')
 @login_required
+@query_budget(7)
 def savings_detail(id):
-    account = SavingsAccount.query.get_or_404(id)
+    account = SavingsAccount.query.options(*SAVINGS_DETAIL).filter_by(id=id).first_or_404()
     transaction_form = SavingsTransactionForm()
-    return render_template('savings_detail.html', account=account, transaction_form=transaction_form)
+    open_payments = MobilePayment.query.filter(
+        MobilePayment.account_id == id,
+        MobilePayment.status.in_(['pending', 'processing'])
+    ).order_by(MobilePayment.created_at).all()
+    return render_template('savings_detail.html', account=account, transaction_form=transaction_form, open_payments=open_payments)
 
-@app.route('/savings/<int:id>/close', methods=['POST'])
+@route('/savings/payments/<int:payment_id>')
+@login_required
+@query_budget(4)
+def mobile_payment_status(payment_id):
+    payment = MobilePayment.query.options(joinedload(MobilePayment.account)).filter_by(id=payment_id).first_or_404()
+    return jsonify(payment_status(payment))
+
+@route('/savings/<int:id>/close', methods=['POST'])
 @login_required
 def close_savings_account(id):
     if current_user.role not in ['administrateur', 'gestionnaire']:
@@ -813,21 +869,40 @@ def close_savings_account(id):
     flash(f'Compte d\'épargne {account.account_number} clôturé avec succès!', 'success')
     return redirect(url_for('savings'))
 
-@app.route('/savings/<int:id>/apply-interest', methods=['POST'])
+@route('/savings/<int:id>/apply-interest', methods=['POST'])
 @login_required
 def apply_interest(id):
+    from interest import accrue_interest
+
     if current_user.role not in ['administrateur', 'gestionnaire']:
         flash('Accès non autorisé', 'danger')
         return redirect(url_for('savings'))
     
     account = SavingsAccount.query.get_or_404(id)
-    apply_savings_interest(account)
+    accrue_interest(account_ids=[account.id])
     log_audit('Intérêts d\'épargne appliqués', 'SavingsAccount', account.id, f'Intérêts calculés pour le compte {account.account_number}')
     db.session.commit()
     flash(f'Intérêts appliqués au compte {account.account_number}!', 'success')
     return redirect(url_for('savings_detail', id=id))
 
-@app.route('/savings/<int:id>/transaction', methods=['POST'])
+@route('/savings/apply-interest', methods=['POST'])
+@login_required
+def apply_interest_all():
+    from interest import accrue_interest
+
+    if current_user.role != 'administrateur':
+        flash('Accès non autorisé', 'danger')
+        return redirect(url_for('savings'))
+    
+    result = accrue_interest()
+    log_audit('Intérêts d\'épargne appliqués', 'SavingsAccount', None,
+              f'{result.accounts_credited}/{result.accounts_scanned} compte(s) crédité(s), total {result.total_interest:.2f} ({result.method})')
+    db.session.commit()
+    flash(f'Intérêts appliqués à {result.accounts_credited} compte(s) sur {result.accounts_scanned} en {result.elapsed:.2f}s '
+          f'({result.accounts_per_second:.0f} comptes/s)', 'success')
+    return redirect(url_for('savings'))
+
+@route('/savings/<int:id>/transaction', methods=['POST'])
 @login_required
 def add_savings_transaction(id):
     account = SavingsAccount.query.get_or_404(id)
@@ -838,18 +913,19 @@ def add_savings_transaction(id):
         transaction_type = form.transaction_type.data
         payment_method = form.payment_method.data
 
-        # Simulate transaction processing based on payment method
-        if payment_method in ['wave', 'orange_money']:
-            # Simulate mobile money transaction
-            import time
-            flash(f'Traitement de la transaction {payment_method.upper()} en cours...', 'info')
-            time.sleep(2)  # Simulate processing delay
-            # In real implementation, this would integrate with actual APIs
-
         if transaction_type == 'withdrawal' and amount > account.balance:
             flash('Solde insuffisant pour ce retrait', 'danger')
             return redirect(url_for('savings_detail', id=id))
 
+        # Mobile money is confirmed asynchronously by the payment worker
+        if payment_method in MOBILE_MONEY_METHODS:
+            payment = create_mobile_payment(account, transaction_type, amount, payment_method,
+                                            form.reference.data, form.notes.data, current_user.id)
+            db.session.commit()
+            notify_payment_worker()
+            flash(f'Transaction {payment_method.upper()} de {amount} FCFA en attente de confirmation par l\'opérateur', 'info')
+            return redirect(url_for('savings_detail', id=id))
+
         if transaction_type == 'deposit':
             account.balance += amount
         else:
@@ -880,11 +956,12 @@ def add_savings_transaction(id):
 
     return redirect(url_for('savings_detail', id=id))
 
-@app.route('/analytics')
+@route('/analytics')
 @login_required
+@query_budget(25)
+@read_replica
 def analytics():
     from datetime import datetime, timedelta
-    from sqlalchemy import extract
     
     today = datetime.now().date()
     current_month = datetime.now().month
@@ -905,50 +982,33 @@ def analytics():
     total_outstanding = total_disbursed - total_recovered
     recovery_rate = (total_recovered / total_disbursed * 100) if total_disbursed > 0 else 0
     
-    credits_by_month = []
-    payments_by_month = []
-    month_labels = []
-    
-    for i in range(11, -1, -1):
-        month_date = datetime.now() - timedelta(days=30*i)
-        month_name = month_date.strftime('%b %Y')
-        month_num = month_date.month
-        year = month_date.year
-        
-        month_credits = db.session.query(func.sum(Credit.amount)).filter(
-            func.extract('month', Credit.application_date) == month_num,
-            func.extract('year', Credit.application_date) == year
-        ).scalar() or 0
-
-        month_payments = db.session.query(func.sum(CreditPayment.amount)).join(Credit).filter(
-            func.extract('month', CreditPayment.payment_date) == month_num,
-            func.extract('year', CreditPayment.payment_date) == year
-        ).scalar() or 0
-        
-        month_labels.append(month_name)
-        credits_by_month.append(float(month_credits))
-        payments_by_month.append(float(month_payments))
+    rollup = monthly_rollup(12)
+    month_labels = [bucket['month'].strftime('%b %Y') for bucket in rollup]
+    credits_by_month = [bucket['credits_amount'] for bucket in rollup]
+    payments_by_month = [bucket['payments_amount'] for bucket in rollup]
     
     avg_last_3_months = sum(credits_by_month[-3:]) / 3 if len(credits_by_month) >= 3 else 0
     projected_next_month = avg_last_3_months
     
+    segments = db.session.query(
+        func.sum(case((ClientSummary.active_credits > 0, 1), else_=0)),
+        func.sum(case((ClientSummary.completed_credits > 0, 1), else_=0)),
+        func.sum(case((ClientSummary.total_credits == 0, 1), else_=0))
+    ).one()
     clients_by_status = {
-        'active': Client.query.join(Credit).filter(Credit.status == 'active').distinct().count(),
-        'completed': Client.query.join(Credit).filter(Credit.status == 'completed').distinct().count(),
-        'no_credit': Client.query.outerjoin(Credit).group_by(Client.id).having(func.count(Credit.id) == 0).count()
+        'active': int(segments[0] or 0),
+        'completed': int(segments[1] or 0),
+        'no_credit': int(segments[2] or 0)
     }
     
     top_clients = db.session.query(
         Client,
-        func.count(Credit.id).label('credit_count'),
-        func.sum(Credit.amount).label('total_amount')
-    ).join(Credit).group_by(Client.id).order_by(func.sum(Credit.amount).desc()).limit(10).all()
+        ClientSummary.total_credits,
+        ClientSummary.total_borrowed
+    ).join(ClientSummary, ClientSummary.client_id == Client.id).order_by(ClientSummary.total_borrowed.desc()).limit(10).all()
     
-    overdue_credits = Credit.query.join(PaymentSchedule).filter(
-        Credit.status == 'active',
-        PaymentSchedule.paid == False,
-        PaymentSchedule.due_date < today
-    ).distinct().count()
+    par = portfolio_at_risk(today)
+    overdue_credits = par.at_risk_credits
     
     total_penalties = db.session.query(func.sum(Credit.penalty_amount)).filter(
         Credit.status == 'active'
@@ -983,47 +1043,40 @@ def analytics():
                          clients_by_status=clients_by_status,
                          top_clients=top_clients,
                          overdue_credits=overdue_credits,
+                         par=par,
                          total_penalties=total_penalties,
                          portfolio_quality=portfolio_quality,
                          products_performance=products_performance)
 
-@app.route('/map')
+@route('/map')
 @login_required
+@query_budget(3)
 def client_map():
-    clients = Client.query.all()
-    
-    clients_data = []
-    import random
-    base_lat = 5.3600
-    base_lng = -4.0083
-    
-    for client in clients:
-        lat_offset = random.uniform(-0.5, 0.5)
-        lng_offset = random.uniform(-0.5, 0.5)
-        
-        active_credits = Credit.query.filter_by(client_id=client.id, status='active').count()
-        total_amount = db.session.query(func.sum(Credit.amount)).filter_by(client_id=client.id).scalar() or 0
-        
-        status_color = 'green' if active_credits == 0 else 'blue' if active_credits == 1 else 'orange'
-        
-        clients_data.append({
-            'id': client.id,
-            'name': client.full_name,
-            'client_id': client.client_id,
-            'address': client.address or 'Adresse non renseignée',
-            'phone': client.phone or 'N/A',
-            'email': client.email or 'N/A',
-            'lat': base_lat + lat_offset,
-            'lng': base_lng + lng_offset,
-            'active_credits': active_credits,
-            'total_amount': float(total_amount),
-            'color': status_color
-        })
-    
-    return render_template('map.html', clients_data=clients_data)
-
-@app.route('/reports')
+    bounds = located_bounds()
+    return render_template('map.html', bounds=list(bounds) if bounds else None, default_center=DEFAULT_CENTER)
+
+@route('/map/clients')
+@login_required
+@query_budget(4)
+def client_map_data():
+    """Clients (or clusters) inside ?south=&west=&north=&east= at ?zoom=, optionally ?colors=green,blue."""
+    try:
+        south = max(-90.0, float(request.args['south']))
+        north = min(90.0, float(request.args['north']))
+        west = max(-180.0, float(request.args['west']))
+        east = min(180.0, float(request.args['east']))
+        zoom = int(request.args.get('zoom', 11))
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Paramètres invalides'}), 400
+    if south > north or west > east:
+        return jsonify({'error': 'Paramètres invalides'}), 400
+    colors = [color for color in request.args.get('colors', '').split(',') if color in MAP_COLORS]
+    return jsonify(viewport((south, west, north, east), zoom, colors))
+
+@route('/reports')
 @login_required
+@query_budget(20)
+@read_replica
 def reports():
     total_clients = Client.query.count()
     total_active_credits = Credit.query.filter_by(status='active').count()
@@ -1047,18 +1100,15 @@ def reports():
     total_savings_accounts = SavingsAccount.query.filter_by(status='active').count()
     total_savings_balance = db.session.query(func.sum(SavingsAccount.balance)).filter_by(status='active').scalar() or 0
     
-    credits_at_risk = Credit.query.filter_by(status='active').all()
-    at_risk_count = sum(1 for c in credits_at_risk if len(c.overdue_installments) > 0)
+    par = portfolio_at_risk()
+    at_risk_count = par.at_risk_credits
     
-    recent_audits = AuditLog.query.order_by(AuditLog.timestamp.desc()).limit(20).all()
+    recent_audits = AuditLog.query.options(*AUDIT_ROW).order_by(AuditLog.timestamp.desc()).limit(20).all()
     
-    monthly_stats = db.session.query(
-        func.date_format(Credit.application_date, '%Y-%m-01').label('month'),
-        func.count(Credit.id).label('count'),
-        func.sum(Credit.amount).label('total')
-    ).filter(
-        Credit.application_date >= datetime.utcnow() - relativedelta(months=12)
-    ).group_by(func.date_format(Credit.application_date, '%Y-%m-01')).order_by(func.date_format(Credit.application_date, '%Y-%m-01')).all()
+    monthly_stats = [
+        {'month': bucket['month'], 'count': bucket['credits_count'], 'total': bucket['credits_amount']}
+        for bucket in monthly_rollup(12)
+    ]
     
     return render_template('reports.html',
                          total_clients=total_clients,
@@ -1072,16 +1122,25 @@ def reports():
                          total_savings_accounts=total_savings_accounts,
                          total_savings_balance=total_savings_balance,
                          at_risk_count=at_risk_count,
+                         par=par,
                          recent_audits=recent_audits,
                          monthly_stats=monthly_stats)
 
-@app.route('/settings', methods=['GET', 'POST'])
+@route('/admin/metrics')
+@query_budget(2)
+def metrics():
+    """Per-endpoint timings and SQL counts of this worker, in the Prometheus text format."""
+    if not metrics_authorized():
+        return Response('Accès non autorisé\n', status=403, mimetype='text/plain')
+    return Response(render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+@route('/settings', methods=['GET', 'POST'])
 @login_required
 def settings():
     profile_form = ProfileForm(obj=current_user)
     password_form = ChangePasswordForm()
 
-    system_settings = SystemSettings.query.first()
+    system_settings = get_system_settings()
     if not system_settings:
         system_settings = SystemSettings()
         db.session.add(system_settings)
@@ -1130,9 +1189,11 @@ def settings():
                          password_form=password_form,
                          settings_form=settings_form,
                          users=users,
+                         user_cache=user_cache_stats() if current_user.role == 'administrateur' else None,
+                         db_pools=pool_stats() if current_user.role == 'administrateur' else None,
                          unread_notifications=unread_notifications)
 
-@app.route('/users/new', methods=['GET', 'POST'])
+@route('/users/new', methods=['GET', 'POST'])
 @login_required
 def new_user():
     if current_user.role != 'administrateur':
@@ -1155,7 +1216,7 @@ def new_user():
             return redirect(url_for('settings'))
     return render_template('user_form.html', form=form, title='Nouvel Utilisateur')
 
-@app.route('/users/<int:id>/edit', methods=['GET', 'POST'])
+@route('/users/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_user(id):
     if current_user.role != 'administrateur':
@@ -1182,7 +1243,7 @@ def edit_user(id):
     
     return render_template('user_form.html', form=form, title='Modifier Utilisateur', user=user)
 
-@app.route('/users/<int:id>/delete', methods=['POST'])
+@route('/users/<int:id>/delete', methods=['POST'])
 @login_required
 def delete_user(id):
     if current_user.role != 'administrateur':
@@ -1201,109 +1262,42 @@ def delete_user(id):
     flash(f'Utilisateur {username} supprimé avec succès!', 'success')
     return redirect(url_for('settings'))
 
-@app.route('/export/clients')
+@route('/export/clients')
 @login_required
+@query_budget(4)
 def export_clients():
-    import csv
-    from io import StringIO
-    from flask import make_response
-    
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['ID Client', 'Prénom', 'Nom', 'Email', 'Téléphone', 'Date de naissance', 'Date de création'])
-    
-    clients = Client.query.all()
-    for client in clients:
-        writer.writerow([
-            client.client_id,
-            client.first_name,
-            client.last_name,
-            client.email or '',
-            client.phone or '',
-            client.date_of_birth.strftime('%Y-%m-%d') if client.date_of_birth else '',
-            client.created_at.strftime('%Y-%m-%d %H:%M')
-        ])
-    
-    output.seek(0)
-    response = make_response(output.getvalue())
-    response.headers['Content-Disposition'] = 'attachment; filename=clients_export.csv'
-    response.headers['Content-Type'] = 'text/csv'
-    log_audit('Export clients', 'Client', None, f'{len(clients)} clients exportés')
-    return response
-
-@app.route('/export/credits')
+    filters = ExportFilters.from_request()
+    log_audit('Export clients', 'Client', None, f'Export clients ({filters.describe()})')
+    db.session.commit()
+    return csv_response('clients_export.csv', CLIENT_HEADER, client_rows(filters), compress=wants_gzip())
+
+@route('/export/credits')
 @login_required
+@query_budget(4)
 def export_credits():
-    import csv
-    from io import StringIO
-    from flask import make_response
-    
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Numéro', 'Client', 'Produit', 'Montant', 'Taux', 'Durée', 'Paiement Mensuel', 'Montant Total', 'Montant Payé', 'Solde', 'Statut', 'Date Demande'])
-    
-    credits = Credit.query.all()
-    for credit in credits:
-        writer.writerow([
-            credit.credit_number,
-            credit.client.full_name,
-            credit.product.name,
-            credit.amount,
-            credit.interest_rate,
-            credit.duration_months,
-            credit.monthly_payment,
-            credit.total_amount,
-            credit.amount_paid,
-            credit.balance,
-            credit.status,
-            credit.application_date.strftime('%Y-%m-%d')
-        ])
-    
-    output.seek(0)
-    response = make_response(output.getvalue())
-    response.headers['Content-Disposition'] = 'attachment; filename=credits_export.csv'
-    response.headers['Content-Type'] = 'text/csv'
-    log_audit('Export crédits', 'Credit', None, f'{len(credits)} crédits exportés')
-    return response
-
-@app.route('/export/savings')
+    filters = ExportFilters.from_request()
+    log_audit('Export crédits', 'Credit', None, f'Export crédits ({filters.describe()})')
+    db.session.commit()
+    return csv_response('credits_export.csv', CREDIT_HEADER, credit_rows(filters), compress=wants_gzip())
+
+@route('/export/savings')
 @login_required
+@query_budget(4)
 def export_savings():
-    import csv
-    from io import StringIO
-    from flask import make_response
-    
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Numéro Compte', 'Client', 'Produit', 'Solde', 'Taux d\'intérêt', 'Statut', 'Date Ouverture'])
-    
-    accounts = SavingsAccount.query.all()
-    for account in accounts:
-        writer.writerow([
-            account.account_number,
-            account.client.full_name,
-            account.product.name,
-            account.balance,
-            account.interest_rate,
-            account.status,
-            account.opening_date.strftime('%Y-%m-%d')
-        ])
-    
-    output.seek(0)
-    response = make_response(output.getvalue())
-    response.headers['Content-Disposition'] = 'attachment; filename=savings_export.csv'
-    response.headers['Content-Type'] = 'text/csv'
-    log_audit('Export épargne', 'SavingsAccount', None, f'{len(accounts)} comptes exportés')
-    return response
-
-@app.route('/notifications')
+    filters = ExportFilters.from_request()
+    log_audit('Export épargne', 'SavingsAccount', None, f'Export comptes d\'épargne ({filters.describe()})')
+    db.session.commit()
+    return csv_response('savings_export.csv', SAVINGS_HEADER, savings_rows(filters), compress=wants_gzip())
+
+@route('/notifications')
 @login_required
+@query_budget(5)
 def notifications():
     page = request.args.get('page', 1, type=int)
     notifications = Notification.query.filter_by(user_id=current_user.id).order_by(Notification.created_at.desc()).paginate(page=page, per_page=20, error_out=False)
     return render_template('notifications.html', notifications=notifications)
 
-@app.route('/notifications/<int:id>/read', methods=['POST'])
+@route('/notifications/<int:id>/read', methods=['POST'])
 @login_required
 def mark_notification_read(id):
     notification = Notification.query.get_or_404(id)
@@ -1315,7 +1309,7 @@ def mark_notification_read(id):
     db.session.commit()
     return redirect(url_for('notifications'))
 
-@app.route('/notifications/mark-all-read', methods=['POST'])
+@route('/notifications/mark-all-read', methods=['POST'])
 @login_required
 def mark_all_notifications_read():
     Notification.query.filter_by(user_id=current_user.id, is_read=False).update({'is_read': True})
@@ -1323,21 +1317,24 @@ def mark_all_notifications_read():
     flash('Toutes les notifications ont été marquées comme lues', 'success')
     return redirect(url_for('notifications'))
 
-@app.route('/clients/<int:id>/credit-history')
+@route('/clients/<int:id>/credit-history')
 @login_required
+@query_budget(12)
 def client_credit_history(id):
+    db.session.query(Client.id).filter_by(id=id).first_or_404()
+    score = get_client_score(id)
     client = Client.query.get_or_404(id)
-    credits = Credit.query.filter_by(client_id=id).order_by(Credit.application_date.desc()).all()
+    summary = get_client_summary(id)
+    credits = Credit.query.options(*CREDIT_HISTORY_ROW).filter_by(client_id=id).order_by(Credit.application_date.desc()).all()
     
-    total_borrowed = sum(c.amount for c in credits if c.status in ['active', 'completed'])
-    total_repaid = sum(c.amount_paid for c in credits)
-    current_debt = sum(c.balance for c in credits if c.status == 'active')
+    total_borrowed = summary.total_borrowed
+    total_repaid = summary.total_repaid
+    current_debt = summary.current_debt
     
     completed_on_time = sum(1 for c in credits if c.status == 'completed' and len(c.overdue_installments) == 0)
     total_completed = sum(1 for c in credits if c.status == 'completed')
     
     on_time_rate = (completed_on_time / total_completed * 100) if total_completed > 0 else 100
-    credit_score = calculate_client_credit_score(client)
     
     return render_template('client_credit_history.html', 
                          client=client,
@@ -1346,13 +1343,19 @@ def client_credit_history(id):
                          total_repaid=total_repaid,
                          current_debt=current_debt,
                          on_time_rate=on_time_rate,
-                         credit_score=credit_score)
+                         credit_score=score.score,
+                         score=score)
 
-@app.template_filter('currency')
 def currency_filter(value):
     if value is None:
         value = 0
     return f"{value:,.2f} FCFA"
 
 if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        setup_database()
+    # With the reloader, only the serving child process runs the jobs
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_workers(app)
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,214 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func, select
+from models import db, User, Client, Credit, CreditPayment, PaymentSchedule, SavingsAccount, SavingsTransaction
+from par import portfolio_at_risk
+from query_budget import count_queries
+from scoring import get_client_score, invalidate_client_scores
+from snapshot import compute_dashboard_snapshot
+
+# Name -> URL, fetched by a logged-in administrator
+ROUTES = {
+    'dashboard': '/dashboard',
+    'analytics': '/analytics',
+    'reports': '/reports',
+    'credits': '/credits',
+    'credits_active': '/credits?status=active',
+    'client_map': '/map',
+    'client_map_data': '/map/clients?south=4&west=-9&north=11&east=-2&zoom=7',
+    'client_search': '/clients/search?q=kone',
+    'export_clients': '/export/clients',
+    'export_credits': '/export/credits',
+    'export_savings': '/export/savings',
+}
+
+SCORED_CLIENTS = 50
+
+DATASET_MODELS = (Client, Credit, PaymentSchedule, CreditPayment, SavingsAccount, SavingsTransaction)
+
+
+def _sample_client_ids():
+    return db.session.execute(
+        select(Client.id).join(Credit, Credit.client_id == Client.id).distinct().order_by(Client.id).limit(SCORED_CLIENTS)
+    ).scalars().all()
+
+
+def _client_scores(client_ids):
+    for client_id in client_ids:
+        get_client_score(client_id)
+
+
+def _stale_scores(client_ids):
+    invalidate_client_scores(client_ids=client_ids)
+    db.session.commit()
+
+
+def helper_benchmarks():
+    """Name -> (setup, run) for the functions timed outside a request; ``setup`` is not timed."""
+    client_ids = _sample_client_ids()
+    return {
+        'get_client_score': (lambda: _stale_scores(client_ids), lambda: _client_scores(client_ids)),
+        'portfolio_at_risk': (None, lambda: portfolio_at_risk(date.today())),
+        'dashboard_snapshot': (None, compute_dashboard_snapshot),
+    }
+
+
+def _summary(timings, statements, extra=None):
+    ordered = sorted(timings)
+    result = {
+        'runs': len(ordered),
+        'min': ordered[0],
+        'median': statistics.median(ordered),
+        'mean': statistics.fmean(ordered),
+        'p95': ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))],
+        'max': ordered[-1],
+        'sql_statements': statements,
+    }
+    result.update(extra or {})
+    return result
+
+
+def _time(run, runs, warmup):
+    for _ in range(warmup):
+        run()
+    timings = []
+    statements = 0
+    for _ in range(runs):
+        with count_queries() as counter:
+            started = time.perf_counter()
+            result = run()
+            timings.append(time.perf_counter() - started)
+        statements = counter.count
+    return timings, statements, result
+
+
+def _route_benchmark(client, url, runs, warmup):
+    def run():
+        response = client.get(url)
+        # Reading the body drains streamed exports
+        return response.status_code, len(response.get_data())
+
+    timings, statements, (status, size) = _time(run, runs, warmup)
+    return _summary(timings, statements, {'url': url, 'status': status, 'bytes': size})
+
+
+def _helper_benchmark(setup, run, runs, warmup):
+    timings = []
+    statements = 0
+    for i in range(warmup + runs):
+        if setup:
+            setup()
+        with count_queries() as counter:
+            started = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - started
+        db.session.commit()
+        if i >= warmup:
+            timings.append(elapsed)
+            statements = counter.count
+    return _summary(timings, statements)
+
+
+def _logged_in_client(app):
+    admin = User.query.filter_by(role='administrateur').order_by(User.id).first()
+    if admin is None:
+        raise click.ClickException('Aucun administrateur : lancez d\'abord flask --app app setup')
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin.id)
+        session['_fresh'] = True
+    return client
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(runs=5, warmup=1, only=None):
+    """Time the hot routes and helpers on the current database; returns a JSON-serialisable report.
+
+    Each benchmark runs ``warmup`` untimed times then ``runs`` timed
+    times; the SQL statement count is the one of the last run.
+    """
+    app = current_app._get_current_object()
+    dataset = {model.__tablename__: db.session.execute(select(func.count()).select_from(model)).scalar()
+               for model in DATASET_MODELS}
+    results = {}
+
+    client = _logged_in_client(app)
+    for name, url in ROUTES.items():
+        if only and name not in only:
+            continue
+        results[name] = _route_benchmark(client, url, runs, warmup)
+
+    for name, (setup, run) in helper_benchmarks().items():
+        if only and name not in only:
+            continue
+        results[name] = _helper_benchmark(setup, run, runs, warmup)
+
+    return {
+        'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'commit': _git_commit(),
+        'database': db.engine.url.render_as_string(hide_password=True),
+        'python': platform.python_version(),
+        'runs': runs,
+        'warmup': warmup,
+        'dataset': dataset,
+        'results': results,
+    }
+
+
+def compare_reports(report, baseline, tolerance):
+    """(name, baseline median, median, relative change, regressed) for each benchmark present in both reports."""
+    rows = []
+    for name, result in report['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous or not previous['median']:
+            continue
+        change = result['median'] / previous['median'] - 1
+        rows.append((name, previous['median'], result['median'], change, change > tolerance))
+    return rows
+
+
+@click.command('benchmark')
+@click.option('--runs', type=int, default=5, help='Mesures par benchmark.')
+@click.option('--warmup', type=int, default=1, help='Exécutions non mesurées avant les mesures.')
+@click.option('--only', multiple=True, help='Limiter à ce benchmark (option répétable).')
+@click.option('--output', type=click.Path(dir_okay=False), default='benchmark_results.json', show_default=True)
+@click.option('--compare', 'baseline_path', type=click.Path(exists=True, dir_okay=False), help='Résultats précédents à comparer.')
+@click.option('--tolerance', type=float, default=0.2, show_default=True, help='Hausse relative de la médiane tolérée avec --compare.')
+@with_appcontext
+def benchmark_command(runs, warmup, only, output, baseline_path, tolerance):
+    """Mesure les pages et fonctions critiques sur la base actuelle et écrit les résultats en JSON."""
+    report = run_benchmarks(runs, warmup, set(only))
+    with open(output, 'w', encoding='utf-8') as handle:
+        json.dump(report, handle, indent=2)
+
+    click.echo(f'{"benchmark":<22}{"médiane":>10}{"p95":>10}{"SQL":>6}')
+    for name, result in report['results'].items():
+        status = '' if result.get('status', 200) == 200 else f'  (HTTP {result["status"]})'
+        click.echo(f'{name:<22}{result["median"] * 1000:>8.1f}ms{result["p95"] * 1000:>8.1f}ms{result["sql_statements"]:>6}{status}')
+    click.echo(f'Résultats écrits dans {output}')
+
+    if baseline_path:
+        with open(baseline_path, encoding='utf-8') as handle:
+            baseline = json.load(handle)
+        regressions = 0
+        for name, before, after, change, regressed in compare_reports(report, baseline, tolerance):
+            regressions += regressed
+            click.echo(f'{name:<22}{before * 1000:>8.1f}ms -> {after * 1000:>8.1f}ms {change:+.0%}{"  RÉGRESSION" if regressed else ""}')
+        if regressions:
+            sys.exit(1)
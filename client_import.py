@@ -0,0 +1,312 @@
+import csv
+import hashlib
+import os
+import re
+import time
+from datetime import date, datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select, update, insert
+from werkzeug.datastructures import MultiDict
+from forms import ClientForm
+from geo import geohash
+from identifiers import reserve_ids
+from models import db, User, Client, ClientLocation, ClientImport, AuditLog
+from search import fold, index_clients
+from snapshot import invalidate_snapshot
+from summaries import schedule_summary_refresh
+
+IMPORT_CHUNK = 1000
+
+# Client field -> accepted column names, compared after folding ('Prénom' -> 'prenom')
+COLUMN_ALIASES = {
+    'first_name': ('first_name', 'prenom', 'prenoms'),
+    'last_name': ('last_name', 'nom', 'nom_de_famille'),
+    'email': ('email', 'e_mail', 'courriel'),
+    'phone': ('phone', 'telephone', 'tel', 'portable'),
+    'address': ('address', 'adresse'),
+    'date_of_birth': ('date_of_birth', 'date_de_naissance', 'naissance'),
+    'id_number': ('id_number', 'numero_identite', 'numero_d_identite', 'cni', 'piece_d_identite'),
+    'latitude': ('latitude', 'lat'),
+    'longitude': ('longitude', 'lon', 'lng'),
+}
+REQUIRED_FIELDS = ('first_name', 'last_name')
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+_FRENCH_DATE = re.compile(r'^(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})$')
+
+
+class ImportFileError(ValueError):
+    """The file cannot be imported at all (format, missing columns, already imported)."""
+
+
+class ImportResult:
+    def __init__(self, record, resumed_from=0):
+        self.record = record
+        self.resumed_from = resumed_from
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        # Phone and ID numbers typed as numbers in a spreadsheet
+        return str(int(value))
+    return str(value).strip()
+
+
+def _csv_rows(path):
+    with open(path, newline='', encoding='utf-8-sig') as handle:
+        first_line = handle.readline()
+        handle.seek(0)
+        delimiter = ';' if first_line.count(';') > first_line.count(',') else ','
+        reader = csv.reader(handle, delimiter=delimiter)
+        header = next(reader, None)
+        yield [_cell_text(name) for name in header or []]
+        for line in reader:
+            yield [_cell_text(value) for value in line]
+
+
+def _xlsx_rows(path):
+    # Imported here: only XLSX imports pay for it
+    from openpyxl import load_workbook
+    # Read-only mode streams the sheet instead of loading it whole
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for line in workbook.active.iter_rows(values_only=True):
+            yield [_cell_text(value) for value in line]
+    finally:
+        workbook.close()
+
+
+def read_rows(path):
+    """Header and an iterator of (line number, values) of a CSV or XLSX file, read lazily."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        lines = _csv_rows(path)
+    elif extension == '.xlsx':
+        lines = _xlsx_rows(path)
+    else:
+        raise ImportFileError('Format non pris en charge : utilisez un fichier .csv ou .xlsx')
+    header = next(lines, None)
+    if not header:
+        raise ImportFileError('Fichier vide')
+    return header, ((number, values) for number, values in enumerate(lines, 2))
+
+
+def column_key(name):
+    """Header cell folded for alias lookup ('N° de transaction' -> 'n_de_transaction')."""
+    return _NON_ALNUM.sub('_', fold(name)).strip('_')
+
+
+def column_map(header, aliases=COLUMN_ALIASES, required=REQUIRED_FIELDS):
+    """Field -> column index, from the header row; ``aliases[field][1]`` names a missing column."""
+    positions = {}
+    for index, name in enumerate(header):
+        key = column_key(name)
+        for field, names in aliases.items():
+            if key in names and field not in positions:
+                positions[field] = index
+    missing = [field for field in required if field not in positions]
+    if missing:
+        labels = ', '.join(aliases[field][1] for field in missing)
+        raise ImportFileError(f'Colonne(s) obligatoire(s) absente(s) : {labels}')
+    return positions
+
+
+def _form_values(values, positions):
+    data = {}
+    for field, index in positions.items():
+        value = values[index] if index < len(values) else ''
+        if field == 'date_of_birth':
+            match = _FRENCH_DATE.match(value)
+            if match:
+                day, month, year = match.groups()
+                value = f'{year}-{int(month):02d}-{int(day):02d}'
+        elif field in ('latitude', 'longitude'):
+            value = value.replace(',', '.')
+        data[field] = value
+    return data
+
+
+def validate_row(form, values, positions):
+    """Client column values of one line checked with ``ClientForm``, or (None, error message)."""
+    form.process(MultiDict(_form_values(values, positions)))
+    if not form.validate():
+        return None, '; '.join(f'{form[name].label.text} : {message}'
+                               for name, messages in form.errors.items() for message in messages)
+    client = {field: form[field].data or None for field in positions if field not in ('latitude', 'longitude')}
+    client['first_name'] = form.first_name.data.strip()
+    client['last_name'] = form.last_name.data.strip()
+    return (client, form.latitude.data, form.longitude.data), None
+
+
+def _insert_chunk(rows):
+    """Insert the validated ``rows`` as new clients with their locations and derived rows."""
+    numbers = reserve_ids('client', len(rows))
+    now = datetime.utcnow()
+    db.session.execute(insert(Client), [dict(client, client_id=number, created_at=now, updated_at=now)
+                                        for (client, _, _), number in zip(rows, numbers)])
+    clients = db.session.execute(select(Client).where(Client.client_id.in_(numbers))).scalars().all()
+    ids = {client.client_id: client.id for client in clients}
+    locations = [{'client_id': ids[number], 'latitude': latitude, 'longitude': longitude,
+                  'geohash': geohash(latitude, longitude), 'updated_at': now}
+                 for (_, latitude, longitude), number in zip(rows, numbers) if latitude is not None]
+    if locations:
+        db.session.execute(insert(ClientLocation), locations)
+    # Bulk inserts bypass the flush hooks
+    index_clients(clients)
+    schedule_summary_refresh(ids.values())
+    invalidate_snapshot()
+
+
+def _trim_report(path, rows_processed):
+    """Drop report lines written for a chunk that was never committed."""
+    if not os.path.exists(path):
+        return
+    trimmed = path + '.tmp'
+    with open(path, newline='', encoding='utf-8') as source, open(trimmed, 'w', newline='', encoding='utf-8') as target:
+        reader, writer = csv.reader(source), csv.writer(target)
+        writer.writerow(next(reader, []))
+        for line in reader:
+            if int(line[0]) <= rows_processed:
+                writer.writerow(line)
+    os.replace(trimmed, path)
+
+
+def _start(path, user_id):
+    digest = file_digest(path)
+    record = ClientImport.query.filter_by(file_digest=digest).first()
+    if record is not None:
+        if record.status == 'completed':
+            raise ImportFileError(f'Ce fichier a déjà été importé le {record.completed_at:%d/%m/%Y %H:%M} '
+                                  f'({record.imported} client(s))')
+        _trim_report(record.report_path, record.rows_processed)
+        return record
+    folder = current_app.config['CLIENT_IMPORT_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    record = ClientImport(file_name=os.path.basename(path), file_digest=digest, created_by=user_id,
+                          report_path=os.path.join(folder, f'{digest[:16]}_erreurs.csv'))
+    db.session.add(record)
+    db.session.commit()
+    return record
+
+
+def _save_progress(import_id, checkpoint, rows_processed, imported, rejected):
+    """Move the import's checkpoint in the chunk's transaction; False if another run moved it first."""
+    return bool(db.session.execute(
+        update(ClientImport).where(ClientImport.id == import_id, ClientImport.rows_processed == checkpoint)
+        .values(rows_processed=rows_processed, imported=ClientImport.imported + imported,
+                rejected=ClientImport.rejected + rejected, updated_at=datetime.utcnow())
+    ).rowcount)
+
+
+def import_clients(path, user_id=None, chunk_size=IMPORT_CHUNK, progress=None):
+    """Import the clients of a CSV or XLSX file, ``chunk_size`` lines per transaction.
+
+    Lines are validated with the rules of ``ClientForm``; rejected lines
+    go to a CSV error report with their line number and reasons. Each
+    chunk's clients and checkpoint are committed together, so running
+    the same file again after a failure resumes after the last committed
+    chunk, and a file already imported in full is refused. The file is
+    read as a stream: memory use does not depend on its size.
+    """
+    header, lines = read_rows(path)
+    positions = column_map(header)
+    record = _start(path, user_id)
+    import_id, resumed_from = record.id, record.rows_processed
+    checkpoint = resumed_from
+    form = ClientForm(formdata=None, meta={'csrf': False})
+
+    new_report = not os.path.exists(record.report_path)
+    with open(record.report_path, 'a', newline='', encoding='utf-8') as report_file:
+        report = csv.writer(report_file)
+        if new_report:
+            report.writerow(['ligne', 'erreurs'] + header)
+
+        rows, rejected, last_line = [], 0, checkpoint
+        for number, values in lines:
+            if number <= resumed_from:
+                continue
+            last_line = number
+            if any(values):
+                row, error = validate_row(form, values, positions)
+                if error:
+                    report.writerow([number, error] + values)
+                    rejected += 1
+                else:
+                    rows.append(row)
+            if len(rows) + rejected < chunk_size:
+                continue
+            checkpoint = _commit_chunk(import_id, checkpoint, last_line, rows, rejected, report_file, progress)
+            rows, rejected = [], 0
+        if last_line > checkpoint:
+            _commit_chunk(import_id, checkpoint, last_line, rows, rejected, report_file, progress)
+
+    record = db.session.get(ClientImport, import_id)
+    record.status = 'completed'
+    record.completed_at = datetime.utcnow()
+    db.session.add(AuditLog(user_id=user_id, action='Import clients', entity_type='Client',
+                            details=f'Import de {record.file_name} : {record.imported} client(s) créé(s), '
+                                    f'{record.rejected} ligne(s) rejetée(s)'))
+    db.session.commit()
+    return ImportResult(record, resumed_from)
+
+
+def _commit_chunk(import_id, checkpoint, last_line, rows, rejected, report_file, progress):
+    """Write one chunk and its checkpoint in one transaction; returns the new checkpoint."""
+    if rows:
+        _insert_chunk(rows)
+    if not _save_progress(import_id, checkpoint, last_line, len(rows), rejected):
+        db.session.rollback()
+        raise ImportFileError('Ce fichier est en cours d\'import par un autre processus')
+    # Report lines reach the disk before the commit; a resumed run trims those of an uncommitted chunk
+    report_file.flush()
+    db.session.commit()
+    if progress:
+        progress(db.session.get(ClientImport, import_id))
+    return last_line
+
+
+@click.command('import-clients')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user', 'username', default=None, help='Utilisateur auquel attribuer l\'import dans le journal d\'audit.')
+@click.option('--chunk-size', type=int, default=IMPORT_CHUNK)
+@with_appcontext
+def import_clients_command(path, username, chunk_size):
+    """Importe des clients depuis un fichier CSV ou XLSX ; relancer la commande reprend un import interrompu."""
+    user_id = None
+    if username:
+        user_id = db.session.execute(select(User.id).where(User.username == username)).scalar()
+        if user_id is None:
+            raise click.ClickException(f'Utilisateur {username} introuvable')
+    started = time.perf_counter()
+
+    def progress(record):
+        click.echo(f'ligne {record.rows_processed} : {record.imported} client(s) importé(s), '
+                   f'{record.rejected} rejeté(s) ({time.perf_counter() - started:.0f}s)')
+
+    try:
+        result = import_clients(path, user_id, chunk_size, progress)
+    except ImportFileError as error:
+        raise click.ClickException(str(error))
+    record = result.record
+    if result.resumed_from:
+        click.echo(f'Import repris après la ligne {result.resumed_from}')
+    click.echo(f'{record.imported} client(s) importé(s), {record.rejected} ligne(s) rejetée(s) '
+               f'en {time.perf_counter() - started:.1f}s')
+    if record.rejected:
+        click.echo(f'Rapport d\'erreurs : {record.report_path}')
@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+from functools import wraps
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND = 'replica'
+
+_lock = threading.Lock()
+_replica_down_until = {'at': 0.0}
+
+
+class TimedQueuePool(QueuePool):
+    """``QueuePool`` counting checkouts and the time spent waiting for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = {'checkouts': 0, 'connects': 0, 'invalidations': 0, 'timeouts': 0,
+                      'wait_total': 0.0, 'wait_max': 0.0}
+        self._stats_lock = threading.Lock()
+        event.listen(self, 'connect', lambda *args: self._count('connects'))
+        event.listen(self, 'invalidate', lambda *args: self._count('invalidations'))
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self._count('timeouts')
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._stats_lock:
+                self.stats['checkouts'] += 1
+                self.stats['wait_total'] += waited
+                self.stats['wait_max'] = max(self.stats['wait_max'], waited)
+
+
+def _in_memory_sqlite(url):
+    url = make_url(url)
+    return url.drivername.startswith('sqlite') and url.database in (None, '', ':memory:')
+
+
+def engine_options(url, config):
+    """Engine options for ``url`` from the ``DB_POOL_*`` settings.
+
+    An in-memory SQLite database keeps Flask-SQLAlchemy's single shared
+    connection, so only pre-ping and recycling apply to it.
+    """
+    options = {'pool_pre_ping': config['DB_POOL_PRE_PING'], 'pool_recycle': config['DB_POOL_RECYCLE']}
+    if not _in_memory_sqlite(url):
+        options.update(poolclass=TimedQueuePool, pool_size=config['DB_POOL_SIZE'],
+                       max_overflow=config['DB_MAX_OVERFLOW'], pool_timeout=config['DB_POOL_TIMEOUT'])
+    return options
+
+
+def configure_engines(app):
+    """Fill ``SQLALCHEMY_ENGINE_OPTIONS`` and the replica bind; call before ``db.init_app``."""
+    config = app.config
+    config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(config['SQLALCHEMY_DATABASE_URI'], config))
+    replica_url = config.get('DATABASE_REPLICA_URL')
+    if replica_url:
+        binds = config.setdefault('SQLALCHEMY_BINDS', {})
+        binds.setdefault(REPLICA_BIND, dict(engine_options(replica_url, config), url=replica_url))
+
+
+def _replica_engine():
+    if not has_app_context() or time.monotonic() < _replica_down_until['at']:
+        return None
+    return current_app.extensions['sqlalchemy'].engines.get(REPLICA_BIND)
+
+
+def _replica_reachable(engine):
+    try:
+        with engine.connect() as connection:
+            connection.exec_driver_sql('SELECT 1')
+        return True
+    except DBAPIError:
+        return False
+
+
+def _mark_replica_down(error):
+    with _lock:
+        _replica_down_until['at'] = time.monotonic() + current_app.config.get('REPLICA_RETRY_INTERVAL', 30)
+    logger.warning('Réplique indisponible, lectures renvoyées sur la base principale : %s', error)
+
+
+class RoutingSession(FlaskSession):
+    """Session sending the reads of a ``@read_replica`` view to the replica bind.
+
+    Flushes, and everything outside such a view, use the usual binds.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context() and g.get('use_replica'):
+            engine = _replica_engine()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_replica(view):
+    """Run a read-only view against the replica when one is configured.
+
+    The replica may lag behind the primary by its replication delay. If
+    it cannot be reached, the view is run again on the primary and the
+    replica is skipped for ``REPLICA_RETRY_INTERVAL`` seconds.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        engine = _replica_engine()
+        if engine is None:
+            return view(*args, **kwargs)
+        g.use_replica = True
+        try:
+            return view(*args, **kwargs)
+        except DBAPIError as error:
+            # Only a replica that no longer answers sends the view back to the primary
+            if _replica_reachable(engine):
+                raise
+            _mark_replica_down(error)
+            current_app.extensions['sqlalchemy'].session.rollback()
+            g.use_replica = False
+            return view(*args, **kwargs)
+        finally:
+            g.pop('use_replica', None)
+    return wrapper
+
+
+def pool_stats():
+    """Checkout and wait statistics of each engine's pool in this process, by bind name."""
+    engines = current_app.extensions['sqlalchemy'].engines
+    stats = {}
+    for key, engine in sorted(engines.items(), key=lambda item: item[0] is not None):
+        pool = engine.pool
+        entry = {'bind': key or 'primary', 'pool': type(pool).__name__, 'status': pool.status()}
+        if isinstance(pool, TimedQueuePool):
+            with pool._stats_lock:
+                entry.update(pool.stats)
+            entry.update(size=pool.size(), checked_out=pool.checkedout(), overflow=max(pool.overflow(), 0))
+            entry['wait_avg'] = entry['wait_total'] / entry['checkouts'] if entry['checkouts'] else 0.0
+        stats[entry['bind']] = entry
+    return stats
@@ -0,0 +1,91 @@
+from datetime import datetime
+from sqlalchemy import select, update, delete, insert, func
+from amortization import due_dates
+from snapshot import invalidate_snapshot
+from scoring import invalidate_client_scores
+from summaries import owners, schedule_summary_refresh
+from models import db, Credit, PaymentSchedule
+
+SCHEDULE_INSERT_CHUNK = 5000
+
+DISBURSABLE_STATUSES = ('approved',)
+APPROVABLE_STATUSES = ('pending', 'approved')
+
+
+class DisbursementBatch:
+    """Outcome of ``disburse_credits``: the disbursed credit numbers or the reasons for rejection."""
+
+    def __init__(self, credit_numbers=None, errors=None, installments=0):
+        self.credit_numbers = credit_numbers or []
+        self.errors = errors or []
+        self.installments = installments
+
+    @property
+    def ok(self):
+        return not self.errors and bool(self.credit_numbers)
+
+
+def _validate(rows, credit_ids, allowed_statuses):
+    errors = []
+    found = {row.id for row in rows}
+    for credit_id in credit_ids:
+        if credit_id not in found:
+            errors.append(f'Crédit #{credit_id} introuvable')
+    for row in rows:
+        if row.status not in allowed_statuses:
+            errors.append(f'{row.credit_number}: statut {row.status}')
+        elif not row.duration_months or row.duration_months <= 0 or row.monthly_payment is None:
+            errors.append(f'{row.credit_number}: durée ou mensualité invalide')
+    return errors
+
+
+def disburse_credits(credit_ids, approve=False, disbursed_at=None):
+    """Disburse every credit of ``credit_ids`` in the current transaction, or none of them.
+
+    The credits are locked and validated first; any missing or
+    ineligible credit rejects the whole batch. Status changes are one
+    UPDATE and the schedules of all credits are written with chunked
+    bulk INSERTs, sharing one due-date vector since every credit of the
+    batch is disbursed on the same day. With ``approve``, pending credits
+    are approved on the way. The caller logs the audit entry and commits.
+    """
+    credit_ids = sorted({int(credit_id) for credit_id in credit_ids})
+    if not credit_ids:
+        return DisbursementBatch(errors=['Aucun crédit sélectionné'])
+    disbursed_at = disbursed_at or datetime.utcnow()
+    allowed = APPROVABLE_STATUSES if approve else DISBURSABLE_STATUSES
+
+    rows = db.session.execute(
+        select(Credit.id, Credit.credit_number, Credit.status, Credit.duration_months, Credit.monthly_payment)
+        .where(Credit.id.in_(credit_ids)).order_by(Credit.id).with_for_update()
+    ).all()
+    errors = _validate(rows, credit_ids, allowed)
+    if errors:
+        return DisbursementBatch(errors=errors)
+
+    db.session.execute(
+        update(Credit).where(Credit.id.in_(credit_ids)).values(
+            status='active',
+            approval_date=func.coalesce(Credit.approval_date, disbursed_at),
+            disbursement_date=disbursed_at
+        ).execution_options(synchronize_session=False)
+    )
+    db.session.execute(delete(PaymentSchedule).where(PaymentSchedule.credit_id.in_(credit_ids)))
+
+    dates = due_dates(disbursed_at, max(row.duration_months for row in rows))
+    schedule_rows = [{
+        'credit_id': row.id,
+        'installment_number': i,
+        'due_date': due_date,
+        'expected_amount': row.monthly_payment,
+        'paid': False,
+        'paid_amount': 0
+    } for row in rows for i, due_date in enumerate(dates[:row.duration_months], 1)]
+    for start in range(0, len(schedule_rows), SCHEDULE_INSERT_CHUNK):
+        db.session.execute(insert(PaymentSchedule), schedule_rows[start:start + SCHEDULE_INSERT_CHUNK])
+
+    # Bulk statements bypass the flush hooks
+    invalidate_snapshot()
+    invalidate_client_scores(credit_ids=credit_ids)
+    schedule_summary_refresh(owners(credit_ids=credit_ids))
+    return DisbursementBatch([row.credit_number for row in rows], installments=len(schedule_rows))
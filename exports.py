@@ -0,0 +1,159 @@
+import csv
+import io
+import zlib
+from datetime import datetime, timedelta
+from flask import Response, current_app, request, stream_with_context
+from sqlalchemy import select
+from models import db, Client, Product, Credit, SavingsAccount
+
+CLIENT_HEADER = ['ID Client', 'Prénom', 'Nom', 'Email', 'Téléphone', 'Date de naissance', 'Date de création']
+CREDIT_HEADER = ['Numéro', 'Client', 'Produit', 'Montant', 'Taux', 'Durée', 'Paiement Mensuel', 'Montant Total', 'Montant Payé', 'Solde', 'Statut', 'Date Demande']
+SAVINGS_HEADER = ['Numéro Compte', 'Client', 'Produit', 'Solde', 'Taux d\'intérêt', 'Statut', 'Date Ouverture']
+
+
+class ExportFilters:
+    """Optional ``start``/``end`` (YYYY-MM-DD, inclusive) and ``status`` export filters."""
+
+    def __init__(self, start=None, end=None, status=None):
+        self.start = start
+        self.end = end
+        self.status = status
+
+    @classmethod
+    def from_request(cls):
+        def parse(name):
+            value = request.args.get(name)
+            try:
+                return datetime.strptime(value, '%Y-%m-%d') if value else None
+            except ValueError:
+                return None
+        return cls(parse('start'), parse('end'), request.args.get('status') or None)
+
+    def apply(self, statement, date_column, status_column=None):
+        if self.start:
+            statement = statement.where(date_column >= self.start)
+        if self.end:
+            statement = statement.where(date_column < self.end + timedelta(days=1))
+        if self.status and status_column is not None:
+            statement = statement.where(status_column == self.status)
+        return statement
+
+    def describe(self):
+        parts = []
+        if self.start:
+            parts.append(f"du {self.start.strftime('%d/%m/%Y')}")
+        if self.end:
+            parts.append(f"au {self.end.strftime('%d/%m/%Y')}")
+        if self.status:
+            parts.append(f"statut {self.status}")
+        return ' '.join(parts) or 'complet'
+
+
+def _fetch(statement):
+    """Iterate result rows through a server-side cursor, ``EXPORT_YIELD_PER`` rows at a time."""
+    yield_per = current_app.config.get('EXPORT_YIELD_PER', 1000)
+    result = db.session.execute(statement.execution_options(stream_results=True, yield_per=yield_per))
+    for partition in result.partitions():
+        yield from partition
+
+
+def client_rows(filters):
+    statement = filters.apply(select(
+        Client.client_id, Client.first_name, Client.last_name, Client.email,
+        Client.phone, Client.date_of_birth, Client.created_at
+    ).order_by(Client.id), Client.created_at)
+    for row in _fetch(statement):
+        yield [
+            row.client_id,
+            row.first_name,
+            row.last_name,
+            row.email or '',
+            row.phone or '',
+            row.date_of_birth.strftime('%Y-%m-%d') if row.date_of_birth else '',
+            row.created_at.strftime('%Y-%m-%d %H:%M') if row.created_at else ''
+        ]
+
+
+def credit_rows(filters):
+    statement = filters.apply(select(
+        Credit.credit_number, Client.first_name, Client.last_name, Product.name.label('product_name'),
+        Credit.amount, Credit.interest_rate, Credit.duration_months, Credit.monthly_payment,
+        Credit.total_amount, Credit.amount_paid, Credit.penalty_amount, Credit.status, Credit.application_date
+    ).join(Client, Credit.client_id == Client.id).join(Product, Credit.product_id == Product.id).order_by(Credit.id),
+        Credit.application_date, Credit.status)
+    for row in _fetch(statement):
+        yield [
+            row.credit_number,
+            f"{row.first_name} {row.last_name}",
+            row.product_name,
+            row.amount,
+            row.interest_rate,
+            row.duration_months,
+            row.monthly_payment,
+            row.total_amount,
+            row.amount_paid,
+            row.total_amount + (row.penalty_amount or 0) - (row.amount_paid or 0),
+            row.status,
+            row.application_date.strftime('%Y-%m-%d') if row.application_date else ''
+        ]
+
+
+def savings_rows(filters):
+    statement = filters.apply(select(
+        SavingsAccount.account_number, Client.first_name, Client.last_name, Product.name.label('product_name'),
+        SavingsAccount.balance, SavingsAccount.interest_rate, SavingsAccount.status, SavingsAccount.opening_date
+    ).join(Client, SavingsAccount.client_id == Client.id).join(Product, SavingsAccount.product_id == Product.id).order_by(SavingsAccount.id),
+        SavingsAccount.opening_date, SavingsAccount.status)
+    for row in _fetch(statement):
+        yield [
+            row.account_number,
+            f"{row.first_name} {row.last_name}",
+            row.product_name,
+            row.balance,
+            row.interest_rate,
+            row.status,
+            row.opening_date.strftime('%Y-%m-%d') if row.opening_date else ''
+        ]
+
+
+def _csv_chunks(header, rows, rows_per_chunk=500):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def csv_response(filename, header, rows, compress=False):
+    """Stream ``rows`` as a CSV attachment, optionally gzip-compressed.
+
+    Memory stays bounded by one chunk of rows and the first bytes leave
+    as soon as the first chunk is serialized.
+    """
+    chunks = _csv_chunks(header, rows)
+    mimetype = 'text/csv'
+    if compress:
+        chunks = _gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+
+def wants_gzip():
+    return request.args.get('compress') in ('gzip', '1', 'true')
@@ -1,6 +1,6 @@
 from markupsafe import Markup
 from flask_wtf import FlaskForm
-from flask_wtf.file import FileField, FileAllowed
+from flask_wtf.file import FileField, FileAllowed, FileRequired
 from wtforms import StringField, PasswordField, EmailField, SelectField, FloatField, IntegerField, TextAreaField, DateField, BooleanField
 from wtforms.validators import DataRequired, Email, Length, Optional, NumberRange
 
@@ -14,11 +14,21 @@ class ClientForm(FlaskForm):
     email = EmailField('Email', validators=[Optional(), Email()])
     phone = StringField('Téléphone', validators=[Optional(), Length(max=20)])
     address = TextAreaField('Adresse', validators=[Optional()])
+    latitude = FloatField('Latitude', validators=[Optional(), NumberRange(min=-90, max=90)])
+    longitude = FloatField('Longitude', validators=[Optional(), NumberRange(min=-180, max=180)])
     date_of_birth = DateField('Date de naissance', validators=[Optional()], format='%Y-%m-%d')
     id_number = StringField('Numéro d\'identité', validators=[Optional(), Length(max=50)])
     photo = FileField('Photo du client', validators=[Optional(), FileAllowed(['jpg', 'jpeg', 'png'], 'Images seulement!')])
     id_card = FileField('Carte d\'identité', validators=[Optional(), FileAllowed(['jpg', 'jpeg', 'png', 'pdf'], 'Images ou PDF seulement!')])
 
+    def validate(self, extra_validators=None):
+        if not super().validate(extra_validators):
+            return False
+        if (self.latitude.data is None) != (self.longitude.data is None):
+            self.longitude.errors.append('Renseignez la latitude et la longitude ensemble.')
+            return False
+        return True
+
 class ProductForm(FlaskForm):
     name = StringField('Nom du produit', validators=[DataRequired(), Length(max=100)])
     product_type = SelectField('Type de produit', choices=[('credit', 'Crédit'), ('savings', 'Épargne')], validators=[DataRequired()])
@@ -117,3 +127,9 @@ class UserForm(FlaskForm):
         ('agent', 'Agent')
     ], validators=[DataRequired()])
 
+class SettlementFileForm(FlaskForm):
+    provider = SelectField('Opérateur', choices=[
+        ('wave', 'Wave'),
+        ('orange_money', 'Orange Money')
+    ], validators=[DataRequired()])
+    settlement_file = FileField('Relevé de paiements', validators=[FileRequired(), FileAllowed(['csv', 'xlsx'], 'Fichiers CSV ou XLSX seulement!')])
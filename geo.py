@@ -0,0 +1,247 @@
+import csv
+import math
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event, func, case, and_, or_, select, delete, insert
+from sqlalchemy.orm import Session
+from models import db, Client, ClientLocation, ClientSummary
+from search import prefix_range
+
+GEOHASH_PRECISION = 9
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Marker colours of map.html, by number of active credits
+COLORS = {'green': (0, 0), 'blue': (1, 1), 'orange': (2, None)}
+
+DEFAULT_CENTER = (5.3600, -4.0083)
+
+
+def geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    code = []
+    bits = 0
+    value = 0
+    even = True
+    while len(code) < precision:
+        target, bounds = (longitude, lng_range) if even else (latitude, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if target >= middle:
+            value |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            code.append(_BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(code)
+
+
+def cell_size(precision):
+    """``(height, width)`` in degrees of a geohash cell."""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def covering_prefixes(south, west, north, east, max_cells=32):
+    """Fewest-characters-possible geohash cells covering the box, at most ``max_cells`` of them."""
+    precision = 1
+    for candidate in range(1, GEOHASH_PRECISION + 1):
+        height, width = cell_size(candidate)
+        cells = (math.floor((north - south) / height) + 2) * (math.floor((east - west) / width) + 2)
+        if cells > max_cells:
+            break
+        precision = candidate
+    height, width = cell_size(precision)
+    lats = [south + i * height for i in range(int((north - south) / height) + 1)] + [north]
+    lngs = [west + i * width for i in range(int((east - west) / width) + 1)] + [east]
+    return sorted({geohash(lat, lng, precision) for lat in lats for lng in lngs})
+
+
+def cluster_precision(zoom):
+    """Shortest geohash whose cells are at most about 160 pixels wide at ``zoom``."""
+    target = 160 / 256 * 360.0 / 2 ** max(zoom, 0)
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        if cell_size(precision)[1] <= target:
+            return precision
+    return GEOHASH_PRECISION
+
+
+def _client_stats(bounds, colors=None):
+    """Located clients inside ``bounds`` with their credit statistics from ``client_summaries``.
+
+    The geohash prefixes narrow the scan to the index; the coordinates
+    then trim the cells to the exact box.
+    """
+    south, west, north, east = bounds
+    active_credits = func.coalesce(ClientSummary.active_credits, 0)
+    statement = select(
+        ClientLocation.client_id,
+        ClientLocation.latitude,
+        ClientLocation.longitude,
+        ClientLocation.geohash,
+        active_credits.label('active_credits'),
+        func.coalesce(ClientSummary.total_borrowed, 0).label('total_amount')
+    ).outerjoin(ClientSummary, ClientSummary.client_id == ClientLocation.client_id).where(
+        or_(*[prefix_range(ClientLocation.geohash, prefix) for prefix in covering_prefixes(south, west, north, east)]),
+        ClientLocation.latitude.between(south, north),
+        ClientLocation.longitude.between(west, east)
+    )
+    if colors:
+        statement = statement.where(or_(*[
+            and_(active_credits >= low, active_credits <= high) if high is not None else active_credits >= low
+            for low, high in (COLORS[color] for color in colors)
+        ]))
+    return statement.subquery()
+
+
+def _color(active_credits):
+    return 'green' if active_credits == 0 else 'blue' if active_credits == 1 else 'orange'
+
+
+def _markers(stats, limit):
+    rows = db.session.execute(
+        select(
+            Client.id, Client.client_id, Client.first_name, Client.last_name, Client.phone, Client.email, Client.address,
+            stats.c.latitude, stats.c.longitude, stats.c.active_credits, stats.c.total_amount
+        ).join(stats, stats.c.client_id == Client.id).order_by(Client.id).limit(limit + 1)
+    ).all()
+    if len(rows) > limit:
+        return None
+    return [{
+        'id': row.id,
+        'name': f'{row.first_name} {row.last_name}',
+        'client_id': row.client_id,
+        'address': row.address or 'Adresse non renseignée',
+        'phone': row.phone or 'N/A',
+        'email': row.email or 'N/A',
+        'lat': row.latitude,
+        'lng': row.longitude,
+        'active_credits': row.active_credits,
+        'total_amount': float(row.total_amount or 0),
+        'color': _color(row.active_credits)
+    } for row in rows]
+
+
+def _clusters(stats, precision):
+    cell = func.substr(stats.c.geohash, 1, precision)
+    rows = db.session.execute(
+        select(
+            cell.label('cell'),
+            func.count(),
+            func.avg(stats.c.latitude),
+            func.avg(stats.c.longitude),
+            func.sum(case((stats.c.active_credits > 0, 1), else_=0)),
+            func.sum(stats.c.total_amount)
+        ).group_by(cell)
+    ).all()
+    return [{
+        'cell': row[0],
+        'count': row[1],
+        'lat': float(row[2]),
+        'lng': float(row[3]),
+        'with_active_credits': int(row[4] or 0),
+        'total_amount': float(row[5] or 0)
+    } for row in rows]
+
+
+def viewport(bounds, zoom, colors=None):
+    """Map payload for a viewport: individual markers, or clusters when there are too many.
+
+    Below ``MAP_CLUSTER_ZOOM``, or when the box holds more than
+    ``MAP_MAX_MARKERS`` clients, clients are grouped by geohash prefix
+    sized for the zoom level.
+    """
+    max_markers = current_app.config.get('MAP_MAX_MARKERS', 1000)
+    stats = _client_stats(bounds, colors)
+
+    markers = None
+    if zoom >= current_app.config.get('MAP_CLUSTER_ZOOM', 12):
+        markers = _markers(stats, max_markers)
+    if markers is not None:
+        return {
+            'mode': 'markers',
+            'markers': markers,
+            'summary': {
+                'clients': len(markers),
+                'with_active_credits': sum(1 for m in markers if m['active_credits'] > 0),
+                'total_amount': sum(m['total_amount'] for m in markers)
+            }
+        }
+
+    clusters = _clusters(stats, cluster_precision(zoom))
+    return {
+        'mode': 'clusters',
+        'clusters': clusters,
+        'summary': {
+            'clients': sum(c['count'] for c in clusters),
+            'with_active_credits': sum(c['with_active_credits'] for c in clusters),
+            'total_amount': sum(c['total_amount'] for c in clusters)
+        }
+    }
+
+
+def located_bounds():
+    """``(south, west, north, east)`` of every located client, or None."""
+    row = db.session.query(
+        func.min(ClientLocation.latitude), func.min(ClientLocation.longitude),
+        func.max(ClientLocation.latitude), func.max(ClientLocation.longitude)
+    ).one()
+    return row if row[0] is not None else None
+
+
+@event.listens_for(Session, 'before_flush')
+def _maintain_geohash(session, flush_context, instances):
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, ClientLocation):
+            if obj.latitude is None or obj.longitude is None:
+                if obj in session.new:
+                    session.expunge(obj)
+                else:
+                    session.delete(obj)
+            else:
+                obj.geohash = geohash(obj.latitude, obj.longitude)
+
+
+@click.command('import-client-locations')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', type=int, default=5000)
+@with_appcontext
+def import_client_locations_command(path, chunk_size):
+    """Importe les coordonnées des clients depuis un CSV (client_id, latitude, longitude)."""
+    client_ids = dict(db.session.query(Client.client_id, Client.id))
+    imported = skipped = 0
+
+    def flush(rows):
+        ids = [row['client_id'] for row in rows]
+        db.session.execute(delete(ClientLocation).where(ClientLocation.client_id.in_(ids)))
+        db.session.execute(insert(ClientLocation), rows)
+        db.session.commit()
+
+    with open(path, newline='', encoding='utf-8-sig') as handle:
+        rows = {}
+        for line in csv.DictReader(handle):
+            try:
+                client_pk = client_ids[line['client_id'].strip()]
+                latitude, longitude = float(line['latitude']), float(line['longitude'])
+            except (KeyError, ValueError, AttributeError):
+                skipped += 1
+                continue
+            if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                skipped += 1
+                continue
+            rows[client_pk] = {'client_id': client_pk, 'latitude': latitude, 'longitude': longitude,
+                               'geohash': geohash(latitude, longitude)}
+            if len(rows) >= chunk_size:
+                flush(list(rows.values()))
+                imported += len(rows)
+                rows = {}
+        if rows:
+            flush(list(rows.values()))
+            imported += len(rows)
+    click.echo(f'{imported} position(s) importée(s), {skipped} ligne(s) ignorée(s)')
@@ -0,0 +1,7 @@
+# gunicorn "app:create_app()" loads this file from the working directory
+
+
+def post_worker_init(worker):
+    # Background jobs run in web workers only, once the application is loaded
+    from app import start_workers
+    start_workers(worker.wsgi)
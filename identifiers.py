@@ -0,0 +1,88 @@
+import threading
+from collections import deque
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import select, update, insert
+from sqlalchemy.exc import IntegrityError
+from models import db, Client, Credit, SavingsAccount, IdCounter
+
+# Kind -> (model, column, config key of the format, default format)
+SEQUENCES = {
+    'client': (Client, 'client_id', 'CLIENT_ID_FORMAT', 'CLT{number:08d}'),
+    'credit': (Credit, 'credit_number', 'CREDIT_NUMBER_FORMAT', 'CRD{number:08d}'),
+    'savings': (SavingsAccount, 'account_number', 'SAVINGS_ACCOUNT_FORMAT', 'SAV{number:08d}'),
+}
+
+EXISTING_CHECK_CHUNK = 1000
+
+_lock = threading.Lock()
+_blocks = {}
+
+
+def id_format(kind):
+    _, _, config_key, default = SEQUENCES[kind]
+    return current_app.config.get(config_key) or default
+
+
+def _take_numbers(kind, count):
+    """Advance the counter of ``kind`` by ``count`` and return the first reserved number.
+
+    Runs on its own connection and commits at once, so the counter row is
+    locked for one round trip and numbers handed out are never given
+    again, even if the caller's transaction rolls back (which leaves a gap).
+    """
+    advance = update(IdCounter).where(IdCounter.name == kind).values(
+        next_value=IdCounter.next_value + count, updated_at=datetime.utcnow()
+    )
+    with db.engine.begin() as connection:
+        # The relative UPDATE takes the row lock before the value is read back
+        if not connection.execute(advance).rowcount:
+            try:
+                with connection.begin_nested():
+                    connection.execute(insert(IdCounter).values(name=kind, next_value=1, updated_at=datetime.utcnow()))
+            except IntegrityError:
+                # Another process created the counter first
+                pass
+            connection.execute(advance)
+        return connection.execute(select(IdCounter.next_value).where(IdCounter.name == kind)).scalar() - count
+
+
+def _unused(kind, values):
+    """Drop the values already present in the table, e.g. random numbers issued before the counter existed."""
+    model, field, _, _ = SEQUENCES[kind]
+    column = getattr(model, field)
+    taken = set()
+    for start in range(0, len(values), EXISTING_CHECK_CHUNK):
+        chunk = values[start:start + EXISTING_CHECK_CHUNK]
+        taken.update(db.session.execute(select(column).where(column.in_(chunk))).scalars())
+    return [value for value in values if value not in taken]
+
+
+def reserve_ids(kind, count):
+    """Reserve ``count`` new identifiers of ``kind`` (``'client'``, ``'credit'`` or ``'savings'``).
+
+    For bulk imports: one counter round trip and one existence check per
+    thousand values, whatever ``count`` is.
+    """
+    fmt = id_format(kind)
+    year = datetime.now().year
+    values = []
+    while len(values) < count:
+        missing = count - len(values)
+        first = _take_numbers(kind, missing)
+        values.extend(_unused(kind, [fmt.format(number=number, year=year) for number in range(first, first + missing)]))
+    return values
+
+
+def next_id(kind):
+    """Next identifier of ``kind``, served from a block reserved by this process.
+
+    A block of ``ID_BLOCK_SIZE`` values is reserved when the previous one
+    runs out, so most calls need no database round trip. Values are
+    unique but not gap-free, and not ordered across processes.
+    """
+    with _lock:
+        block = _blocks.get(kind)
+        if not block:
+            block = _blocks[kind] = deque(reserve_ids(kind, current_app.config.get('ID_BLOCK_SIZE', 20)))
+        return block.popleft()
@@ -0,0 +1,154 @@
+import time
+from datetime import datetime
+import click
+import numpy as np
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, func, select, update, insert
+from jobs import acquire_job_lock
+from snapshot import invalidate_snapshot
+from summaries import owners, schedule_summary_refresh
+from models import db, SavingsAccount, SavingsTransaction, SystemSettings
+
+INTEREST_METHODS = ('simple', 'compound')
+
+
+class AccrualResult:
+    """Totals of one accrual run, with its throughput."""
+
+    def __init__(self, as_of, method):
+        self.as_of = as_of
+        self.method = method
+        self.accounts_scanned = 0
+        self.accounts_credited = 0
+        self.total_interest = 0.0
+        self.elapsed = 0.0
+
+    @property
+    def accounts_per_second(self):
+        return self.accounts_scanned / self.elapsed if self.elapsed else 0.0
+
+
+def interest_method():
+    method = db.session.query(SystemSettings.interest_calculation_method).scalar()
+    return method if method in INTEREST_METHODS else 'simple'
+
+
+def _month_index(moments):
+    """Months since year 0 and the position within the month, for full-month differences."""
+    years = np.array([m.year for m in moments], dtype=np.int64)
+    months = np.array([m.month for m in moments], dtype=np.int64)
+    within = np.array([
+        ((m.day * 24 + getattr(m, 'hour', 0)) * 60 + getattr(m, 'minute', 0)) * 60 + getattr(m, 'second', 0)
+        for m in moments
+    ], dtype=np.int64)
+    return years * 12 + months, within
+
+
+def months_elapsed(since, until):
+    """Full calendar months from each ``since`` to ``until`` (``relativedelta`` semantics)."""
+    since_index, since_within = _month_index(since)
+    until_index, until_within = _month_index([until])
+    months = until_index - since_index - (until_within < since_within)
+    return np.maximum(months, 0)
+
+
+def accrued_interest(balances, annual_rates, months, method='simple'):
+    """Interest earned by each balance over ``months`` months, rounded to the cent."""
+    balances = np.asarray(balances, dtype=float)
+    monthly_rates = np.asarray(annual_rates, dtype=float) / 100 / 12
+    months = np.asarray(months, dtype=float)
+    if method == 'compound':
+        interest = balances * (np.power(1 + monthly_rates, months) - 1)
+    else:
+        interest = balances * monthly_rates * months
+    return np.round(interest, 2)
+
+
+def _accrue_chunk(rows, as_of, method, result):
+    last_interest = dict(db.session.execute(
+        select(SavingsTransaction.account_id, func.max(SavingsTransaction.transaction_date))
+        .where(SavingsTransaction.account_id.between(rows[0].id, rows[-1].id), SavingsTransaction.transaction_type == 'interest')
+        .group_by(SavingsTransaction.account_id)
+    ).all())
+    since = [last_interest.get(row.id) or row.opening_date or as_of for row in rows]
+    months = months_elapsed(since, as_of)
+    balances = np.array([row.balance or 0 for row in rows], dtype=float)
+    interest = accrued_interest(balances, [row.interest_rate or 0 for row in rows], months, method)
+
+    due = np.flatnonzero((months >= 1) & (balances > 0) & (interest > 0))
+    result.accounts_scanned += len(rows)
+    if not len(due):
+        return
+
+    balance_after = balances + interest
+    accounts = SavingsAccount.__table__
+    # Core table: an ORM update() with a parameter list would switch to bulk-by-primary-key mode
+    db.session.execute(
+        update(accounts).where(accounts.c.id == bindparam('account_id')).values(
+            balance=accounts.c.balance + bindparam('interest')
+        ),
+        [{'account_id': rows[i].id, 'interest': float(interest[i])} for i in due]
+    )
+    db.session.execute(insert(SavingsTransaction), [{
+        'account_id': rows[i].id,
+        'transaction_type': 'interest',
+        'amount': float(interest[i]),
+        'transaction_date': as_of,
+        'balance_after': float(balance_after[i]),
+        'notes': f'Intérêts {"composés" if method == "compound" else "simples"} calculés pour {int(months[i])} mois'
+    } for i in due])
+    # Bulk statements bypass the flush hooks
+    schedule_summary_refresh(owners(account_ids=[rows[i].id for i in due]))
+    result.accounts_credited += len(due)
+    result.total_interest += float(interest[due].sum())
+
+
+def accrue_interest(as_of=None, chunk_size=5000, account_ids=None):
+    """Post the interest earned since the last posting on every active account.
+
+    Accounts are processed in primary-key chunks, each locked and
+    committed on its own. An interest transaction is dated ``as_of``, so
+    running again for the same period finds less than a month elapsed
+    and posts nothing; an interrupted run resumes where it stopped.
+    """
+    started = time.perf_counter()
+    as_of = as_of or datetime.now()
+    acquire_job_lock('savings_interest')
+    method = interest_method()
+    result = AccrualResult(as_of, method)
+
+    last_id = 0
+    while True:
+        statement = select(
+            SavingsAccount.id, SavingsAccount.balance, SavingsAccount.interest_rate, SavingsAccount.opening_date
+        ).where(SavingsAccount.status == 'active', SavingsAccount.id > last_id)
+        if account_ids is not None:
+            statement = statement.where(SavingsAccount.id.in_(account_ids))
+        rows = db.session.execute(statement.order_by(SavingsAccount.id).limit(chunk_size).with_for_update()).all()
+        if not rows:
+            break
+        _accrue_chunk(rows, as_of, method, result)
+        last_id = rows[-1].id
+        if result.accounts_credited:
+            # Bulk statements bypass the flush hooks
+            invalidate_snapshot()
+        db.session.commit()
+        acquire_job_lock('savings_interest')
+    db.session.commit()
+
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+@click.command('accrue-savings-interest')
+@click.option('--as-of', 'as_of', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Date de fin de période (défaut: maintenant).')
+@click.option('--chunk-size', type=int, default=5000)
+@with_appcontext
+def accrue_savings_interest_command(as_of, chunk_size):
+    """Calcule et verse les intérêts de tous les comptes d'épargne actifs."""
+    result = accrue_interest(as_of, chunk_size)
+    click.echo(
+        f'{result.accounts_credited}/{result.accounts_scanned} compte(s) crédité(s), '
+        f'{result.total_interest:.2f} d\'intérêts ({result.method}) en {result.elapsed:.2f}s '
+        f'({result.accounts_per_second:.0f} comptes/s)'
+    )
@@ -0,0 +1,54 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from models import db, JobLock
+
+logger = logging.getLogger(__name__)
+
+
+def acquire_job_lock(name):
+    """Serialize a batch job across workers for the current transaction.
+
+    The job's row in ``job_locks`` is read with ``SELECT ... FOR UPDATE``;
+    a second worker blocks there until the first one commits, and then
+    sees everything the first one wrote. The lock is released by the
+    caller's commit or rollback.
+    """
+    lock = JobLock.query.filter_by(name=name).with_for_update().first()
+    if lock is None:
+        try:
+            db.session.add(JobLock(name=name))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+        lock = JobLock.query.filter_by(name=name).with_for_update().one()
+    lock.last_run_at = datetime.utcnow()
+    return lock
+
+
+def start_periodic_job(app, name, interval, func):
+    """Run ``func`` every ``interval`` seconds in a daemon thread of this process.
+
+    Jobs started this way must be idempotent: every worker process runs
+    its own thread, and ``acquire_job_lock`` keeps them from overlapping.
+    """
+    if not interval or interval <= 0:
+        return None
+
+    def run():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    func()
+                except Exception:
+                    logger.exception('Periodic job %s failed', name)
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+    thread = threading.Thread(target=run, name=f'job-{name}', daemon=True)
+    thread.start()
+    return thread
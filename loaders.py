@@ -0,0 +1,39 @@
+"""Eager-loading strategies, declared once per kind of page.
+
+Each constant is a tuple of loader options meant for ``query.options(*...)``
+and covers every relationship the matching template walks, so rendering
+never falls back to a per-row lazy load.
+"""
+from sqlalchemy.orm import configure_mappers, joinedload, selectinload
+from models import Client, Credit, SavingsAccount, AuditLog, ClientInteraction
+
+# Backref attributes such as Credit.client only exist once the mappers are configured
+configure_mappers()
+
+# Lists and exports: one row per credit/account showing its client and product
+CREDIT_ROW = (joinedload(Credit.client), joinedload(Credit.product))
+SAVINGS_ROW = (joinedload(SavingsAccount.client), joinedload(SavingsAccount.product))
+
+CLIENT_DETAIL = (
+    selectinload(Client.credits),
+    selectinload(Client.savings_accounts),
+    selectinload(Client.interactions).joinedload(ClientInteraction.user)
+)
+
+CREDIT_DETAIL = (
+    joinedload(Credit.client),
+    joinedload(Credit.product),
+    selectinload(Credit.payments),
+    selectinload(Credit.payment_schedule)
+)
+
+SAVINGS_DETAIL = (
+    joinedload(SavingsAccount.client),
+    joinedload(SavingsAccount.product),
+    selectinload(SavingsAccount.transactions)
+)
+
+# Client credit history reads each credit's product and overdue installments
+CREDIT_HISTORY_ROW = (joinedload(Credit.product), selectinload(Credit.payment_schedule))
+
+AUDIT_ROW = (joinedload(AuditLog.user),)
@@ -0,0 +1,200 @@
+import heapq
+import hmac
+import logging
+import threading
+import time
+from bisect import bisect_left
+from flask import current_app, g, has_request_context, request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from database import pool_stats
+
+slow_logger = logging.getLogger('slow_requests')
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds of the histogram buckets
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_lock = threading.Lock()
+_endpoints = {}
+
+
+class _Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class _EndpointMetrics:
+    def __init__(self):
+        self.duration = _Histogram(SECONDS_BUCKETS)
+        self.sql_duration = _Histogram(SECONDS_BUCKETS)
+        self.statements = _Histogram(STATEMENT_BUCKETS)
+        self.rows = 0
+        self.slow = 0
+
+
+class _RequestMetrics:
+    __slots__ = ('started', 'statements', 'sql_seconds', 'rows', 'slowest', 'keep')
+
+    def __init__(self, keep):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.slowest = []
+        self.keep = keep
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'request_metrics' in g:
+        context.metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _end_statement(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, 'metrics_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    metrics = g.get('request_metrics')
+    if metrics is None:
+        return
+    metrics.statements += 1
+    metrics.sql_seconds += elapsed
+    # Rows returned by a SELECT (buffered MySQL cursors) or affected by a write; SQLite reports -1 for reads
+    if cursor.rowcount > 0:
+        metrics.rows += cursor.rowcount
+    if metrics.keep:
+        entry = (elapsed, metrics.statements, statement)
+        if len(metrics.slowest) < metrics.keep:
+            heapq.heappush(metrics.slowest, entry)
+        else:
+            heapq.heappushpop(metrics.slowest, entry)
+
+
+def _record(endpoint, metrics, elapsed, slow):
+    with _lock:
+        entry = _endpoints.get(endpoint)
+        if entry is None:
+            entry = _endpoints[endpoint] = _EndpointMetrics()
+        entry.duration.observe(elapsed)
+        entry.sql_duration.observe(metrics.sql_seconds)
+        entry.statements.observe(metrics.statements)
+        entry.rows += metrics.rows
+        entry.slow += slow
+
+
+def init_metrics(app):
+    """Time every request and its SQL statements, per endpoint.
+
+    Requests slower than ``SLOW_REQUEST_THRESHOLD`` seconds are logged to
+    the ``slow_requests`` logger (or ``SLOW_REQUEST_LOG``) with their
+    ``SLOW_REQUEST_STATEMENTS`` slowest statements.
+    """
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    if app.config.get('SLOW_REQUEST_LOG') and not slow_logger.handlers:
+        handler = logging.FileHandler(app.config['SLOW_REQUEST_LOG'], encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        slow_logger.addHandler(handler)
+        slow_logger.setLevel(logging.INFO)
+
+    @app.before_request
+    def _start_request():
+        g.request_metrics = _RequestMetrics(current_app.config.get('SLOW_REQUEST_STATEMENTS', 3))
+
+    @app.teardown_request
+    def _finish_request(exc):
+        metrics = g.pop('request_metrics', None)
+        if metrics is None or request.endpoint == 'static':
+            return
+        elapsed = time.perf_counter() - metrics.started
+        threshold = current_app.config.get('SLOW_REQUEST_THRESHOLD', 1.0)
+        slow = bool(threshold) and elapsed >= threshold
+        endpoint = request.endpoint or 'unmatched'
+        _record(endpoint, metrics, elapsed, slow)
+        if slow:
+            lines = [f'{request.method} {request.full_path.rstrip("?")} ({endpoint}) {elapsed * 1000:.0f} ms, '
+                     f'{metrics.statements} requête(s) SQL en {metrics.sql_seconds * 1000:.0f} ms, {metrics.rows} ligne(s)']
+            for seconds, position, statement in sorted(metrics.slowest, reverse=True):
+                lines.append(f'  #{position} {seconds * 1000:.1f} ms : {" ".join(statement.split())[:500]}')
+            slow_logger.warning('\n'.join(lines))
+
+
+def metrics_authorized():
+    """Admins, or a scraper sending ``Authorization: Bearer <METRICS_TOKEN>``."""
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    return current_user.is_authenticated and current_user.role == 'administrateur'
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _histogram_lines(name, help_text, histograms):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for endpoint, histogram in histograms:
+        labels = f'endpoint="{_label(endpoint)}"'
+        cumulative = 0
+        for bound, count in zip(histogram.bounds + ('+Inf',), histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+        lines.append(f'{name}_count{{{labels}}} {cumulative}')
+    return lines
+
+
+def _counter_lines(name, help_text, kind, samples):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    lines.extend(f'{name}{{{labels}}} {value}' for labels, value in samples)
+    return lines
+
+
+def render_metrics():
+    """Metrics of this worker process in the Prometheus text format."""
+    with _lock:
+        snapshot = sorted(
+            (endpoint, (_copy(entry.duration), _copy(entry.sql_duration), _copy(entry.statements), entry.rows, entry.slow))
+            for endpoint, entry in _endpoints.items()
+        )
+    lines = []
+    lines += _histogram_lines('http_request_duration_seconds', 'Wall time of the request.',
+                              [(endpoint, values[0]) for endpoint, values in snapshot])
+    lines += _histogram_lines('http_request_sql_duration_seconds', 'Time spent executing SQL during the request.',
+                              [(endpoint, values[1]) for endpoint, values in snapshot])
+    lines += _histogram_lines('http_request_sql_statements', 'SQL statements executed by the request.',
+                              [(endpoint, values[2]) for endpoint, values in snapshot])
+    lines += _counter_lines('http_request_sql_rows_total', 'Rows reported by the database driver.', 'counter',
+                            [(f'endpoint="{_label(endpoint)}"', values[3]) for endpoint, values in snapshot])
+    lines += _counter_lines('http_slow_requests_total', 'Requests over SLOW_REQUEST_THRESHOLD.', 'counter',
+                            [(f'endpoint="{_label(endpoint)}"', values[4]) for endpoint, values in snapshot])
+
+    pools = [(f'bind="{_label(bind)}"', stats) for bind, stats in pool_stats().items() if 'checkouts' in stats]
+    for name, key, kind, help_text in (
+        ('db_pool_checkouts_total', 'checkouts', 'counter', 'Connections taken from the pool.'),
+        ('db_pool_wait_seconds_total', 'wait_total', 'counter', 'Time spent waiting for a pooled connection.'),
+        ('db_pool_wait_seconds_max', 'wait_max', 'gauge', 'Longest wait for a pooled connection.'),
+        ('db_pool_timeouts_total', 'timeouts', 'counter', 'Checkouts that gave up after DB_POOL_TIMEOUT.'),
+        ('db_pool_checked_out', 'checked_out', 'gauge', 'Connections currently in use.'),
+    ):
+        lines += _counter_lines(name, help_text, kind, [(labels, stats[key]) for labels, stats in pools])
+    return '\n'.join(lines) + '\n'
+
+
+def _copy(histogram):
+    copy = _Histogram(histogram.bounds)
+    copy.counts = list(histogram.counts)
+    copy.sum = histogram.sum
+    return copy
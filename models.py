@@ -4,11 +4,12 @@ from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
+from database import RoutingSession
 
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -28,6 +29,7 @@ class User(UserMixin, db.Model):
 
 class Client(db.Model):
     __tablename__ = 'clients'
+    __table_args__ = (db.Index('ix_clients_created_at_id', 'created_at', 'id'),)
 
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.String(20), unique=True, nullable=False)
@@ -45,10 +47,34 @@ class Client(db.Model):
     
     credits = db.relationship('Credit', backref='client', lazy=True, cascade='all, delete-orphan')
     savings_accounts = db.relationship('SavingsAccount', backref='client', lazy=True, cascade='all, delete-orphan')
+    location = db.relationship('ClientLocation', backref='client', uselist=False, cascade='all, delete-orphan')
     
     @property
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
+    
+    @property
+    def latitude(self):
+        return self.location.latitude if self.location else None
+    
+    @latitude.setter
+    def latitude(self, value):
+        self._set_coordinate('latitude', value)
+    
+    @property
+    def longitude(self):
+        return self.location.longitude if self.location else None
+    
+    @longitude.setter
+    def longitude(self, value):
+        self._set_coordinate('longitude', value)
+    
+    def _set_coordinate(self, name, value):
+        if self.location is None:
+            if value is None:
+                return
+            self.location = ClientLocation()
+        setattr(self.location, name, value)
 
 class Product(db.Model):
     __tablename__ = 'products'
@@ -70,6 +96,7 @@ class Product(db.Model):
 
 class Credit(db.Model):
     __tablename__ = 'credits'
+    __table_args__ = (db.Index('ix_credits_application_date_id', 'application_date', 'id'),)
     
     id = db.Column(db.Integer, primary_key=True)
     credit_number = db.Column(db.String(20), unique=True, nullable=False)
@@ -110,6 +137,7 @@ class Credit(db.Model):
 
 class CreditPayment(db.Model):
     __tablename__ = 'credit_payments'
+    __table_args__ = (db.Index('ix_credit_payments_method_reference', 'payment_method', 'reference'),)
     
     id = db.Column(db.Integer, primary_key=True)
     credit_id = db.Column(db.Integer, db.ForeignKey('credits.id'), nullable=False)
@@ -121,6 +149,7 @@ class CreditPayment(db.Model):
 
 class SavingsAccount(db.Model):
     __tablename__ = 'savings_accounts'
+    __table_args__ = (db.Index('ix_savings_accounts_opening_date_id', 'opening_date', 'id'),)
     
     id = db.Column(db.Integer, primary_key=True)
     account_number = db.Column(db.String(20), unique=True, nullable=False)
@@ -149,6 +178,7 @@ class SavingsTransaction(db.Model):
 
 class PaymentSchedule(db.Model):
     __tablename__ = 'payment_schedule'
+    __table_args__ = (db.Index('ix_payment_schedule_credit_paid_due', 'credit_id', 'paid', 'due_date'),)
     
     id = db.Column(db.Integer, primary_key=True)
     credit_id = db.Column(db.Integer, db.ForeignKey('credits.id'), nullable=False)
@@ -206,6 +236,7 @@ class SystemSettings(db.Model):
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
+    __table_args__ = (db.Index('ix_notifications_related_type_read', 'related_entity_type', 'related_entity_id', 'notification_type', 'is_read'),)
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
@@ -234,3 +265,188 @@ class CreditDocument(db.Model):
     
     credit = db.relationship('Credit', backref='documents')
     uploader = db.relationship('User', backref='uploaded_documents')
+
+class KpiSnapshot(db.Model):
+    __tablename__ = 'kpi_snapshots'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    stale = db.Column(db.Boolean, default=False, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    invalidated_at = db.Column(db.DateTime)
+
+class JobLock(db.Model):
+    __tablename__ = 'job_locks'
+    
+    name = db.Column(db.String(100), primary_key=True)
+    last_run_at = db.Column(db.DateTime)
+
+class IdCounter(db.Model):
+    __tablename__ = 'id_counters'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class CacheVersion(db.Model):
+    __tablename__ = 'cache_versions'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class MonthlySummary(db.Model):
+    __tablename__ = 'monthly_summaries'
+    
+    month = db.Column(db.Date, primary_key=True)
+    credits_count = db.Column(db.Integer, nullable=False, default=0)
+    credits_amount = db.Column(db.Float, nullable=False, default=0)
+    payments_count = db.Column(db.Integer, nullable=False, default=0)
+    payments_amount = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ClientSearchTerm(db.Model):
+    __tablename__ = 'client_search_terms'
+    __table_args__ = (db.Index('ix_client_search_terms_term_client', 'term', 'client_id'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    client_id = db.Column(db.Integer, db.ForeignKey('clients.id', ondelete='CASCADE'), nullable=False, index=True)
+    term = db.Column(db.String(120), nullable=False)
+
+class ClientSearchTrigram(db.Model):
+    __tablename__ = 'client_search_trigrams'
+    __table_args__ = (db.Index('ix_client_search_trigrams_trigram_client', 'trigram', 'client_id'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    client_id = db.Column(db.Integer, db.ForeignKey('clients.id', ondelete='CASCADE'), nullable=False, index=True)
+    trigram = db.Column(db.String(3), nullable=False)
+
+class PenaltyRun(db.Model):
+    __tablename__ = 'penalty_runs'
+    
+    as_of = db.Column(db.Date, primary_key=True)
+    penalty_rate = db.Column(db.Float, nullable=False)
+    grace_days = db.Column(db.Integer, nullable=False)
+    credits_updated = db.Column(db.Integer, nullable=False, default=0)
+    total_penalty = db.Column(db.Float, nullable=False, default=0)
+    computed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class ClientScore(db.Model):
+    __tablename__ = 'client_scores'
+    
+    client_id = db.Column(db.Integer, db.ForeignKey('clients.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+    total_credits = db.Column(db.Integer, nullable=False, default=0)
+    completed_credits = db.Column(db.Integer, nullable=False, default=0)
+    repayment_points = db.Column(db.Float, nullable=False, default=0)
+    overdue_installments = db.Column(db.Integer, nullable=False, default=0)
+    stale = db.Column(db.Boolean, nullable=False, default=False)
+    computed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    invalidated_at = db.Column(db.DateTime)
+
+class MobilePayment(db.Model):
+    __tablename__ = 'mobile_payments'
+    __table_args__ = (db.Index('ix_mobile_payments_status_next_attempt', 'status', 'next_attempt_at'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    account_id = db.Column(db.Integer, db.ForeignKey('savings_accounts.id'), nullable=False, index=True)
+    transaction_type = db.Column(db.String(20), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    payment_method = db.Column(db.String(50), nullable=False)
+    reference = db.Column(db.String(100))
+    notes = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, processing, confirmed, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    gateway_reference = db.Column(db.String(100))
+    last_error = db.Column(db.String(255))
+    transaction_id = db.Column(db.Integer, db.ForeignKey('savings_transactions.id'))
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+    
+    account = db.relationship('SavingsAccount', backref='mobile_payments')
+
+class ClientLocation(db.Model):
+    __tablename__ = 'client_locations'
+    __table_args__ = (db.Index('ix_client_locations_geohash', 'geohash'),)
+    
+    client_id = db.Column(db.Integer, db.ForeignKey('clients.id', ondelete='CASCADE'), primary_key=True)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    geohash = db.Column(db.String(12), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ClientSummary(db.Model):
+    __tablename__ = 'client_summaries'
+    __table_args__ = (
+        db.Index('ix_client_summaries_active_completed', 'active_credits', 'completed_credits'),
+        db.Index('ix_client_summaries_total_borrowed', 'total_borrowed'),
+    )
+    
+    client_id = db.Column(db.Integer, db.ForeignKey('clients.id', ondelete='CASCADE'), primary_key=True)
+    total_credits = db.Column(db.Integer, nullable=False, default=0)
+    active_credits = db.Column(db.Integer, nullable=False, default=0)
+    completed_credits = db.Column(db.Integer, nullable=False, default=0)
+    total_borrowed = db.Column(db.Float, nullable=False, default=0)
+    total_repaid = db.Column(db.Float, nullable=False, default=0)
+    current_debt = db.Column(db.Float, nullable=False, default=0)
+    savings_balance = db.Column(db.Float, nullable=False, default=0)
+    last_activity_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class SummaryRefresh(db.Model):
+    __tablename__ = 'summary_refresh_queue'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    client_id = db.Column(db.Integer, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class ClientImport(db.Model):
+    __tablename__ = 'client_imports'
+
+    id = db.Column(db.Integer, primary_key=True)
+    file_name = db.Column(db.String(255), nullable=False)
+    file_digest = db.Column(db.String(64), unique=True, nullable=False)  # SHA-256 of the file
+    status = db.Column(db.String(20), nullable=False, default='running')  # running, completed
+    rows_processed = db.Column(db.Integer, nullable=False, default=0)  # last source line committed
+    imported = db.Column(db.Integer, nullable=False, default=0)
+    rejected = db.Column(db.Integer, nullable=False, default=0)
+    report_path = db.Column(db.String(500))
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+
+class SettlementFile(db.Model):
+    __tablename__ = 'settlement_files'
+    __table_args__ = (db.Index('ix_settlement_files_created_at_id', 'created_at', 'id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    provider = db.Column(db.String(50), nullable=False)  # wave, orange_money
+    file_name = db.Column(db.String(255), nullable=False)
+    file_digest = db.Column(db.String(64), unique=True, nullable=False)  # SHA-256 of the file
+    lines_total = db.Column(db.Integer, nullable=False, default=0)
+    lines_posted = db.Column(db.Integer, nullable=False, default=0)
+    lines_unmatched = db.Column(db.Integer, nullable=False, default=0)
+    amount_posted = db.Column(db.Float, nullable=False, default=0)
+    credits_completed = db.Column(db.Integer, nullable=False, default=0)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    creator = db.relationship('User')
+    lines = db.relationship('SettlementLine', backref='settlement_file', lazy=True, cascade='all, delete-orphan')
+
+class SettlementLine(db.Model):
+    # Lines of a settlement file that could not be posted, kept for manual follow-up
+    __tablename__ = 'settlement_lines'
+
+    id = db.Column(db.Integer, primary_key=True)
+    settlement_file_id = db.Column(db.Integer, db.ForeignKey('settlement_files.id', ondelete='CASCADE'), nullable=False, index=True)
+    line_number = db.Column(db.Integer, nullable=False)
+    transaction_reference = db.Column(db.String(100))
+    reference = db.Column(db.String(255))
+    amount = db.Column(db.Float)
+    paid_at = db.Column(db.DateTime)
+    reason = db.Column(db.String(255), nullable=False)
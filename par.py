@@ -0,0 +1,133 @@
+from datetime import date, datetime
+from sqlalchemy import Date, bindparam, case, func, select
+from penalties import day_number
+from models import db, Credit, PaymentSchedule, Product
+
+# (key, label, first day, last day) of each aging bucket
+PAR_BUCKETS = (
+    ('1_30', '1-30 jours', 1, 30),
+    ('31_60', '31-60 jours', 31, 60),
+    ('61_90', '61-90 jours', 61, 90),
+    ('90_plus', '90+ jours', 91, None),
+)
+
+
+def _empty_buckets():
+    return {key: {'credits': 0, 'outstanding': 0.0, 'overdue_amount': 0.0} for key, _, _, _ in PAR_BUCKETS}
+
+
+class PortfolioAtRisk:
+    """Aging of the active portfolio, overall, by product and by disbursement month."""
+
+    def __init__(self, as_of, buckets, by_product, by_month, active_credits, active_outstanding):
+        self.as_of = as_of
+        self.buckets = buckets
+        self.by_product = by_product
+        self.by_month = by_month
+        self.active_credits = active_credits
+        self.active_outstanding = active_outstanding
+
+    @property
+    def labels(self):
+        return [(key, label) for key, label, _, _ in PAR_BUCKETS]
+
+    @property
+    def at_risk_credits(self):
+        return sum(bucket['credits'] for bucket in self.buckets.values())
+
+    @property
+    def at_risk_outstanding(self):
+        return sum(bucket['outstanding'] for bucket in self.buckets.values())
+
+    def ratio(self, from_key='1_30'):
+        """PAR ratio (%) of outstanding in ``from_key`` and every later bucket, e.g. ``ratio('31_60')`` is PAR30."""
+        keys = [key for key, _, _, _ in PAR_BUCKETS]
+        at_risk = sum(self.buckets[key]['outstanding'] for key in keys[keys.index(from_key):])
+        return at_risk / self.active_outstanding * 100 if self.active_outstanding else 0
+
+
+def _bucket_expression(days_late):
+    return case(*[
+        (days_late <= last, key) for key, _, _, last in PAR_BUCKETS if last is not None
+    ], else_=PAR_BUCKETS[-1][0])
+
+
+def portfolio_at_risk(as_of=None):
+    """Compute the PAR report with one aggregate over unpaid past-due installments.
+
+    A credit's age is the number of days since its oldest unpaid due
+    date; its whole outstanding balance (total due minus paid) falls in
+    that bucket. The inner query reduces installments to one row per
+    late credit, the outer one groups those by bucket, product and
+    disbursement month, so the work stays in the database whatever the
+    size of ``payment_schedule``.
+    """
+    as_of = as_of or datetime.now().date()
+    as_of_day = day_number(bindparam('par_as_of', as_of, type_=Date))
+
+    late = select(
+        Credit.id.label('credit_id'),
+        Credit.product_id.label('product_id'),
+        func.extract('year', Credit.disbursement_date).label('year'),
+        func.extract('month', Credit.disbursement_date).label('month'),
+        (Credit.total_amount - Credit.amount_paid).label('outstanding'),
+        func.sum(PaymentSchedule.expected_amount - func.coalesce(PaymentSchedule.paid_amount, 0)).label('overdue_amount'),
+        (as_of_day - func.min(day_number(PaymentSchedule.due_date))).label('days_late')
+    ).join(PaymentSchedule, PaymentSchedule.credit_id == Credit.id).where(
+        Credit.status == 'active',
+        PaymentSchedule.paid == False,
+        PaymentSchedule.due_date < as_of
+    ).group_by(
+        Credit.id, Credit.product_id, Credit.disbursement_date, Credit.total_amount, Credit.amount_paid
+    ).subquery()
+
+    bucket = _bucket_expression(late.c.days_late)
+    rows = db.session.execute(
+        select(
+            bucket.label('bucket'),
+            late.c.product_id,
+            late.c.year,
+            late.c.month,
+            func.count(),
+            func.sum(late.c.outstanding),
+            func.sum(late.c.overdue_amount)
+        ).group_by(bucket, late.c.product_id, late.c.year, late.c.month)
+    ).all()
+
+    product_names = dict(db.session.query(Product.id, Product.name).filter(Product.product_type == 'credit'))
+    active_by_product = {
+        product_id: (count, float(outstanding or 0))
+        for product_id, count, outstanding in db.session.query(
+            Credit.product_id, func.count(Credit.id), func.sum(Credit.total_amount - Credit.amount_paid)
+        ).filter(Credit.status == 'active').group_by(Credit.product_id)
+    }
+
+    buckets = _empty_buckets()
+    by_product = {}
+    by_month = {}
+    for key, product_id, year, month, count, outstanding, overdue_amount in rows:
+        values = (count, float(outstanding or 0), float(overdue_amount or 0))
+        month_key = date(int(year), int(month), 1) if year else None
+        product = by_product.setdefault(product_id, {
+            'name': product_names.get(product_id, f'#{product_id}'),
+            'active_credits': active_by_product.get(product_id, (0, 0.0))[0],
+            'active_outstanding': active_by_product.get(product_id, (0, 0.0))[1],
+            'buckets': _empty_buckets()
+        })
+        for target in (buckets, product['buckets'], by_month.setdefault(month_key, _empty_buckets())):
+            target[key]['credits'] += values[0]
+            target[key]['outstanding'] += values[1]
+            target[key]['overdue_amount'] += values[2]
+
+    for product in by_product.values():
+        at_risk = sum(bucket['outstanding'] for bucket in product['buckets'].values())
+        product['ratio'] = at_risk / product['active_outstanding'] * 100 if product['active_outstanding'] else 0
+
+    return PortfolioAtRisk(
+        as_of,
+        buckets,
+        sorted(by_product.values(), key=lambda product: product['name']),
+        [dict(month=month, buckets=values) for month, values in sorted(by_month.items(), key=lambda item: item[0] or date.min)],
+        sum(count for count, _ in active_by_product.values()),
+        sum(outstanding for _, outstanding in active_by_product.values())
+    )
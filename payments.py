@@ -0,0 +1,352 @@
+import importlib
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import update, or_
+from models import db, SavingsAccount, SavingsTransaction, MobilePayment
+
+logger = logging.getLogger(__name__)
+
+MOBILE_MONEY_METHODS = ('wave', 'orange_money')
+FINAL_STATUSES = ('confirmed', 'failed')
+STATUS_LABELS = {
+    'pending': 'En attente',
+    'processing': 'En cours',
+    'confirmed': 'Confirmée',
+    'failed': 'Échouée'
+}
+
+
+class GatewayError(Exception):
+    """Transient gateway failure; the payment is retried."""
+
+
+class GatewayTimeout(GatewayError):
+    pass
+
+
+class GatewayDeclined(Exception):
+    """Definitive refusal by the operator; the payment fails without retry."""
+
+
+class GatewayResult:
+    def __init__(self, status, reference=None, message=None):
+        self.status = status  # 'confirmed', or 'pending' while the customer has not validated yet
+        self.reference = reference
+        self.message = message
+
+
+class PaymentGateway(ABC):
+    """Interface of a mobile-money operator.
+
+    ``submit`` must be idempotent on ``key``: a retry after a timeout
+    sends the same key and must not move the money twice. ``status`` is
+    called for payments the operator reported as pending.
+    """
+
+    @abstractmethod
+    def submit(self, payment, key, timeout):
+        pass
+
+    @abstractmethod
+    def status(self, payment, timeout):
+        pass
+
+
+class StubGateway(PaymentGateway):
+    """Local gateway for development and tests, steered by the payment reference.
+
+    A reference containing ``DECLINE`` is refused, ``RETRY`` fails on the
+    first attempt and ``TIMEOUT`` never answers in time. Everything else
+    is confirmed after ``PAYMENT_STUB_DELAY`` seconds.
+    """
+
+    def __init__(self, delay=None):
+        self.delay = current_app.config.get('PAYMENT_STUB_DELAY', 0.5) if delay is None else delay
+
+    def _answer(self, payment, key, timeout):
+        reference = (payment.reference or '').upper()
+        if 'TIMEOUT' in reference or self.delay > timeout:
+            time.sleep(timeout)
+            raise GatewayTimeout(f'Pas de réponse après {timeout}s')
+        time.sleep(self.delay)
+        if 'DECLINE' in reference:
+            raise GatewayDeclined('Transaction refusée par l\'opérateur')
+        if 'RETRY' in reference and payment.attempts <= 1:
+            raise GatewayError('Opérateur indisponible')
+        return GatewayResult('confirmed', f'STUB-{key}')
+
+    def submit(self, payment, key, timeout):
+        return self._answer(payment, key, timeout)
+
+    def status(self, payment, timeout):
+        return self._answer(payment, payment.gateway_reference, timeout)
+
+
+GATEWAYS = {'stub': StubGateway}
+
+_gateway_lock = threading.Lock()
+_gateways = {}
+
+
+def get_gateway():
+    """Gateway named by ``PAYMENT_GATEWAY``: a key of ``GATEWAYS`` or ``'package.module:Class'``."""
+    spec = current_app.config.get('PAYMENT_GATEWAY', 'stub')
+    with _gateway_lock:
+        gateway = _gateways.get(spec)
+        if gateway is None:
+            if spec in GATEWAYS:
+                gateway_class = GATEWAYS[spec]
+            else:
+                module_name, _, class_name = spec.partition(':')
+                gateway_class = getattr(importlib.import_module(module_name), class_name)
+            gateway = _gateways[spec] = gateway_class()
+    return gateway
+
+
+def create_mobile_payment(account, transaction_type, amount, payment_method, reference=None, notes=None, user_id=None):
+    """Record a mobile-money operation as pending; the balance moves only once the gateway confirms."""
+    payment = MobilePayment(
+        account_id=account.id,
+        transaction_type=transaction_type,
+        amount=amount,
+        payment_method=payment_method,
+        reference=reference,
+        notes=notes,
+        status='pending',
+        next_attempt_at=datetime.utcnow(),
+        created_by=user_id
+    )
+    db.session.add(payment)
+    return payment
+
+
+def _claim(payment_id, now):
+    """Move a due payment to 'processing'; returns the attempt number claimed, or None when another worker got it first.
+
+    The first claim of a withdrawal also reserves its amount, in the same
+    transaction, so the operator never pays out more than the balance; a
+    withdrawal the balance does not cover fails without reaching the operator.
+    """
+    claimed = db.session.execute(
+        update(MobilePayment).where(
+            MobilePayment.id == payment_id,
+            MobilePayment.status == 'pending'
+        ).values(
+            status='processing',
+            attempts=MobilePayment.attempts + 1,
+            updated_at=now
+        ).execution_options(synchronize_session=False)
+    ).rowcount == 1
+    attempt = None
+    if claimed:
+        payment = db.session.get(MobilePayment, payment_id, populate_existing=True)
+        attempt = payment.attempts
+        if payment.transaction_type == 'withdrawal' and attempt == 1 and not _reserve(payment):
+            _fail(payment, now, 'Solde insuffisant pour ce retrait', release=False)
+    db.session.commit()
+    return attempt
+
+
+def _reserve(payment):
+    """Debit a withdrawal before it is sent to the operator; False when the balance does not cover it."""
+    return db.session.execute(
+        update(SavingsAccount).where(
+            SavingsAccount.id == payment.account_id,
+            SavingsAccount.balance >= payment.amount
+        ).values(balance=SavingsAccount.balance - payment.amount).execution_options(synchronize_session=False)
+    ).rowcount == 1
+
+
+def _release(payment):
+    """Credit back the amount reserved by a withdrawal that will not be paid out."""
+    db.session.execute(
+        update(SavingsAccount).where(
+            SavingsAccount.id == payment.account_id
+        ).values(balance=SavingsAccount.balance + payment.amount).execution_options(synchronize_session=False)
+    )
+
+
+def _settle(payment, now):
+    account = SavingsAccount.query.filter_by(id=payment.account_id).with_for_update().populate_existing().one()
+    if account.status != 'active':
+        return _fail(payment, now, 'Compte clôturé')
+    # A withdrawal was already debited when it was claimed
+    if payment.transaction_type != 'withdrawal':
+        account.balance += payment.amount
+
+    transaction = SavingsTransaction(
+        account_id=account.id,
+        transaction_type=payment.transaction_type,
+        amount=payment.amount,
+        transaction_date=now,
+        balance_after=account.balance,
+        payment_method=payment.payment_method,
+        reference=payment.reference or payment.gateway_reference,
+        notes=payment.notes
+    )
+    db.session.add(transaction)
+    db.session.flush()
+    payment.transaction_id = transaction.id
+    payment.status = 'confirmed'
+    payment.last_error = None
+    payment.completed_at = now
+
+
+def _fail(payment, now, message, release=True):
+    if release and payment.transaction_type == 'withdrawal':
+        _release(payment)
+    payment.status = 'failed'
+    payment.last_error = message[:255]
+    payment.completed_at = now
+
+
+def _retry(payment, now, message):
+    config = current_app.config
+    expired = (now - payment.created_at).total_seconds() > config.get('PAYMENT_EXPIRY', 900)
+    if payment.attempts >= config.get('PAYMENT_MAX_ATTEMPTS', 5) or expired:
+        return _fail(payment, now, f'Abandon après {payment.attempts} tentative(s): {message}')
+    payment.status = 'pending'
+    payment.last_error = message[:255]
+    payment.next_attempt_at = now + timedelta(seconds=config.get('PAYMENT_RETRY_BACKOFF', 5) * 2 ** (payment.attempts - 1))
+
+
+def process_payment(payment_id):
+    """Run one attempt for a due payment; returns its new status or None if it was not claimed."""
+    attempt = _claim(payment_id, datetime.utcnow())
+    if attempt is None:
+        return None
+    payment = db.session.get(MobilePayment, payment_id)
+    if payment.status != 'processing':
+        return payment.status
+    timeout = current_app.config.get('PAYMENT_GATEWAY_TIMEOUT', 10)
+    gateway = get_gateway()
+
+    # No row lock is held while waiting for the operator
+    try:
+        if payment.gateway_reference:
+            result = gateway.status(payment, timeout)
+        else:
+            result = gateway.submit(payment, f'MP{payment.id}', timeout)
+        error = None
+    except (GatewayDeclined, GatewayError) as exc:
+        result, error = None, exc
+    except Exception as exc:
+        logger.exception('Gateway call failed for mobile payment %s', payment_id)
+        result, error = None, GatewayError(str(exc) or exc.__class__.__name__)
+
+    now = datetime.utcnow()
+    payment = MobilePayment.query.filter_by(id=payment_id).with_for_update().populate_existing().one()
+    if payment.status != 'processing' or payment.attempts != attempt:
+        # Put back in the queue while this worker stalled and claimed again by another one
+        logger.warning('Mobile payment %s: attempt %s lost its claim, result discarded', payment_id, attempt)
+        db.session.commit()
+        return None
+    if isinstance(error, GatewayDeclined):
+        _fail(payment, now, str(error))
+    elif error is not None:
+        _retry(payment, now, str(error) or error.__class__.__name__)
+    elif result.status == 'confirmed':
+        payment.gateway_reference = result.reference or payment.gateway_reference
+        _settle(payment, now)
+    else:
+        payment.gateway_reference = result.reference or payment.gateway_reference
+        _retry(payment, now, result.message or 'En attente de validation par le client')
+    db.session.commit()
+    return payment.status
+
+
+def process_due_payments(limit=50):
+    """Attempt every payment whose next attempt is due; returns the number processed.
+
+    Payments left in 'processing' by a worker that died are put back in
+    the queue once ``PAYMENT_GATEWAY_TIMEOUT`` has clearly passed.
+    """
+    now = datetime.utcnow()
+    stuck_before = now - timedelta(seconds=current_app.config.get('PAYMENT_GATEWAY_TIMEOUT', 10) * 3)
+    db.session.execute(
+        update(MobilePayment).where(
+            MobilePayment.status == 'processing',
+            MobilePayment.updated_at < stuck_before
+        ).values(status='pending', next_attempt_at=now).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+    due = [payment_id for (payment_id,) in db.session.query(MobilePayment.id).filter(
+        MobilePayment.status == 'pending',
+        or_(MobilePayment.next_attempt_at == None, MobilePayment.next_attempt_at <= now)
+    ).order_by(MobilePayment.next_attempt_at).limit(limit)]
+    db.session.rollback()
+    processed = 0
+    for payment_id in due:
+        if process_payment(payment_id) is not None:
+            processed += 1
+    return processed
+
+
+_wakeup = threading.Event()
+
+
+def notify_payment_worker():
+    """Wake this process's worker so a new payment is attempted right away."""
+    _wakeup.set()
+
+
+def start_payment_worker(app):
+    """Poll for due payments every ``PAYMENT_WORKER_INTERVAL`` seconds in a daemon thread.
+
+    Several processes may run a worker: a payment is only attempted by
+    the worker whose conditional UPDATE claimed it.
+    """
+    interval = app.config.get('PAYMENT_WORKER_INTERVAL', 2)
+    if not interval or interval <= 0:
+        return None
+
+    def run():
+        while True:
+            _wakeup.wait(interval)
+            _wakeup.clear()
+            with app.app_context():
+                try:
+                    process_due_payments()
+                except Exception:
+                    logger.exception('Mobile payment worker failed')
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+    thread = threading.Thread(target=run, name='mobile-payment-worker', daemon=True)
+    thread.start()
+    return thread
+
+
+def payment_status(payment):
+    return {
+        'id': payment.id,
+        'status': payment.status,
+        'status_label': STATUS_LABELS.get(payment.status, payment.status),
+        'final': payment.status in FINAL_STATUSES,
+        'attempts': payment.attempts,
+        'error': payment.last_error,
+        'transaction_id': payment.transaction_id,
+        'balance': payment.account.balance
+    }
+
+
+@click.command('process-mobile-payments')
+@click.option('--every', type=float, default=0, help='Relancer toutes les N secondes (0 = une seule exécution).')
+@with_appcontext
+def process_mobile_payments_command(every):
+    """Traite les paiements Wave / Orange Money en attente."""
+    while True:
+        processed = process_due_payments()
+        if processed or every <= 0:
+            click.echo(f'{processed} paiement(s) traité(s)')
+        if every <= 0:
+            break
+        time.sleep(every)
@@ -0,0 +1,114 @@
+import time
+from datetime import datetime, timedelta
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import Date, Integer, bindparam, func, select, update
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from jobs import acquire_job_lock
+from snapshot import invalidate_snapshot
+from summaries import refresh_debt
+from models import db, Credit, PaymentSchedule, SystemSettings, PenaltyRun
+
+DEFAULT_PENALTY_RATE = 5.0
+DEFAULT_GRACE_DAYS = 3
+
+
+class day_number(FunctionElement):
+    """Day count of a date since a backend-specific epoch; only differences are meaningful."""
+    type = Integer()
+    inherit_cache = True
+
+
+@compiles(day_number)
+def _day_number_mysql(element, compiler, **kw):
+    return 'TO_DAYS(%s)' % compiler.process(element.clauses, **kw)
+
+
+@compiles(day_number, 'sqlite')
+def _day_number_sqlite(element, compiler, **kw):
+    return 'CAST(julianday(%s) AS INTEGER)' % compiler.process(element.clauses, **kw)
+
+
+@compiles(day_number, 'postgresql')
+def _day_number_postgresql(element, compiler, **kw):
+    return "(%s - DATE '2000-01-01')" % compiler.process(element.clauses, **kw)
+
+
+def penalty_settings():
+    """``(rate %, grace days)`` from SystemSettings, with the model defaults when unset."""
+    settings = db.session.query(SystemSettings.penalty_rate, SystemSettings.late_payment_grace_period).first()
+    rate = settings.penalty_rate if settings and settings.penalty_rate is not None else DEFAULT_PENALTY_RATE
+    grace = settings.late_payment_grace_period if settings and settings.late_payment_grace_period is not None else DEFAULT_GRACE_DAYS
+    return rate, grace
+
+
+def penalty_expression(as_of, rate, grace_days):
+    """Correlated SUM of the late penalties of ``Credit`` as of ``as_of``.
+
+    Each unpaid installment more than ``grace_days`` past due costs
+    ``rate`` % of its amount per 30 days late, counted from the due date.
+    """
+    as_of_day = day_number(bindparam('as_of', as_of, type_=Date))
+    days_late = as_of_day - day_number(PaymentSchedule.due_date)
+    return select(func.coalesce(func.round(func.sum(
+        PaymentSchedule.expected_amount * (rate / 100.0) * days_late / 30.0
+    ), 2), 0)).where(
+        PaymentSchedule.credit_id == Credit.id,
+        PaymentSchedule.paid == False,
+        PaymentSchedule.due_date < as_of - timedelta(days=grace_days)
+    ).scalar_subquery()
+
+
+def run_penalties(as_of=None, force=False):
+    """Set ``penalty_amount`` of every active credit as of ``as_of`` with one UPDATE.
+
+    The result only depends on ``as_of``, the settings and the schedule,
+    so re-running is harmless. A run already recorded for the same day
+    and settings is skipped unless ``force`` is set. Returns the
+    ``PenaltyRun`` row.
+    """
+    as_of = as_of or datetime.now().date()
+    acquire_job_lock('penalties')
+    rate, grace_days = penalty_settings()
+
+    run = db.session.get(PenaltyRun, as_of)
+    if run is not None and not force and run.penalty_rate == rate and run.grace_days == grace_days:
+        db.session.commit()
+        return run
+
+    result = db.session.execute(
+        update(Credit).where(Credit.status == 'active').values(
+            penalty_amount=penalty_expression(as_of, rate, grace_days)
+        ).execution_options(synchronize_session=False)
+    )
+    total = db.session.query(func.coalesce(func.sum(Credit.penalty_amount), 0)).filter(Credit.status == 'active').scalar()
+
+    if run is None:
+        run = PenaltyRun(as_of=as_of)
+        db.session.add(run)
+    run.penalty_rate = rate
+    run.grace_days = grace_days
+    run.credits_updated = result.rowcount
+    run.total_penalty = float(total)
+    run.computed_at = datetime.utcnow()
+    # Bulk statements bypass the flush hooks
+    invalidate_snapshot()
+    refresh_debt()
+    db.session.commit()
+    return run
+
+
+def last_penalty_run():
+    return PenaltyRun.query.order_by(PenaltyRun.as_of.desc()).first()
+
+
+@click.command('run-penalties')
+@click.option('--as-of', 'as_of', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Date de calcul (défaut: aujourd\'hui).')
+@click.option('--force', is_flag=True, help='Recalculer même si la date a déjà été traitée.')
+@with_appcontext
+def run_penalties_command(as_of, force):
+    """Recalcule les pénalités de retard de tous les crédits actifs."""
+    started = time.perf_counter()
+    run = run_penalties(as_of.date() if as_of else None, force)
+    click.echo(f'Pénalités au {run.as_of.strftime("%d/%m/%Y")}: {run.credits_updated} crédit(s), total {run.total_penalty:.2f} en {time.perf_counter() - started:.2f}s')
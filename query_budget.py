@@ -0,0 +1,94 @@
+import logging
+from contextlib import contextmanager
+from flask import g, has_app_context, request, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(limit):
+    """Declare the maximum number of SQL statements a view may emit."""
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+class _Counter:
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+
+@contextmanager
+def count_queries():
+    """Count the statements executed inside the block (``with count_queries() as counter``).
+
+    Counters live on ``g``, so only the statements of the current
+    application context (and of the requests it serves) are counted.
+    """
+    counter = _Counter()
+    counters = g.setdefault('query_counters', [])
+    counters.append(counter)
+    try:
+        yield counter
+    finally:
+        counters.remove(counter)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if not has_app_context():
+        return
+    for counter in g.get('query_counters', ()):
+        counter.count += 1
+        counter.statements.append(statement)
+    if 'sql_statements' in g:
+        g.sql_statements.append(statement)
+
+
+def _check(endpoint, limit, statements, enforced):
+    if len(statements) <= limit:
+        return
+    message = f'{endpoint} emitted {len(statements)} SQL statements (budget {limit})'
+    if enforced:
+        raise QueryBudgetExceeded(message + ':\n' + '\n'.join(statements))
+    logger.warning(message)
+
+
+def _checked_stream(body, endpoint, limit, statements, enforced):
+    # The statements list is the request's own, still filled while the body streams
+    yield from body
+    _check(endpoint, limit, statements, enforced)
+
+
+def init_query_budget(app):
+    """Check every request against its view's budget.
+
+    With QUERY_BUDGET_ENFORCED (on by default under TESTING) an overrun
+    raises QueryBudgetExceeded, which fails the test that made the
+    request; otherwise it is only logged. Streamed responses are checked
+    once their body has been sent, so the queries of the generator count.
+    """
+    @app.before_request
+    def _start_counting():
+        g.sql_statements = []
+
+    @app.after_request
+    def _check_budget(response):
+        view = current_app.view_functions.get(request.endpoint)
+        limit = getattr(view, 'query_budget', None)
+        if limit is None:
+            return response
+        statements = g.get('sql_statements', [])
+        enforced = current_app.config.get('QUERY_BUDGET_ENFORCED', current_app.testing)
+        if response.is_streamed:
+            response.response = _checked_stream(response.response, request.endpoint, limit, statements, enforced)
+        else:
+            _check(request.endpoint, limit, statements, enforced)
+        return response
@@ -0,0 +1,116 @@
+import threading
+from flask import g, has_app_context
+from sqlalchemy import event, inspect, select, update, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, make_transient_to_detached
+from models import db, User, Product, SystemSettings, CacheVersion
+
+# Cached set -> models whose writes make it stale
+WATCHED_MODELS = {
+    'settings': (SystemSettings,),
+    'products': (Product,),
+    'users': (User,),
+}
+
+_lock = threading.Lock()
+_cache = {}
+
+
+def _columns(model):
+    return [attr.key for attr in inspect(model).column_attrs]
+
+
+def _versions():
+    """Current version of every cached set, read once per request (or job run)."""
+    versions = g.get('reference_versions')
+    if versions is None:
+        versions = g.reference_versions = dict(db.session.execute(select(CacheVersion.name, CacheVersion.version)).all())
+    return versions
+
+
+def cache_version(name):
+    """Current version of the cached set ``name``."""
+    return _versions().get(name, 0)
+
+
+def _cached(name, key, load):
+    """Value of ``load()`` kept in this process until the version of ``name`` changes.
+
+    The version is read before the data, so a write committed in between
+    can only leave newer data under an older version, which the next
+    request reloads.
+    """
+    version = cache_version(name)
+    with _lock:
+        entry = _cache.get((name, key))
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    value = load()
+    with _lock:
+        _cache[(name, key)] = (version, value)
+    return value
+
+
+def _attach(model, values):
+    """Session-bound instance rebuilt from cached column values, without a SELECT."""
+    obj = model(**values)
+    make_transient_to_detached(obj)
+    return db.session.merge(obj, load=False)
+
+
+def get_system_settings():
+    """The ``SystemSettings`` row, or None if it does not exist yet."""
+    columns = _columns(SystemSettings)
+
+    def load():
+        settings = SystemSettings.query.order_by(SystemSettings.id).first()
+        return {key: getattr(settings, key) for key in columns} if settings else None
+
+    values = _cached('settings', None, load)
+    return _attach(SystemSettings, values) if values else None
+
+
+def active_products(product_type):
+    """Active products of ``product_type`` ordered by name."""
+    columns = _columns(Product)
+
+    def load():
+        products = Product.query.filter_by(product_type=product_type, active=True).order_by(Product.name).all()
+        return [{key: getattr(product, key) for key in columns} for product in products]
+
+    return [_attach(Product, values) for values in _cached('products', product_type, load)]
+
+
+def user_ids_with_roles(roles):
+    roles = tuple(sorted(roles))
+    return list(_cached('users', roles, lambda: db.session.execute(
+        select(User.id).where(User.role.in_(roles)).order_by(User.id)
+    ).scalars().all()))
+
+
+def bump_versions(names, connection=None):
+    """Invalidate the cached sets ``names`` in every process, as part of the current transaction."""
+    connection = connection or db.session.connection()
+    for name in sorted(names):
+        bump = update(CacheVersion).where(CacheVersion.name == name).values(version=CacheVersion.version + 1)
+        if connection.execute(bump).rowcount:
+            continue
+        try:
+            with connection.begin_nested():
+                connection.execute(insert(CacheVersion).values(name=name, version=1))
+        except IntegrityError:
+            # Another transaction created the row first
+            connection.execute(bump)
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_versions_on_flush(session, flush_context):
+    names = {
+        name for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+        for name, models in WATCHED_MODELS.items() if isinstance(obj, models)
+    }
+    if names:
+        bump_versions(names, session.connection())
+        if has_app_context():
+            # Later reads in this request must see the new version
+            g.pop('reference_versions', None)
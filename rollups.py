@@ -0,0 +1,209 @@
+from datetime import date, datetime
+import click
+from flask import current_app, has_app_context
+from flask.cli import with_appcontext
+from sqlalchemy import event, func, inspect, select, update, delete, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import db, Credit, CreditPayment, MonthlySummary
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    year, index = divmod(month.year * 12 + month.month - 1 + count, 12)
+    return date(year, index + 1, 1)
+
+
+def month_range(months, end=None):
+    """First day of each of the ``months`` calendar months ending with ``end``'s month, oldest first."""
+    last = month_start(end or datetime.now())
+    return [add_months(last, -i) for i in range(months - 1, -1, -1)]
+
+
+def _as_datetime(day):
+    return datetime(day.year, day.month, day.day)
+
+
+def _bucket(column):
+    return func.extract('year', column), func.extract('month', column)
+
+
+def _live_rollup(start, stop, connection=None):
+    """Per-month totals between ``start`` and ``stop`` with one GROUP BY per metric.
+
+    The WHERE clause is a plain range on the indexed date column; only
+    the grouping key uses ``extract``, which SQLAlchemy renders for every
+    supported backend.
+    """
+    execute = (connection or db.session).execute
+
+    credit_year, credit_month = _bucket(Credit.application_date)
+    credit_rows = execute(
+        select(credit_year, credit_month, func.count(Credit.id), func.sum(Credit.amount))
+        .where(Credit.application_date >= _as_datetime(start), Credit.application_date < _as_datetime(stop))
+        .group_by(credit_year, credit_month)
+    ).all()
+
+    payment_year, payment_month = _bucket(CreditPayment.payment_date)
+    payment_rows = execute(
+        select(payment_year, payment_month, func.count(CreditPayment.id), func.sum(CreditPayment.amount))
+        .where(CreditPayment.payment_date >= _as_datetime(start), CreditPayment.payment_date < _as_datetime(stop))
+        .group_by(payment_year, payment_month)
+    ).all()
+
+    totals = {}
+    for year, month, count, amount in credit_rows:
+        bucket = totals.setdefault(date(int(year), int(month), 1), _empty_bucket())
+        bucket['credits_count'] = count
+        bucket['credits_amount'] = float(amount or 0)
+    for year, month, count, amount in payment_rows:
+        bucket = totals.setdefault(date(int(year), int(month), 1), _empty_bucket())
+        bucket['payments_count'] = count
+        bucket['payments_amount'] = float(amount or 0)
+    return totals
+
+
+def _empty_bucket():
+    return {'credits_count': 0, 'credits_amount': 0.0, 'payments_count': 0, 'payments_amount': 0.0}
+
+
+def summary_enabled():
+    return has_app_context() and current_app.config.get('MONTHLY_SUMMARY_ENABLED', False)
+
+
+def monthly_rollup(months, end=None):
+    """Credit count, disbursed amount and payment totals for each of the last ``months`` months.
+
+    Served from ``monthly_summaries`` when MONTHLY_SUMMARY_ENABLED is set,
+    otherwise aggregated live from ``credits`` and ``credit_payments``.
+    """
+    starts = month_range(months, end)
+    stop = add_months(starts[-1], 1)
+
+    if summary_enabled():
+        rows = MonthlySummary.query.filter(MonthlySummary.month >= starts[0], MonthlySummary.month < stop).all()
+        totals = {row.month: {
+            'credits_count': row.credits_count,
+            'credits_amount': row.credits_amount,
+            'payments_count': row.payments_count,
+            'payments_amount': row.payments_amount
+        } for row in rows}
+    else:
+        totals = _live_rollup(starts[0], stop)
+
+    return [dict(totals.get(start, _empty_bucket()), month=start) for start in starts]
+
+
+def apply_summary_deltas(deltas, connection=None):
+    """Add ``{month: {field: delta}}`` to the ``monthly_summaries`` rows, creating missing months.
+
+    A relative UPDATE per month: concurrent writers of the same month each
+    add their own rows, and no month is re-aggregated. Called on flush;
+    bulk writers that bypass the ORM unit of work call it directly.
+    """
+    connection = connection or db.session.connection()
+    summaries = MonthlySummary.__table__
+    now = datetime.utcnow()
+    for month in sorted(deltas):
+        delta = {field: value for field, value in deltas[month].items() if value}
+        if not delta:
+            continue
+        add = update(summaries).where(summaries.c.month == month).values(
+            updated_at=now, **{field: summaries.c[field] + value for field, value in delta.items()}
+        )
+        if connection.execute(add).rowcount:
+            continue
+        try:
+            with connection.begin_nested():
+                connection.execute(insert(summaries).values(dict(_empty_bucket(), **delta, month=month, updated_at=now)))
+        except IntegrityError:
+            # Another transaction created the month first
+            connection.execute(add)
+
+
+def rebuild_monthly_summary():
+    """Replace the whole summary table from the full history; returns the number of months stored."""
+    first_credit = db.session.query(func.min(Credit.application_date)).scalar()
+    first_payment = db.session.query(func.min(CreditPayment.payment_date)).scalar()
+    firsts = [value for value in (first_credit, first_payment) if value is not None]
+
+    db.session.execute(delete(MonthlySummary))
+    if not firsts:
+        db.session.commit()
+        return 0
+
+    start = month_start(min(firsts))
+    stop = add_months(month_start(datetime.now()), 1)
+    totals = _live_rollup(start, stop)
+    if totals:
+        now = datetime.utcnow()
+        db.session.execute(insert(MonthlySummary), [dict(values, month=month, updated_at=now) for month, values in totals.items()])
+    db.session.commit()
+    return len(totals)
+
+
+# Model -> date column and the summary fields its rows count and sum
+SUMMARY_METRICS = (
+    (Credit, 'application_date', 'credits_count', 'credits_amount'),
+    (CreditPayment, 'payment_date', 'payments_count', 'payments_amount'),
+)
+
+
+def _keep_previous_value(target, value, oldvalue, initiator):
+    pass
+
+
+def _track_previous_values():
+    """Load the previous date and amount when they are set on an expired object, so the flush sees both."""
+    for model, date_field, count_field, amount_field in SUMMARY_METRICS:
+        for field in (date_field, 'amount'):
+            event.listen(getattr(model, field), 'set', _keep_previous_value, active_history=True)
+
+
+_track_previous_values()
+
+
+def _committed(obj, field):
+    """Value of ``field`` before the flush."""
+    history = inspect(obj).attrs[field].history
+    return history.deleted[0] if history.deleted else getattr(obj, field)
+
+
+def _add_delta(deltas, value, count_field, amount_field, sign, amount):
+    bucket = deltas.setdefault(month_start(value or datetime.utcnow()), _empty_bucket())
+    bucket[count_field] += sign
+    bucket[amount_field] += sign * (amount or 0)
+
+
+@event.listens_for(Session, 'after_flush')
+def _maintain_summary_on_flush(session, flush_context):
+    if not summary_enabled():
+        return
+
+    deltas = {}
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        for model, date_field, count_field, amount_field in SUMMARY_METRICS:
+            if not isinstance(obj, model):
+                continue
+            if obj in session.new:
+                _add_delta(deltas, getattr(obj, date_field), count_field, amount_field, 1, obj.amount)
+                continue
+            before = _committed(obj, date_field), _committed(obj, 'amount')
+            if obj in session.deleted:
+                _add_delta(deltas, before[0], count_field, amount_field, -1, before[1])
+            elif before != (getattr(obj, date_field), obj.amount):
+                _add_delta(deltas, before[0], count_field, amount_field, -1, before[1])
+                _add_delta(deltas, getattr(obj, date_field), count_field, amount_field, 1, obj.amount)
+    if deltas:
+        apply_summary_deltas(deltas, session.connection())
+
+
+@click.command('rebuild-monthly-summary')
+@with_appcontext
+def rebuild_monthly_summary_command():
+    """Reconstruit la table des synthèses mensuelles à partir de tout l'historique."""
+    count = rebuild_monthly_summary()
+    click.echo(f'{count} mois recalculé(s)')
@@ -0,0 +1,195 @@
+import logging
+import time
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event, func, case, and_, or_, select, update, delete, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import db, Client, Credit, CreditPayment, PaymentSchedule, ClientScore
+
+logger = logging.getLogger(__name__)
+
+BASE_SCORE = 50
+
+
+def score_from_components(total_credits, completed_credits, repayment_points, overdue_installments):
+    """0-100 score: 50, plus up to 30 for the completion rate, plus 10 x the repaid share
+    of each active credit, minus 5 per overdue installment of an active credit."""
+    if not total_credits:
+        return BASE_SCORE
+    score = BASE_SCORE + completed_credits / total_credits * 30 + repayment_points - overdue_installments * 5
+    return max(0, min(100, round(score, 2)))
+
+
+def _components(condition, today):
+    """Score components of the clients whose credits match ``condition``, in two GROUP BY queries."""
+    credit_rows = db.session.execute(
+        select(
+            Credit.client_id,
+            func.count(Credit.id),
+            func.sum(case((Credit.status == 'completed', 1), else_=0)),
+            func.sum(case(
+                (and_(Credit.status == 'active', Credit.amount_paid > 0, Credit.total_amount > 0),
+                 Credit.amount_paid * 10.0 / Credit.total_amount),
+                else_=0
+            ))
+        ).where(condition).group_by(Credit.client_id)
+    ).all()
+    overdue = dict(db.session.execute(
+        select(Credit.client_id, func.count(PaymentSchedule.id))
+        .join(PaymentSchedule, PaymentSchedule.credit_id == Credit.id)
+        .where(condition, Credit.status == 'active', PaymentSchedule.paid == False, PaymentSchedule.due_date < today)
+        .group_by(Credit.client_id)
+    ).all())
+    return {
+        client_id: {
+            'total_credits': total,
+            'completed_credits': int(completed or 0),
+            'repayment_points': float(points or 0),
+            'overdue_installments': overdue.get(client_id, 0)
+        } for client_id, total, completed, points in credit_rows
+    }
+
+
+def _score_rows(client_ids, components, computed_at):
+    empty = {'total_credits': 0, 'completed_credits': 0, 'repayment_points': 0.0, 'overdue_installments': 0}
+    rows = []
+    for client_id in client_ids:
+        values = components.get(client_id, empty)
+        rows.append(dict(
+            values,
+            client_id=client_id,
+            score=score_from_components(**values),
+            stale=False,
+            computed_at=computed_at
+        ))
+    return rows
+
+
+def _is_fresh(row, now):
+    max_age = current_app.config.get('CLIENT_SCORE_MAX_AGE', 86400)
+    return row is not None and not row.stale and (now - row.computed_at).total_seconds() <= max_age
+
+
+def get_client_score(client_id):
+    """Cached ``ClientScore`` of a client, recomputed and stored when stale.
+
+    Commits when it recomputes, so call it before loading the objects a
+    page renders. A score computed before a write that committed in the
+    meantime is returned but not stored as fresh.
+    """
+    now = datetime.utcnow()
+    row = db.session.get(ClientScore, client_id)
+    if _is_fresh(row, now):
+        return row
+
+    values = _score_rows([client_id], _components(Credit.client_id == client_id, now.date()), now)[0]
+    if row is None:
+        db.session.add(ClientScore(**values))
+    else:
+        db.session.execute(
+            update(ClientScore).where(
+                ClientScore.client_id == client_id,
+                or_(ClientScore.invalidated_at.is_(None), ClientScore.invalidated_at <= now)
+            ).values(**values).execution_options(synchronize_session=False)
+        )
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another request stored this client's first score concurrently
+        db.session.rollback()
+    return ClientScore(**values)
+
+
+def rescore_clients(chunk_size=5000):
+    """Score every client, ``chunk_size`` consecutive ids per transaction; returns the count."""
+    total = 0
+    last_id = 0
+    while True:
+        client_ids = db.session.execute(
+            select(Client.id).where(Client.id > last_id).order_by(Client.id).limit(chunk_size)
+        ).scalars().all()
+        if not client_ids:
+            break
+        first, last_id = client_ids[0], client_ids[-1]
+        now = datetime.utcnow()
+        components = _components(Credit.client_id.between(first, last_id), now.date())
+        db.session.execute(delete(ClientScore).where(ClientScore.client_id.between(first, last_id)))
+        db.session.execute(insert(ClientScore), _score_rows(client_ids, components, now))
+        db.session.commit()
+        total += len(client_ids)
+    return total
+
+
+def invalidate_client_scores(client_ids=(), credit_ids=(), session=None):
+    """Mark stale the scores of ``client_ids`` and of the owners of ``credit_ids`` once the transaction commits.
+
+    Bulk writers that bypass the flush hook below call this directly.
+    """
+    info = (session or db.session).info
+    if client_ids:
+        info.setdefault('stale_score_clients', set()).update(client_ids)
+    if credit_ids:
+        info.setdefault('stale_score_credits', set()).update(credit_ids)
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidate_scores_on_flush(session, flush_context):
+    client_ids = set()
+    credit_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Credit):
+            if obj.client_id is not None:
+                client_ids.add(obj.client_id)
+        elif isinstance(obj, (CreditPayment, PaymentSchedule)):
+            if obj.credit_id is not None:
+                credit_ids.add(obj.credit_id)
+    invalidate_client_scores(client_ids, credit_ids, session)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_scores_after_commit(session):
+    """Flag the scores in a short transaction of their own.
+
+    Inside the writer's transaction the UPDATE would hold the score row
+    lock until commit, queueing concurrent payments of the same client.
+    The ``invalidated_at`` stamp stops a score computed before this
+    commit from being stored afterwards as fresh.
+    """
+    client_ids = session.info.pop('stale_score_clients', set())
+    credit_ids = session.info.pop('stale_score_credits', set())
+    conditions = []
+    if client_ids:
+        conditions.append(ClientScore.client_id.in_(client_ids))
+    if credit_ids:
+        conditions.append(ClientScore.client_id.in_(select(Credit.client_id).where(Credit.id.in_(credit_ids))))
+    if not conditions:
+        return
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(update(ClientScore).where(or_(*conditions))
+                               .values(stale=True, invalidated_at=datetime.utcnow()))
+    except Exception:
+        # The write is committed; the score still expires after CLIENT_SCORE_MAX_AGE
+        logger.exception('Could not mark stale the scores of %d client(s) and %d credit(s)', len(client_ids), len(credit_ids))
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_stale_scores(session, previous_transaction):
+    # A savepoint rollback keeps the outer transaction's writes
+    if previous_transaction.parent is None:
+        session.info.pop('stale_score_clients', None)
+        session.info.pop('stale_score_credits', None)
+
+
+@click.command('rescore-clients')
+@click.option('--chunk-size', type=int, default=5000)
+@with_appcontext
+def rescore_clients_command(chunk_size):
+    """Recalcule et enregistre le score de solvabilité de tous les clients."""
+    started = time.perf_counter()
+    count = rescore_clients(chunk_size)
+    elapsed = time.perf_counter() - started
+    click.echo(f'{count} client(s) notés en {elapsed:.2f}s ({count / elapsed if elapsed else 0:.0f} clients/s)')
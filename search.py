@@ -0,0 +1,246 @@
+import re
+import unicodedata
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event, func, case, and_, or_, select, delete, insert, inspect
+from sqlalchemy.orm import Session
+from models import db, Client, Credit, ClientSearchTerm, ClientSearchTrigram
+
+INDEXED_FIELDS = ('client_id', 'first_name', 'last_name', 'email', 'phone')
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+_PHONE_QUERY = re.compile(r'^[\d\s+().-]+$')
+
+
+def fold(text):
+    """Lower-case ``text`` and strip accents: 'Éloïse' -> 'eloise'."""
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def phone_digits(text):
+    return re.sub(r'\D', '', text or '')
+
+
+def tokenize(text):
+    return [token for token in _NON_ALNUM.split(fold(text)) if token]
+
+
+def trigrams(token):
+    padded = f'  {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def client_terms(client):
+    """Normalized search keys of a client (names, identifier, email, phone digits)."""
+    terms = set()
+    for value in (client.first_name, client.last_name):
+        terms.update(tokenize(value))
+    if client.client_id:
+        terms.add(fold(client.client_id))
+        digits = phone_digits(client.client_id)
+        if digits:
+            terms.add(digits)
+    if client.email:
+        email = fold(client.email).strip()
+        terms.add(email)
+        terms.add(email.split('@', 1)[0])
+    digits = phone_digits(client.phone)
+    if digits:
+        terms.add(digits)
+    return {term[:120] for term in terms}
+
+
+def _index_rows(clients):
+    term_rows = []
+    trigram_rows = []
+    for client in clients:
+        terms = client_terms(client)
+        term_rows.extend({'client_id': client.id, 'term': term} for term in terms)
+        grams = set()
+        for term in terms:
+            grams |= trigrams(term)
+        trigram_rows.extend({'client_id': client.id, 'trigram': gram} for gram in grams)
+    return term_rows, trigram_rows
+
+
+def index_clients(clients, connection=None):
+    """(Re)write the search rows of ``clients`` with two bulk inserts."""
+    clients = [client for client in clients if client.id is not None]
+    if not clients:
+        return
+    execute = (connection or db.session).execute
+    ids = [client.id for client in clients]
+    execute(delete(ClientSearchTerm).where(ClientSearchTerm.client_id.in_(ids)))
+    execute(delete(ClientSearchTrigram).where(ClientSearchTrigram.client_id.in_(ids)))
+    term_rows, trigram_rows = _index_rows(clients)
+    # Core tables: plain executemany, without the ORM bulk-insert bookkeeping
+    if term_rows:
+        execute(insert(ClientSearchTerm.__table__), term_rows)
+    if trigram_rows:
+        execute(insert(ClientSearchTrigram.__table__), trigram_rows)
+
+
+def rebuild_search_index(chunk_size=2000):
+    """Re-index every client, ``chunk_size`` clients per transaction; returns the count."""
+    db.session.execute(delete(ClientSearchTerm))
+    db.session.execute(delete(ClientSearchTrigram))
+    db.session.commit()
+
+    total = 0
+    last_id = 0
+    while True:
+        chunk = Client.query.filter(Client.id > last_id).order_by(Client.id).limit(chunk_size).all()
+        if not chunk:
+            break
+        index_clients(chunk)
+        db.session.commit()
+        total += len(chunk)
+        last_id = chunk[-1].id
+        db.session.expunge_all()
+    return total
+
+
+def _query_tokens(q):
+    q = (q or '').strip()
+    if _PHONE_QUERY.match(q) and len(phone_digits(q)) >= 4:
+        return [phone_digits(q)]
+    if '@' in q:
+        return [fold(q)[:120]]
+    return tokenize(q)
+
+
+def prefix_range(column, prefix):
+    """Index range equivalent of ``column LIKE 'prefix%'`` that works with any collation."""
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return and_(column >= prefix, column < upper)
+
+
+def _prefix_matches(tokens):
+    token_index = case(
+        *[(prefix_range(ClientSearchTerm.term, token), i) for i, token in enumerate(tokens)]
+    )
+    score = func.sum(case(
+        (ClientSearchTerm.term.in_(tokens), 3),
+        else_=1
+    ))
+    return select(ClientSearchTerm.client_id, score.label('score')).where(
+        or_(*[prefix_range(ClientSearchTerm.term, token) for token in tokens])
+    ).group_by(ClientSearchTerm.client_id).having(
+        func.count(func.distinct(token_index)) == len(tokens)
+    )
+
+
+def _trigram_matches(tokens):
+    grams = set()
+    needed = 0
+    threshold = current_app.config.get('SEARCH_TRIGRAM_THRESHOLD', 0.5)
+    for token in tokens:
+        if token.isdigit():
+            # Digit runs (phone numbers, identifiers) must appear whole, anywhere in the key
+            token_grams = {token[i:i + 3] for i in range(len(token) - 2)}
+            needed += len(token_grams)
+        else:
+            token_grams = trigrams(token)
+            needed += max(1, int(len(token_grams) * threshold))
+        grams |= token_grams
+    matched = func.count(func.distinct(ClientSearchTrigram.trigram))
+    return select(ClientSearchTrigram.client_id, matched.label('score')).where(
+        ClientSearchTrigram.trigram.in_(grams)
+    ).group_by(ClientSearchTrigram.client_id).having(matched >= min(needed, len(grams)))
+
+
+def _matches(q):
+    tokens = _query_tokens(q)
+    if not tokens:
+        return None
+    prefix = _prefix_matches(tokens)
+    if db.session.execute(prefix.limit(1)).first() is not None:
+        return prefix
+    if sum(len(token) for token in tokens) >= 3:
+        return _trigram_matches(tokens)
+    return prefix
+
+
+def search_clients(q, limit=None):
+    """Clients matching ``q``, best first.
+
+    Every token of the query must prefix-match one of the client's keys
+    (an exact key scores higher than a prefix). When nothing matches, the
+    clients sharing enough trigrams with the query are returned instead,
+    which catches typos and infix phone numbers.
+    """
+    matches = _matches(q)
+    if matches is None:
+        return []
+    limit = limit or current_app.config.get('SEARCH_RESULT_LIMIT', 20)
+    ranked = matches.subquery()
+    rows = db.session.query(Client, ranked.c.score).join(ranked, ranked.c.client_id == Client.id).order_by(
+        ranked.c.score.desc(), Client.last_name, Client.id
+    ).limit(limit).all()
+    return [client for client, score in rows]
+
+
+def _matching_client_ids(q):
+    matches = _matches(q)
+    if matches is None:
+        return None
+    return select(matches.subquery().c.client_id)
+
+
+def client_search_condition(q):
+    """Filter on ``Client.id`` for list pages, or None when ``q`` has nothing searchable."""
+    client_ids = _matching_client_ids(q)
+    return Client.id.in_(client_ids) if client_ids is not None else None
+
+
+def credit_search_condition(q):
+    """Filter on credits by credit number prefix or by matching client."""
+    q = (q or '').strip()
+    if not q:
+        return None
+    conditions = []
+    number = q.upper().replace(' ', '')
+    if number.isdigit():
+        number = 'CRD' + number
+    if number.isalnum():
+        conditions.append(prefix_range(Credit.credit_number, number))
+    client_ids = _matching_client_ids(q)
+    if client_ids is not None:
+        conditions.append(Credit.client_id.in_(client_ids))
+    if not conditions:
+        return Credit.id.is_(None)
+    return or_(*conditions)
+
+
+@event.listens_for(Session, 'before_flush')
+def _unindex_deleted_clients(session, flush_context, instances):
+    ids = [obj.id for obj in session.deleted if isinstance(obj, Client) and obj.id is not None]
+    if ids:
+        connection = session.connection()
+        connection.execute(delete(ClientSearchTerm).where(ClientSearchTerm.client_id.in_(ids)))
+        connection.execute(delete(ClientSearchTrigram).where(ClientSearchTrigram.client_id.in_(ids)))
+
+
+@event.listens_for(Session, 'after_flush')
+def _index_changed_clients(session, flush_context):
+    changed = [obj for obj in session.new if isinstance(obj, Client)]
+    for obj in session.dirty:
+        if isinstance(obj, Client):
+            state = inspect(obj)
+            if any(state.attrs[field].history.has_changes() for field in INDEXED_FIELDS):
+                changed.append(obj)
+    if changed:
+        index_clients(changed, session.connection())
+
+
+@click.command('rebuild-search-index')
+@click.option('--chunk-size', type=int, default=2000)
+@with_appcontext
+def rebuild_search_index_command(chunk_size):
+    """Reconstruit l'index de recherche des clients."""
+    count = rebuild_search_index(chunk_size)
+    click.echo(f'{count} client(s) indexé(s)')
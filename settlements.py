@@ -0,0 +1,322 @@
+import os
+import re
+import time
+from datetime import datetime
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import select, update, insert, bindparam, func
+from sqlalchemy.exc import IntegrityError
+from client_import import ImportFileError, file_digest, read_rows, column_map, column_key
+from models import db, User, Credit, CreditPayment, SettlementFile, SettlementLine, AuditLog
+from payments import MOBILE_MONEY_METHODS
+from rollups import month_start, apply_summary_deltas, summary_enabled
+from scoring import invalidate_client_scores
+from snapshot import invalidate_snapshot
+from summaries import owners, schedule_summary_refresh
+
+PROVIDER_LABELS = {'wave': 'Wave', 'orange_money': 'Orange Money'}
+
+LOOKUP_CHUNK = 1000
+INSERT_CHUNK = 5000
+
+# Settlement field -> accepted column names of the Wave and Orange Money exports, folded
+SETTLEMENT_COLUMNS = {
+    'transaction_id': ('transaction_id', 'id_transaction', 'n_de_transaction', 'numero_de_transaction',
+                       'reference_transaction', 'txn_id', 'id'),
+    'amount': ('amount', 'montant', 'montant_fcfa', 'montant_xof'),
+    'paid_at': ('paid_at', 'date', 'date_de_transaction', 'date_heure', 'timestamp', 'date_et_heure'),
+    'credit_number': ('credit_number', 'numero_de_credit', 'numero_credit', 'n_credit', 'n_de_credit'),
+    'reference': ('reference', 'reference_client', 'client_reference', 'motif', 'note', 'libelle', 'description'),
+    'status': ('status', 'statut', 'etat'),
+}
+REQUIRED_COLUMNS = ('transaction_id', 'amount', 'paid_at')
+
+# Folded values of the status column that mean the money was received
+SUCCESS_STATUSES = {'succeeded', 'success', 'successful', 'completed', 'complete', 'reussi', 'reussie',
+                    'succes', 'effectue', 'effectuee', 'valide', 'validee', 'ok'}
+
+_TOKEN = re.compile(r'[0-9A-Za-z][0-9A-Za-z-]*')
+_AMOUNT_NOISE = re.compile(r'\s|fcfa|xof|cfa|f$', re.IGNORECASE)
+_THOUSANDS = re.compile(r'^\d{1,3}((,\d{3})+|(\.\d{3})+)$')
+_DATE_FORMATS = ('%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y', '%d-%m-%Y %H:%M:%S', '%d-%m-%Y')
+
+
+class SettlementResult:
+    def __init__(self, record, unmatched, dry_run=False):
+        self.record = record
+        self.unmatched = unmatched
+        self.dry_run = dry_run
+
+
+def parse_amount(text):
+    """Amount of a settlement line ('10 000', '10.000', '1.500.000', '10.000,50', '1,500 FCFA'), or None.
+
+    A lone separator followed by groups of exactly three digits separates
+    thousands: XOF amounts have no decimals.
+    """
+    text = _AMOUNT_NOISE.sub('', text)
+    if ',' in text and '.' in text:
+        # The last separator is the decimal one
+        thousands = '.' if text.rindex(',') > text.rindex('.') else ','
+        text = text.replace(thousands, '').replace(',', '.')
+    elif _THOUSANDS.match(text):
+        text = text.replace(',', '').replace('.', '')
+    else:
+        text = text.replace(',', '.')
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def parse_datetime(text):
+    """Date and time of a settlement line, ISO 8601 or French (JJ/MM/AAAA [HH:MM[:SS]]), or None."""
+    text = text.strip()
+    try:
+        value = datetime.fromisoformat(text.replace('Z', '+00:00'))
+        return value.replace(tzinfo=None)
+    except ValueError:
+        pass
+    for pattern in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, pattern)
+        except ValueError:
+            continue
+    return None
+
+
+def _value(values, positions, field):
+    index = positions.get(field)
+    if index is None or index >= len(values):
+        return ''
+    return values[index]
+
+
+def _read_lines(path):
+    """Settlement lines of the file as dicts; the ``error`` key is set on lines that cannot be posted."""
+    header, rows = read_rows(path)
+    positions = column_map(header, SETTLEMENT_COLUMNS, REQUIRED_COLUMNS)
+    if 'credit_number' not in positions and 'reference' not in positions:
+        raise ImportFileError('Colonne obligatoire absente : reference ou numero_de_credit')
+
+    lines = []
+    seen = set()
+    for number, values in rows:
+        if not any(values):
+            continue
+        reference = ' '.join(filter(None, (_value(values, positions, 'credit_number'),
+                                           _value(values, positions, 'reference'))))
+        line = {
+            'line_number': number,
+            'transaction_reference': _value(values, positions, 'transaction_id')[:100],
+            'reference': reference[:255],
+            'amount': parse_amount(_value(values, positions, 'amount')),
+            'paid_at': parse_datetime(_value(values, positions, 'paid_at')),
+            'tokens': {token.upper() for token in _TOKEN.findall(reference)},
+            'error': None,
+        }
+        status = _value(values, positions, 'status')
+        if not line['transaction_reference']:
+            line['error'] = 'Identifiant de transaction manquant'
+        elif line['transaction_reference'] in seen:
+            line['error'] = 'Transaction en double dans le fichier'
+        elif status and column_key(status) not in SUCCESS_STATUSES:
+            line['error'] = f'Transaction non aboutie ({status})'
+        elif line['amount'] is None or line['amount'] <= 0:
+            line['error'] = 'Montant invalide'
+        elif line['paid_at'] is None:
+            line['error'] = 'Date invalide'
+        elif not line['tokens']:
+            line['error'] = 'Référence de crédit manquante'
+        seen.add(line['transaction_reference'])
+        lines.append(line)
+    return lines
+
+
+def _chunks(values, size=LOOKUP_CHUNK):
+    values = sorted(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _match(lines, provider):
+    """Set ``credit_id`` on the lines that match an active credit, ``error`` on the others."""
+    pending = [line for line in lines if not line['error']]
+    credits = {}
+    # The credits are locked, in credit number order: a concurrent file paying the same credits
+    # waits until this one commits, then sees its payments in the locking read below
+    for chunk in _chunks({token for line in pending for token in line['tokens']}):
+        credits.update((row.credit_number.upper(), row) for row in db.session.execute(
+            select(Credit.id, Credit.credit_number, Credit.status).where(Credit.credit_number.in_(chunk))
+            .with_for_update()
+        ))
+    posted = set()
+    for chunk in _chunks({line['transaction_reference'] for line in pending}):
+        posted.update(db.session.execute(
+            select(CreditPayment.reference).where(CreditPayment.payment_method == provider,
+                                                  CreditPayment.reference.in_(chunk))
+            .with_for_update(read=True)
+        ).scalars())
+
+    for line in pending:
+        matches = {credits[token] for token in line['tokens'] if token in credits}
+        if line['transaction_reference'] in posted:
+            line['error'] = 'Transaction déjà enregistrée'
+        elif not matches:
+            line['error'] = 'Aucun crédit correspondant'
+        elif len(matches) > 1:
+            line['error'] = 'Référence ambiguë : ' + ', '.join(sorted(row.credit_number for row in matches))
+        else:
+            credit = matches.pop()
+            if credit.status != 'active':
+                line['error'] = f'Crédit {credit.credit_number} non actif ({credit.status})'
+            else:
+                line['credit_id'] = credit.id
+
+
+def _post(lines, provider, file_name):
+    """Write the payments of the matched lines; returns the ids of the credits they completed."""
+    payments = [{
+        'credit_id': line['credit_id'],
+        'amount': line['amount'],
+        'payment_date': line['paid_at'],
+        'payment_method': provider,
+        'reference': line['transaction_reference'],
+        'notes': f'Relevé {PROVIDER_LABELS[provider]} {file_name}, ligne {line["line_number"]}',
+    } for line in lines]
+    for start in range(0, len(payments), INSERT_CHUNK):
+        db.session.execute(insert(CreditPayment), payments[start:start + INSERT_CHUNK])
+
+    totals = {}
+    for line in lines:
+        totals[line['credit_id']] = totals.get(line['credit_id'], 0) + line['amount']
+    credits = Credit.__table__
+    # Relative update: payments keyed in by hand meanwhile are kept
+    db.session.connection().execute(
+        update(credits).where(credits.c.id == bindparam('credit_key'))
+        .values(amount_paid=func.coalesce(credits.c.amount_paid, 0) + bindparam('paid')),
+        [{'credit_key': credit_id, 'paid': amount} for credit_id, amount in totals.items()]
+    )
+
+    completed = []
+    for chunk in _chunks(totals):
+        completed += db.session.execute(
+            select(Credit.id).where(Credit.id.in_(chunk), Credit.status == 'active',
+                                    Credit.amount_paid >= Credit.total_amount)
+        ).scalars().all()
+    for chunk in _chunks(completed):
+        db.session.execute(update(Credit).where(Credit.id.in_(chunk)).values(status='completed')
+                           .execution_options(synchronize_session=False))
+
+    # Bulk statements bypass the flush hooks
+    invalidate_snapshot()
+    invalidate_client_scores(credit_ids=totals)
+    schedule_summary_refresh(owners(credit_ids=totals))
+    if summary_enabled():
+        deltas = {}
+        for line in lines:
+            month = deltas.setdefault(month_start(line['paid_at']), {'payments_count': 0, 'payments_amount': 0.0})
+            month['payments_count'] += 1
+            month['payments_amount'] += line['amount']
+        apply_summary_deltas(deltas)
+    return completed
+
+
+def post_settlement_file(path, provider, user_id=None, file_name=None, dry_run=False):
+    """Post the repayments of a Wave or Orange Money settlement file in one transaction.
+
+    Each line is matched to an active credit through the credit numbers
+    found in its reference columns. Matched lines become ``CreditPayment``
+    rows written in bulk, with one relative ``amount_paid`` update per
+    credit; credits paid off are marked completed. Lines that cannot be
+    posted (no or several credits, credit not active, transaction already
+    recorded, invalid amount...) are stored as ``SettlementLine`` rows for
+    follow-up. A file already posted is refused. With ``dry_run`` the
+    transaction is rolled back.
+    """
+    if provider not in MOBILE_MONEY_METHODS:
+        raise ImportFileError(f'Opérateur inconnu : {provider}')
+    file_name = file_name or os.path.basename(path)
+    digest = file_digest(path)
+    previous = SettlementFile.query.filter_by(file_digest=digest).first()
+    if previous is not None:
+        raise ImportFileError(f'Ce relevé a déjà été traité le {previous.created_at:%d/%m/%Y %H:%M} '
+                              f'({previous.file_name}, {previous.lines_posted} paiement(s))')
+    lines = _read_lines(path)
+
+    record = SettlementFile(provider=provider, file_name=file_name[:255], file_digest=digest,
+                            lines_total=len(lines), created_by=user_id)
+    db.session.add(record)
+    try:
+        # Claims the file: a concurrent run of the same file waits here, then fails
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        raise ImportFileError('Ce relevé est déjà en cours de traitement')
+
+    try:
+        _match(lines, provider)
+        matched = [line for line in lines if not line['error']]
+        unmatched = [line for line in lines if line['error']]
+        completed = _post(matched, provider, file_name) if matched else []
+
+        record.lines_posted = len(matched)
+        record.lines_unmatched = len(unmatched)
+        record.amount_posted = sum(line['amount'] for line in matched)
+        record.credits_completed = len(completed)
+        flagged = [{
+            'settlement_file_id': record.id,
+            'line_number': line['line_number'],
+            'transaction_reference': line['transaction_reference'],
+            'reference': line['reference'],
+            'amount': line['amount'],
+            'paid_at': line['paid_at'],
+            'reason': line['error'][:255],
+        } for line in unmatched]
+        for start in range(0, len(flagged), INSERT_CHUNK):
+            db.session.execute(insert(SettlementLine), flagged[start:start + INSERT_CHUNK])
+        db.session.add(AuditLog(user_id=user_id, action='Relevé de remboursements', entity_type='SettlementFile',
+                                entity_id=record.id,
+                                details=f'Relevé {PROVIDER_LABELS[provider]} {file_name} : {len(matched)} paiement(s) '
+                                        f'enregistré(s) pour {record.amount_posted:,.0f} FCFA, '
+                                        f'{len(completed)} crédit(s) soldé(s), {len(unmatched)} ligne(s) non rapprochée(s)'))
+        db.session.flush()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    result = SettlementResult(record, unmatched, dry_run)
+    if dry_run:
+        db.session.expunge(record)
+        db.session.rollback()
+    else:
+        db.session.commit()
+    return result
+
+
+@click.command('post-settlement-file')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--provider', type=click.Choice(MOBILE_MONEY_METHODS), required=True, help='Opérateur du relevé.')
+@click.option('--user', 'username', default=None, help='Utilisateur auquel attribuer les paiements dans le journal d\'audit.')
+@click.option('--dry-run', is_flag=True, help='Rapprocher les lignes sans rien enregistrer.')
+@with_appcontext
+def post_settlement_file_command(path, provider, username, dry_run):
+    """Enregistre les remboursements d'un relevé Wave ou Orange Money (CSV ou XLSX)."""
+    user_id = None
+    if username:
+        user_id = db.session.execute(select(User.id).where(User.username == username)).scalar()
+        if user_id is None:
+            raise click.ClickException(f'Utilisateur {username} introuvable')
+    started = time.perf_counter()
+    try:
+        result = post_settlement_file(path, provider, user_id, dry_run=dry_run)
+    except ImportFileError as error:
+        raise click.ClickException(str(error))
+    record = result.record
+    click.echo(f'{record.lines_posted} paiement(s) {"à enregistrer" if dry_run else "enregistré(s)"} '
+               f'pour {record.amount_posted:,.0f} FCFA, {record.credits_completed} crédit(s) soldé(s), '
+               f'{record.lines_unmatched} ligne(s) non rapprochée(s) en {time.perf_counter() - started:.1f}s')
+    for line in result.unmatched[:20]:
+        click.echo(f'  ligne {line["line_number"]} ({line["transaction_reference"] or "-"}) : {line["error"]}')
+    if len(result.unmatched) > 20:
+        click.echo(f'  ... et {len(result.unmatched) - 20} autre(s)')
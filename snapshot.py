@@ -0,0 +1,260 @@
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event, func, case, update, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from rollups import monthly_rollup
+from models import db, Client, Product, Credit, CreditPayment, SavingsAccount, SavingsTransaction, PaymentSchedule, KpiSnapshot
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_SNAPSHOT = 'dashboard'
+
+# Writes to these models change at least one dashboard value
+WATCHED_MODELS = (Credit, CreditPayment, PaymentSchedule, SavingsAccount, SavingsTransaction, Client, Product)
+
+_DISBURSED_STATUSES = ('active', 'approved', 'disbursed')
+
+_local_lock = threading.Lock()
+_local_snapshots = {}
+
+
+class DashboardSnapshot:
+    """Every value rendered by dashboard.html, computed in one pass."""
+
+    def __init__(self, values, computed_at):
+        self.values = values
+        self.computed_at = computed_at
+
+    def age(self, now=None):
+        return ((now or datetime.utcnow()) - self.computed_at).total_seconds()
+
+    def as_template_context(self):
+        context = dict(self.values)
+        context['snapshot_computed_at'] = self.computed_at
+        return context
+
+    def to_json(self):
+        return json.dumps(self.values, default=lambda o: o.isoformat())
+
+    @classmethod
+    def from_row(cls, row):
+        values = json.loads(row.payload)
+        for client in values.get('recent_clients', []):
+            if client.get('created_at'):
+                client['created_at'] = datetime.fromisoformat(client['created_at'])
+        return cls(values, row.computed_at)
+
+
+def compute_dashboard_snapshot(now=None):
+    # Stamped with the start time: writes committed after it may be missing
+    started = datetime.utcnow()
+    now = now or datetime.now()
+    today = now.date()
+    thirty_days_ago = now - timedelta(days=30)
+
+    credit_rows = db.session.query(
+        Credit.status,
+        func.count(Credit.id),
+        func.coalesce(func.sum(Credit.amount), 0),
+        func.coalesce(func.sum(Credit.amount_paid), 0),
+        func.sum(case((Credit.penalty_amount > 0, 1), else_=0)),
+        func.sum(case((Credit.application_date >= thirty_days_ago, 1), else_=0))
+    ).group_by(Credit.status).all()
+    credits_by_status = {row[0]: row for row in credit_rows}
+
+    def status_count(status):
+        row = credits_by_status.get(status)
+        return row[1] if row else 0
+
+    disbursed_rows = [row for status, row in credits_by_status.items() if status in _DISBURSED_STATUSES]
+    disbursed_count = sum(row[1] for row in disbursed_rows)
+    total_credit_amount = float(sum(row[2] for row in disbursed_rows))
+    total_credit_paid = float(sum(row[3] for row in disbursed_rows))
+    active_row = credits_by_status.get('active')
+
+    savings_rows = db.session.query(
+        SavingsAccount.status,
+        func.count(SavingsAccount.id),
+        func.coalesce(func.sum(SavingsAccount.balance), 0),
+        func.avg(SavingsAccount.balance)
+    ).group_by(SavingsAccount.status).all()
+    savings_by_status = {row[0]: row for row in savings_rows}
+    active_savings = savings_by_status.get('active')
+
+    total_clients, new_clients_month = db.session.query(
+        func.count(Client.id),
+        func.sum(case((Client.created_at >= thirty_days_ago, 1), else_=0))
+    ).one()
+
+    products_by_type = dict(db.session.query(
+        Product.product_type, func.count(Product.id)
+    ).filter(Product.active == True).group_by(Product.product_type).all())
+
+    upcoming_due, overdue = db.session.query(
+        func.sum(case((PaymentSchedule.due_date >= today, 1), else_=0)),
+        func.sum(case((PaymentSchedule.due_date < today, 1), else_=0))
+    ).filter(
+        PaymentSchedule.paid == False,
+        PaymentSchedule.due_date <= today + timedelta(days=7)
+    ).one()
+
+    total_payments = db.session.query(func.sum(CreditPayment.amount)).scalar() or 0
+
+    recent_credits = db.session.query(
+        Credit.id, Credit.credit_number, Credit.amount, Credit.status, Client.first_name, Client.last_name
+    ).join(Client).order_by(Credit.application_date.desc()).limit(5).all()
+    recent_clients = Client.query.order_by(Client.created_at.desc()).limit(5).all()
+
+    rollup = monthly_rollup(6, now)
+    monthly_labels = [bucket['month'].strftime('%B')[:3] for bucket in rollup]
+    monthly_data = [{
+        'credits_count': bucket['credits_count'],
+        'credits_amount': bucket['credits_amount'],
+        'payments_amount': bucket['payments_amount']
+    } for bucket in rollup]
+
+    values = {
+        'total_clients': total_clients,
+        'total_credits': sum(row[1] for row in credit_rows),
+        'active_credits': status_count('active'),
+        'total_savings': sum(row[1] for row in savings_rows),
+        'total_credit_amount': total_credit_amount,
+        'total_credit_paid': total_credit_paid,
+        'total_savings_balance': float(active_savings[2]) if active_savings else 0,
+        'recent_credits': [{
+            'id': c.id,
+            'credit_number': c.credit_number,
+            'amount': c.amount,
+            'status': c.status,
+            'client': {'full_name': f"{c.first_name} {c.last_name}"}
+        } for c in recent_credits],
+        'recent_clients': [{
+            'id': c.id,
+            'client_id': c.client_id,
+            'full_name': c.full_name,
+            'phone': c.phone,
+            'created_at': c.created_at
+        } for c in recent_clients],
+        'pending_credits': status_count('pending'),
+        'approved_credits': status_count('approved'),
+        'completed_credits': status_count('completed'),
+        'rejected_credits': status_count('rejected'),
+        'credit_products': products_by_type.get('credit', 0),
+        'savings_products': products_by_type.get('savings', 0),
+        'upcoming_due': upcoming_due or 0,
+        'overdue': overdue or 0,
+        'new_clients_month': new_clients_month or 0,
+        'new_credits_month': sum(row[5] or 0 for row in credit_rows),
+        'monthly_labels': monthly_labels,
+        'monthly_data': monthly_data,
+        'total_payments': float(total_payments),
+        'avg_credit_amount': total_credit_amount / disbursed_count if disbursed_count else 0,
+        'avg_savings_balance': float(active_savings[3] or 0) if active_savings else 0,
+        'repayment_rate': (total_credit_paid / total_credit_amount * 100) if total_credit_amount > 0 else 0,
+        'risk_clients': (active_row[4] or 0) if active_row else 0
+    }
+    return DashboardSnapshot(values, started)
+
+
+def _store_snapshot(name, snapshot):
+    """Save ``snapshot`` unless the row was invalidated after the snapshot started."""
+    row = db.session.query(KpiSnapshot.id).filter_by(name=name).first()
+    if row is None:
+        db.session.add(KpiSnapshot(name=name, payload=snapshot.to_json(), computed_at=snapshot.computed_at, stale=False))
+    else:
+        db.session.execute(
+            update(KpiSnapshot).where(
+                KpiSnapshot.name == name,
+                or_(KpiSnapshot.invalidated_at.is_(None), KpiSnapshot.invalidated_at <= snapshot.computed_at)
+            ).values(payload=snapshot.to_json(), computed_at=snapshot.computed_at, stale=False)
+        )
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker stored the first snapshot concurrently; theirs is as good as ours
+        db.session.rollback()
+
+
+def get_dashboard_snapshot(force_refresh=False):
+    """Return the shared dashboard snapshot, recomputing it when stale.
+
+    The in-process copy is reused as long as the shared row in
+    ``kpi_snapshots`` has not been invalidated or recomputed by another
+    worker, so a fresh dashboard costs a single primary-key read.
+    """
+    max_age = current_app.config.get('DASHBOARD_SNAPSHOT_MAX_AGE', 300)
+    now = datetime.utcnow()
+
+    if not force_refresh:
+        row = db.session.query(
+            KpiSnapshot.computed_at, KpiSnapshot.stale
+        ).filter_by(name=DASHBOARD_SNAPSHOT).first()
+        if row is not None and not row.stale and (now - row.computed_at).total_seconds() <= max_age:
+            with _local_lock:
+                local = _local_snapshots.get(DASHBOARD_SNAPSHOT)
+            if local is not None and local.computed_at == row.computed_at:
+                return local
+            snapshot = DashboardSnapshot.from_row(KpiSnapshot.query.filter_by(name=DASHBOARD_SNAPSHOT).first())
+            with _local_lock:
+                _local_snapshots[DASHBOARD_SNAPSHOT] = snapshot
+            return snapshot
+
+    snapshot = compute_dashboard_snapshot()
+    _store_snapshot(DASHBOARD_SNAPSHOT, snapshot)
+    with _local_lock:
+        _local_snapshots[DASHBOARD_SNAPSHOT] = snapshot
+    return snapshot
+
+
+def invalidate_snapshot(name=DASHBOARD_SNAPSHOT, session=None):
+    """Mark a snapshot stale for every worker once the current transaction commits.
+
+    Bulk ``update()``/``insert()`` statements bypass the flush hook below,
+    so batch jobs call this explicitly before committing.
+    """
+    (session or db.session).info.setdefault('invalidated_snapshots', set()).add(name)
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidate_on_flush(session, flush_context):
+    if DASHBOARD_SNAPSHOT in session.info.get('invalidated_snapshots', ()):
+        return
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, WATCHED_MODELS):
+            invalidate_snapshot(session=session)
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    """Flag the snapshots in a short transaction of their own.
+
+    Doing it inside the writer's transaction would hold the snapshot row
+    lock until commit and queue every concurrent writer behind it. The
+    ``invalidated_at`` stamp stops a snapshot computed before this commit
+    from being stored afterwards as fresh.
+    """
+    names = session.info.pop('invalidated_snapshots', None)
+    if not names:
+        return
+    with _local_lock:
+        for name in names:
+            _local_snapshots.pop(name, None)
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(update(KpiSnapshot).where(KpiSnapshot.name.in_(names))
+                               .values(stale=True, invalidated_at=datetime.utcnow()))
+    except Exception:
+        # The write is committed; the snapshot still expires after DASHBOARD_SNAPSHOT_MAX_AGE
+        logger.exception('Could not invalidate snapshots %s', ', '.join(sorted(names)))
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_invalidation(session, previous_transaction):
+    # A savepoint rollback keeps the outer transaction's writes
+    if previous_transaction.parent is None:
+        session.info.pop('invalidated_snapshots', None)
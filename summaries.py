@@ -0,0 +1,338 @@
+import logging
+import time
+from datetime import datetime, timedelta
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event, func, case, select, update, delete, insert, bindparam
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from jobs import acquire_job_lock
+from models import db, Client, Credit, CreditPayment, SavingsAccount, SavingsTransaction, ClientSummary, SummaryRefresh
+
+logger = logging.getLogger(__name__)
+
+REFRESH_CHUNK = 1000
+
+BORROWED_STATUSES = ('active', 'completed')
+
+# Values recomputed by _summary_values, in table order
+SUMMARY_FIELDS = (
+    'total_credits', 'active_credits', 'completed_credits', 'total_borrowed',
+    'total_repaid', 'current_debt', 'savings_balance', 'last_activity_at'
+)
+
+
+def _debt():
+    return func.sum(case(
+        (Credit.status == 'active', Credit.total_amount + func.coalesce(Credit.penalty_amount, 0) - Credit.amount_paid),
+        else_=0
+    ))
+
+
+def _summary_values(execute, condition, lock=False):
+    """Summary values of the clients selected by ``condition(client_id_column)``, in four GROUP BY queries.
+
+    With ``lock`` the rows are read with shared locks: the latest committed
+    values, whatever snapshot the transaction started with.
+    """
+    def read(statement):
+        return execute(statement.with_for_update(read=True) if lock else statement)
+
+    credit_rows = read(
+        select(
+            Credit.client_id,
+            func.count(Credit.id),
+            func.sum(case((Credit.status == 'active', 1), else_=0)),
+            func.sum(case((Credit.status == 'completed', 1), else_=0)),
+            func.sum(case((Credit.status.in_(BORROWED_STATUSES), Credit.amount), else_=0)),
+            func.sum(Credit.amount_paid),
+            _debt(),
+            func.max(Credit.application_date)
+        ).where(condition(Credit.client_id)).group_by(Credit.client_id)
+    ).all()
+    last_payments = dict(read(
+        select(Credit.client_id, func.max(CreditPayment.payment_date))
+        .join(CreditPayment, CreditPayment.credit_id == Credit.id)
+        .where(condition(Credit.client_id)).group_by(Credit.client_id)
+    ).all())
+    savings = dict(read(
+        select(SavingsAccount.client_id, func.sum(SavingsAccount.balance))
+        .where(condition(SavingsAccount.client_id), SavingsAccount.status == 'active')
+        .group_by(SavingsAccount.client_id)
+    ).all())
+    last_savings = dict(read(
+        select(SavingsAccount.client_id, func.max(SavingsTransaction.transaction_date))
+        .join(SavingsTransaction, SavingsTransaction.account_id == SavingsAccount.id)
+        .where(condition(SavingsAccount.client_id)).group_by(SavingsAccount.client_id)
+    ).all())
+
+    values = {}
+    for client_id, total, active, completed, borrowed, repaid, debt, last_credit in credit_rows:
+        values[client_id] = {
+            'total_credits': total,
+            'active_credits': int(active or 0),
+            'completed_credits': int(completed or 0),
+            'total_borrowed': float(borrowed or 0),
+            'total_repaid': float(repaid or 0),
+            'current_debt': float(debt or 0),
+            'last_activity_at': last_credit
+        }
+    for client_id, balance in savings.items():
+        values.setdefault(client_id, {})['savings_balance'] = float(balance or 0)
+    for source in (last_payments, last_savings):
+        for client_id, moment in source.items():
+            current = values.setdefault(client_id, {}).get('last_activity_at')
+            if moment is not None and (current is None or moment > current):
+                values[client_id]['last_activity_at'] = moment
+    return values
+
+
+def _summary_rows(client_ids, values, updated_at):
+    empty = {'total_credits': 0, 'active_credits': 0, 'completed_credits': 0, 'total_borrowed': 0.0,
+             'total_repaid': 0.0, 'current_debt': 0.0, 'savings_balance': 0.0, 'last_activity_at': None}
+    return [dict(empty, **values.get(client_id, {}), client_id=client_id, updated_at=updated_at) for client_id in client_ids]
+
+
+def _update_params(row):
+    params = {field: row[field] for field in SUMMARY_FIELDS + ('updated_at',)}
+    params['summary_client_id'] = row['client_id']
+    return params
+
+
+def refresh_client_summaries(client_ids, connection=None):
+    """Recompute the ``client_summaries`` rows of the given clients now, creating missing ones.
+
+    The summary rows are locked first and the totals read with locking
+    reads, so two refreshes of the same client run one after the other
+    and the last one sees both writes. Writers use
+    ``schedule_summary_refresh`` instead.
+    """
+    connection = connection or db.session.connection()
+    summaries = ClientSummary.__table__
+    client_ids = sorted(set(client_ids))
+    for start in range(0, len(client_ids), REFRESH_CHUNK):
+        chunk = client_ids[start:start + REFRESH_CHUNK]
+        # Deleted clients drop out here
+        existing = connection.execute(select(Client.id).where(Client.id.in_(chunk))).scalars().all()
+        if not existing:
+            continue
+        stored = set(connection.execute(
+            select(summaries.c.client_id).where(summaries.c.client_id.in_(existing))
+            .order_by(summaries.c.client_id).with_for_update()
+        ).scalars())
+        values = _summary_values(connection.execute, lambda column: column.in_(existing), lock=True)
+        rows = _summary_rows(existing, values, datetime.utcnow())
+
+        # Core table: an ORM update() with a parameter list would switch to bulk-by-primary-key mode;
+        # the SET clause comes from the keys of each parameter set
+        refresh = update(summaries).where(summaries.c.client_id == bindparam('summary_client_id'))
+        updates = [_update_params(row) for row in rows if row['client_id'] in stored]
+        if updates:
+            connection.execute(refresh, updates)
+        missing = [row for row in rows if row['client_id'] not in stored]
+        if not missing:
+            continue
+        try:
+            with connection.begin_nested():
+                connection.execute(insert(summaries), missing)
+        except IntegrityError:
+            # Another transaction created some of them first: one row at a time
+            for row in missing:
+                try:
+                    with connection.begin_nested():
+                        connection.execute(insert(summaries).values(**row))
+                except IntegrityError:
+                    connection.execute(refresh, [_update_params(row)])
+
+
+def schedule_summary_refresh(client_ids, session=None):
+    """Queue the summaries of ``client_ids`` for a refresh once the current transaction commits.
+
+    The queue rows are written in the caller's transaction, so a refresh
+    that fails after the commit is retried by ``refresh_queued_summaries``.
+    Bulk writers that bypass the flush hook below call this with the
+    clients they touched.
+    """
+    if not client_ids:
+        return
+    session = session or db.session
+    client_ids = set(client_ids)
+    now = datetime.utcnow()
+    session.connection().execute(insert(SummaryRefresh), [{'client_id': client_id, 'created_at': now}
+                                                          for client_id in sorted(client_ids)])
+    session.info.setdefault('summary_clients', set()).update(client_ids)
+
+
+def _refresh_and_dequeue(client_ids, connection):
+    """Refresh the summaries of ``client_ids`` and drop their queue rows committed before the refresh."""
+    queue = SummaryRefresh.__table__
+    client_ids = sorted(set(client_ids))
+    # Read before the totals: a queue row committed later belongs to a write the refresh may not have seen
+    entries = []
+    for start in range(0, len(client_ids), REFRESH_CHUNK):
+        entries += connection.execute(
+            select(queue.c.id).where(queue.c.client_id.in_(client_ids[start:start + REFRESH_CHUNK]))
+        ).scalars().all()
+    refresh_client_summaries(client_ids, connection)
+    for start in range(0, len(entries), REFRESH_CHUNK):
+        connection.execute(delete(queue).where(queue.c.id.in_(entries[start:start + REFRESH_CHUNK])))
+
+
+@event.listens_for(Session, 'after_commit')
+def _refresh_summaries_after_commit(session):
+    """Recompute the scheduled summaries in a transaction of their own.
+
+    Inside the writer's transaction the totals would be read from its
+    snapshot, without a concurrent writer's rows, and locking the
+    summary there while holding credit row locks could deadlock with
+    that writer. Here the writes are committed and hold no lock.
+    """
+    client_ids = session.info.pop('summary_clients', None)
+    if not client_ids:
+        return
+    try:
+        with db.engine.begin() as connection:
+            _refresh_and_dequeue(client_ids, connection)
+    except Exception:
+        logger.exception('Could not refresh the summaries of %d client(s); they stay queued', len(client_ids))
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_summary_refresh(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop('summary_clients', None)
+
+
+def refresh_queued_summaries(limit=5000, min_age=60):
+    """Refresh the clients still queued ``min_age`` seconds after their write; returns their number.
+
+    Catches up the refreshes that failed or never ran after a commit (the
+    process died in between); younger rows are left to that refresh.
+    """
+    acquire_job_lock('client_summaries')
+    before = datetime.utcnow() - timedelta(seconds=min_age)
+    client_ids = set(db.session.execute(
+        select(SummaryRefresh.client_id).where(SummaryRefresh.created_at <= before)
+        .order_by(SummaryRefresh.id).limit(limit)
+    ).scalars())
+    if client_ids:
+        _refresh_and_dequeue(client_ids, db.session.connection())
+    db.session.commit()
+    return len(client_ids)
+
+
+def refresh_debt(connection=None):
+    """Recompute ``current_debt`` of every client holding an active credit in one UPDATE.
+
+    For set-based writers such as the penalty run, which change the
+    balance of many credits at once without touching anything else.
+    """
+    summaries = ClientSummary.__table__
+    debt = select(func.coalesce(_debt(), 0)).where(Credit.client_id == summaries.c.client_id).scalar_subquery()
+    (connection or db.session).execute(
+        update(summaries).where(
+            summaries.c.client_id.in_(select(Credit.client_id).where(Credit.status == 'active'))
+        ).values(current_debt=debt, updated_at=datetime.utcnow())
+    )
+
+
+def owners(credit_ids=(), account_ids=(), connection=None):
+    """Client ids owning the given credits and savings accounts."""
+    execute = (connection or db.session).execute
+    client_ids = set()
+    if credit_ids:
+        client_ids.update(execute(select(Credit.client_id).where(Credit.id.in_(set(credit_ids)))).scalars())
+    if account_ids:
+        client_ids.update(execute(select(SavingsAccount.client_id).where(SavingsAccount.id.in_(set(account_ids)))).scalars())
+    return client_ids
+
+
+def get_client_summary(client_id):
+    """Stored summary of a client.
+
+    When the table has not been built yet, the values are computed for
+    display without any lock and stored in a short transaction of their
+    own, so a page view holds no row lock until its teardown.
+    """
+    row = db.session.get(ClientSummary, client_id)
+    if row is None:
+        values = _summary_values(db.session.execute, lambda column: column == client_id)
+        row = ClientSummary(**_summary_rows([client_id], values, datetime.utcnow())[0])
+        try:
+            with db.engine.begin() as connection:
+                refresh_client_summaries([client_id], connection)
+        except Exception:
+            logger.exception('Could not store the summary of client %s', client_id)
+    return row
+
+
+def rebuild_client_summaries(chunk_size=5000):
+    """Rebuild every client's summary, ``chunk_size`` consecutive ids per transaction; returns the count."""
+    total = 0
+    last_id = 0
+    while True:
+        client_ids = db.session.execute(
+            select(Client.id).where(Client.id > last_id).order_by(Client.id).limit(chunk_size)
+        ).scalars().all()
+        if not client_ids:
+            break
+        first, last_id = client_ids[0], client_ids[-1]
+        values = _summary_values(db.session.execute, lambda column: column.between(first, last_id))
+        db.session.execute(delete(ClientSummary).where(ClientSummary.client_id.between(first, last_id)))
+        db.session.execute(insert(ClientSummary), _summary_rows(client_ids, values, datetime.utcnow()))
+        db.session.commit()
+        total += len(client_ids)
+    return total
+
+
+@event.listens_for(Session, 'after_flush')
+def _maintain_summaries_on_flush(session, flush_context):
+    client_ids = set()
+    credit_ids = set()
+    account_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Client):
+            if obj in session.new:
+                client_ids.add(obj.id)
+        elif isinstance(obj, (Credit, SavingsAccount)):
+            if obj.client_id is not None:
+                client_ids.add(obj.client_id)
+        elif isinstance(obj, CreditPayment):
+            if obj.credit_id is not None:
+                credit_ids.add(obj.credit_id)
+        elif isinstance(obj, SavingsTransaction):
+            if obj.account_id is not None:
+                account_ids.add(obj.account_id)
+    if not (client_ids or credit_ids or account_ids):
+        return
+
+    connection = session.connection()
+    client_ids |= owners(credit_ids, account_ids, connection)
+    deleted = {obj.id for obj in session.deleted if isinstance(obj, Client)}
+    if deleted:
+        connection.execute(delete(ClientSummary).where(ClientSummary.client_id.in_(deleted)))
+    schedule_summary_refresh(client_ids - deleted, session)
+
+
+@click.command('refresh-client-summaries')
+@with_appcontext
+def refresh_client_summaries_command():
+    """Recalcule les synthèses client restées en attente après une écriture."""
+    total = 0
+    while True:
+        count = refresh_queued_summaries(min_age=0)
+        if not count:
+            break
+        total += count
+    click.echo(f'{total} client(s) recalculé(s)')
+
+
+@click.command('rebuild-client-summaries')
+@click.option('--chunk-size', type=int, default=5000)
+@with_appcontext
+def rebuild_client_summaries_command(chunk_size):
+    """Reconstruit la synthèse par client (crédits, encours, épargne, dernière activité)."""
+    started = time.perf_counter()
+    count = rebuild_client_summaries(chunk_size)
+    elapsed = time.perf_counter() - started
+    click.echo(f'{count} client(s) recalculé(s) en {elapsed:.2f}s')
@@ -0,0 +1,260 @@
+import random
+import time
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, insert
+from amortization import loan_terms, due_dates
+from geo import geohash
+from identifiers import reserve_ids
+from models import db, Client, Product, Credit, CreditPayment, SavingsAccount, SavingsTransaction, PaymentSchedule, ClientLocation
+from rollups import rebuild_monthly_summary
+from scoring import rescore_clients
+from search import rebuild_search_index
+from snapshot import invalidate_snapshot
+from summaries import rebuild_client_summaries
+
+# Rows per model at scale 1; credits, schedules, payments and transactions follow from the per-client draws
+BASE_CLIENTS = 100_000
+CREDITS_PER_CLIENT = (0, 6)  # uniform, 3 on average -> ~300k credits, ~3M installments
+SAVINGS_ACCOUNT_SHARE = 0.6
+TRANSACTIONS_PER_ACCOUNT = (5, 28)  # uniform, ~16.5 on average -> ~1M transactions
+LOCATED_SHARE = 0.8
+HISTORY_DAYS = 3 * 365
+
+INSERT_CHUNK = 5000
+
+FIRST_NAMES = ('Awa', 'Moussa', 'Fatou', 'Ibrahima', 'Aminata', 'Mamadou', 'Mariam', 'Kouassi', 'Adjoua', 'Yao',
+               'Aïcha', 'Seydou', 'Rokia', 'Koffi', 'Affoué', 'Drissa', 'Salimata', 'Issouf', 'Éloïse', 'Jean-Baptiste')
+LAST_NAMES = ('Koné', 'Traoré', 'Ouattara', 'Coulibaly', 'Diallo', 'Kouamé', "N'Guessan", 'Bamba', 'Yao', 'Touré',
+              'Konan', 'Cissé', 'Diabaté', 'Kouadio', 'Sangaré', 'Fofana', 'Doumbia', 'Bakayoko', 'Aka', 'Soro')
+CITIES = ((5.3600, -4.0083, 0.5), (7.6906, -5.0300, 0.15), (6.8276, -5.2893, 0.15), (4.7485, -6.6363, 0.1), (9.4580, -5.6296, 0.1))
+PAYMENT_METHODS = ('cash', 'cash', 'wave', 'orange_money', 'bank_transfer')
+DURATIONS = (6, 9, 12, 12, 18, 24)
+# Share of due installments a client pays: most pay, some fall behind
+RELIABILITY = (0.99, 0.98, 0.95, 0.9, 0.75, 0.5)
+
+DEFAULT_CREDIT_PRODUCTS = (
+    ('Microcrédit Commerce', 18.0, 50_000, 1_000_000),
+    ('Crédit Agricole', 15.0, 100_000, 2_000_000),
+    ('Crédit Scolaire', 12.0, 25_000, 500_000),
+)
+DEFAULT_SAVINGS_PRODUCTS = (('Épargne Libre', 3.5), ('Épargne Bloquée', 5.0))
+
+
+class _Ids:
+    """Primary keys assigned here so child rows can be built before their parents are inserted."""
+
+    def __init__(self, models):
+        self.next = {model: (db.session.query(func.max(model.id)).scalar() or 0) + 1 for model in models}
+
+    def take(self, model):
+        value = self.next[model]
+        self.next[model] += 1
+        return value
+
+
+def _products():
+    """Active credit and savings products as plain dicts, creating a default range if there is none."""
+    credit = Product.query.filter_by(product_type='credit', active=True).all()
+    if not credit:
+        credit = [Product(name=name, product_type='credit', interest_rate=rate, min_amount=low, max_amount=high,
+                          min_duration=6, max_duration=24, active=True) for name, rate, low, high in DEFAULT_CREDIT_PRODUCTS]
+        db.session.add_all(credit)
+    savings = Product.query.filter_by(product_type='savings', active=True).all()
+    if not savings:
+        savings = [Product(name=name, product_type='savings', interest_rate=rate, active=True)
+                   for name, rate in DEFAULT_SAVINGS_PRODUCTS]
+        db.session.add_all(savings)
+    db.session.commit()
+    fields = ('id', 'interest_rate', 'min_amount', 'max_amount')
+    return [[{field: getattr(product, field) for field in fields} for product in products] for products in (credit, savings)]
+
+
+def _moment(rnd, start, end):
+    return start + timedelta(seconds=rnd.randint(0, max(int((end - start).total_seconds()), 0)))
+
+
+def _client_rows(rnd, ids, client_numbers, now):
+    rows = []
+    for number in client_numbers:
+        first, last = rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES)
+        created_at = _moment(rnd, now - timedelta(days=HISTORY_DAYS), now)
+        phone = f'+225 0{rnd.choice((1, 5, 7))} {rnd.randint(0, 99):02d} {rnd.randint(0, 99):02d} {rnd.randint(0, 99):02d} {rnd.randint(0, 99):02d}'
+        rows.append({
+            'id': ids.take(Client), 'client_id': number, 'first_name': first, 'last_name': last,
+            'email': f'{number.lower()}@exemple.ci' if rnd.random() < 0.4 else None, 'phone': phone,
+            'address': f'Quartier {rnd.randint(1, 40)}, lot {rnd.randint(1, 500)}',
+            'date_of_birth': date(rnd.randint(1955, 2004), rnd.randint(1, 12), rnd.randint(1, 28)),
+            'id_number': f'CI{rnd.randint(0, 10 ** 9):09d}', 'created_at': created_at, 'updated_at': created_at
+        })
+    return rows
+
+
+def _location_rows(rnd, clients, now):
+    rows = []
+    for client in clients:
+        if rnd.random() >= LOCATED_SHARE:
+            continue
+        latitude, longitude, spread = rnd.choices(CITIES, weights=[city[2] for city in CITIES])[0]
+        latitude = round(rnd.gauss(latitude, spread / 4), 6)
+        longitude = round(rnd.gauss(longitude, spread / 4), 6)
+        rows.append({'client_id': client['id'], 'latitude': latitude, 'longitude': longitude,
+                     'geohash': geohash(latitude, longitude), 'updated_at': now})
+    return rows
+
+
+def _credit_rows(rnd, ids, clients, products, now, schedule_dates):
+    """Credits of ``clients`` with their installments and payments, consistent with each other."""
+    drafts = []
+    for client in clients:
+        reliability = rnd.choice(RELIABILITY)
+        for _ in range(rnd.randint(*CREDITS_PER_CLIENT)):
+            product = rnd.choice(products)
+            low, high = product['min_amount'] or 25_000, product['max_amount'] or 1_000_000
+            drafts.append((client, reliability, product, round(rnd.uniform(low, high), -3), rnd.choice(DURATIONS)))
+    if not drafts:
+        return [], [], []
+    terms = loan_terms([d[3] for d in drafts], [d[2]['interest_rate'] for d in drafts], [d[4] for d in drafts])
+    numbers = reserve_ids('credit', len(drafts))
+
+    credits, schedules, payments = [], [], []
+    today = now.date()
+    for (client, reliability, product, amount, duration), number, monthly, total in zip(
+            drafts, numbers, terms['monthly_payment'].tolist(), terms['total_amount'].tolist()):
+        applied_at = _moment(rnd, client['created_at'], now)
+        credit = {
+            'id': ids.take(Credit), 'credit_number': number, 'client_id': client['id'], 'product_id': product['id'],
+            'amount': amount, 'interest_rate': product['interest_rate'], 'duration_months': duration,
+            'monthly_payment': monthly, 'total_amount': total, 'amount_paid': 0.0, 'penalty_amount': 0.0,
+            'status': 'pending', 'application_date': applied_at, 'approval_date': None, 'disbursement_date': None,
+            'credit_score': round(rnd.uniform(20, 95), 1), 'notes': None, 'collateral': None
+        }
+        credits.append(credit)
+        disbursed_at = applied_at + timedelta(days=rnd.randint(2, 14))
+        if disbursed_at > now:
+            # Recent applications are still waiting
+            if rnd.random() < 0.5:
+                credit.update(status='approved', approval_date=applied_at + timedelta(days=1))
+            continue
+
+        dates = schedule_dates(disbursed_at.date(), duration)
+        credit.update(status='active', approval_date=disbursed_at - timedelta(days=1), disbursement_date=disbursed_at)
+        all_paid = dates[-1] < today and rnd.random() < max(reliability, 0.8)
+        for installment, due in enumerate(dates, 1):
+            paid = all_paid or (due <= today and rnd.random() < reliability)
+            paid_date = min(due + timedelta(days=rnd.randint(-5, 10)), today) if paid else None
+            schedules.append({
+                'id': ids.take(PaymentSchedule), 'credit_id': credit['id'], 'installment_number': installment,
+                'due_date': due, 'expected_amount': monthly, 'paid': paid, 'paid_date': paid_date,
+                'paid_amount': monthly if paid else 0.0
+            })
+            if paid:
+                credit['amount_paid'] += monthly
+                payments.append({
+                    'id': ids.take(CreditPayment), 'credit_id': credit['id'], 'amount': monthly,
+                    'payment_date': datetime.combine(paid_date, datetime.min.time()) + timedelta(minutes=rnd.randint(480, 1080)),
+                    'payment_method': rnd.choice(PAYMENT_METHODS), 'reference': None, 'notes': None
+                })
+        credit['amount_paid'] = round(credit['amount_paid'], 2)
+        if all_paid:
+            credit['status'] = 'completed'
+    return credits, schedules, payments
+
+
+def _savings_rows(rnd, ids, clients, products, now):
+    holders = [client for client in clients if rnd.random() < SAVINGS_ACCOUNT_SHARE]
+    numbers = reserve_ids('savings', len(holders)) if holders else []
+    accounts, transactions = [], []
+    for client, number in zip(holders, numbers):
+        product = rnd.choice(products)
+        opened_at = _moment(rnd, client['created_at'], now)
+        account = {
+            'id': ids.take(SavingsAccount), 'account_number': number, 'client_id': client['id'],
+            'product_id': product['id'], 'balance': 0.0, 'interest_rate': product['interest_rate'],
+            'status': 'active', 'opening_date': opened_at, 'closing_date': None
+        }
+        accounts.append(account)
+        moments = sorted(_moment(rnd, opened_at, now) for _ in range(rnd.randint(*TRANSACTIONS_PER_ACCOUNT)))
+        balance = 0.0
+        for i, moment in enumerate(moments):
+            amount = float(rnd.randint(1, 100) * 500)
+            kind = 'deposit' if i == 0 or rnd.random() < 0.7 or amount > balance else 'withdrawal'
+            balance += amount if kind == 'deposit' else -amount
+            transactions.append({
+                'id': ids.take(SavingsTransaction), 'account_id': account['id'], 'transaction_type': kind,
+                'amount': amount, 'transaction_date': moment, 'balance_after': balance,
+                'payment_method': rnd.choice(PAYMENT_METHODS), 'reference': None, 'notes': None
+            })
+        account['balance'] = balance
+    return accounts, transactions
+
+
+def _insert(model, rows):
+    for start in range(0, len(rows), INSERT_CHUNK):
+        db.session.execute(insert(model), rows[start:start + INSERT_CHUNK])
+
+
+def generate_synthetic_data(scale=1.0, seed=42, chunk_size=2000, progress=None):
+    """Add ``BASE_CLIENTS * scale`` clients with their credits, schedules, payments and savings.
+
+    The same ``seed`` and ``scale`` give the same data (dates are
+    relative to today). Rows are built ``chunk_size`` clients at a time
+    and written with bulk INSERTs, one transaction per chunk, then the
+    derived tables (summaries, search index, monthly totals, scores) are
+    rebuilt. Primary keys are assigned from the current maxima, so run it
+    on a database nobody else is writing to. Returns the rows added per table.
+    """
+    rnd = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    credit_products, savings_products = _products()
+    ids = _Ids((Client, Credit, PaymentSchedule, CreditPayment, SavingsAccount, SavingsTransaction))
+    schedule_dates = lru_cache(maxsize=None)(due_dates)
+    counts = dict.fromkeys(('clients', 'locations', 'credits', 'payment_schedule', 'credit_payments',
+                            'savings_accounts', 'savings_transactions'), 0)
+
+    total = int(BASE_CLIENTS * scale)
+    for start in range(0, total, chunk_size):
+        size = min(chunk_size, total - start)
+        clients = _client_rows(rnd, ids, reserve_ids('client', size), now)
+        locations = _location_rows(rnd, clients, now)
+        credits, schedules, payments = _credit_rows(rnd, ids, clients, credit_products, now, schedule_dates)
+        accounts, transactions = _savings_rows(rnd, ids, clients, savings_products, now)
+
+        for model, rows, key in ((Client, clients, 'clients'), (ClientLocation, locations, 'locations'),
+                                 (Credit, credits, 'credits'), (PaymentSchedule, schedules, 'payment_schedule'),
+                                 (CreditPayment, payments, 'credit_payments'), (SavingsAccount, accounts, 'savings_accounts'),
+                                 (SavingsTransaction, transactions, 'savings_transactions')):
+            _insert(model, rows)
+            counts[key] += len(rows)
+        db.session.commit()
+        if progress:
+            progress(start + size, total)
+
+    # Bulk inserts bypass the flush hooks that keep these up to date
+    rebuild_client_summaries()
+    rebuild_search_index()
+    rebuild_monthly_summary()
+    rescore_clients()
+    invalidate_snapshot()
+    db.session.commit()
+    return counts
+
+
+@click.command('generate-synthetic-data')
+@click.option('--scale', type=float, default=1.0, help='1 = 100 000 clients, ~300 000 crédits, ~3 M échéances, ~1 M opérations d\'épargne.')
+@click.option('--seed', type=int, default=42)
+@click.option('--chunk-size', type=int, default=2000, help='Clients générés par transaction.')
+@with_appcontext
+def generate_synthetic_data_command(scale, seed, chunk_size):
+    """Remplit la base de données fictives réalistes, pour les mesures de performance."""
+    started = time.perf_counter()
+
+    def progress(done, total):
+        click.echo(f'{done}/{total} clients ({time.perf_counter() - started:.0f}s)')
+
+    counts = generate_synthetic_data(scale, seed, chunk_size, progress)
+    for table, count in counts.items():
+        click.echo(f'{table}: {count}')
+    click.echo(f'Terminé en {time.perf_counter() - started:.1f}s')
@@ -0,0 +1,51 @@
+"""Keyset pages cover every row exactly once, in both directions, including rows with a NULL sort value."""
+from datetime import datetime, timedelta
+import pytest
+from app import create_app
+from models import db, SettlementFile
+from pagination import keyset_paginate
+
+PER_PAGE = 3
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    folder = tmp_path_factory.mktemp('pagination')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{folder / "pagination.db"}', 'TESTING': True})
+    with app.app_context():
+        db.create_all()
+        start = datetime(2026, 1, 1)
+        # Ten dated rows, two of them sharing a timestamp, and four without a date
+        moments = [start + timedelta(days=day) for day in range(9)] + [start + timedelta(days=4)] + [None] * 4
+        for number, moment in enumerate(moments):
+            db.session.add(SettlementFile(provider='wave', file_name=f'releve{number}.csv', file_digest=f'{number:064d}'))
+        db.session.flush()
+        for record, moment in zip(SettlementFile.query.order_by(SettlementFile.id), moments):
+            record.created_at = moment
+        db.session.commit()
+        yield app
+
+
+def _page(after=None, before=None):
+    return keyset_paginate(SettlementFile.query, SettlementFile.created_at, SettlementFile.id,
+                           after=after, before=before, per_page=PER_PAGE)
+
+
+def test_pages_follow_the_full_ordering(app):
+    # Newest first, undated rows last
+    rows = sorted(SettlementFile.query.all(), reverse=True,
+                  key=lambda record: (record.created_at is not None, record.created_at or datetime.min, record.id))
+    expected = [record.id for record in rows]
+
+    pages = [_page()]
+    while pages[-1].has_next:
+        pages.append(_page(after=pages[-1].next_cursor))
+    assert [record.id for page in pages for record in page.items] == expected
+    assert [record.created_at for record in pages[-1].items] == [None] * len(pages[-1].items)
+
+    # Walking back from the last page gives the same pages
+    backwards = [pages[-1]]
+    while backwards[-1].has_prev:
+        backwards.append(_page(before=backwards[-1].prev_cursor))
+    assert [[record.id for record in page.items] for page in reversed(backwards)] == \
+           [[record.id for record in page.items] for page in pages]
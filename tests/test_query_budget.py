@@ -0,0 +1,120 @@
+"""Every view declaring a ``@query_budget`` stays within it on a seeded database.
+
+A view that starts loading a relation per row (N+1) exceeds its budget
+and fails here with the list of statements it emitted.
+"""
+from datetime import datetime
+import pytest
+from sqlalchemy import func, select
+from app import create_app, setup_database
+from models import db, Client, Credit, SavingsAccount, MobilePayment, SettlementFile, SettlementLine
+from query_budget import QueryBudgetExceeded
+from synthetic import generate_synthetic_data
+
+# Endpoint -> URL; '{client}', '{credit}'... are filled with ids of the seeded data
+URLS = {
+    'dashboard': '/dashboard',
+    'clients': '/clients',
+    'search_clients_json': '/clients/search?q=kone',
+    'client_detail': '/clients/{client}',
+    'client_credit_history': '/clients/{client}/credit-history',
+    'credits': '/credits',
+    'credit_detail': '/credits/{credit}',
+    'settlements': '/settlements',
+    'settlement_detail': '/settlements/{settlement}',
+    'savings': '/savings',
+    'savings_detail': '/savings/{account}',
+    'mobile_payment_status': '/savings/payments/{payment}',
+    'analytics': '/analytics',
+    'reports': '/reports',
+    'client_map': '/map',
+    'client_map_data': '/map/clients?south=4&west=-9&north=11&east=-2&zoom=7',
+    'notifications': '/notifications',
+    'metrics': '/admin/metrics',
+    'export_clients': '/export/clients',
+    'export_credits': '/export/credits',
+    'export_savings': '/export/savings',
+}
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    folder = tmp_path_factory.mktemp('query_budget')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{folder / "budget.db"}',
+        'TESTING': True,
+        'QUERY_BUDGET_ENFORCED': True,
+        'WTF_CSRF_ENABLED': False,
+        'UPLOAD_FOLDER': str(folder / 'uploads'),
+        'CLIENT_PHOTOS_FOLDER': str(folder / 'uploads' / 'client_photos'),
+        'CLIENT_ID_CARDS_FOLDER': str(folder / 'uploads' / 'client_id_cards'),
+    })
+    with app.app_context():
+        setup_database()
+        # About 200 clients: enough rows per page for an N+1 to show
+        generate_synthetic_data(scale=0.002, seed=7)
+        _seed_other_rows()
+        yield app
+
+
+def _seed_other_rows():
+    account = db.session.execute(select(SavingsAccount).order_by(SavingsAccount.id)).scalars().first()
+    db.session.add(MobilePayment(account_id=account.id, transaction_type='deposit', amount=5000,
+                                 payment_method='wave', status='confirmed'))
+    settlement = SettlementFile(provider='wave', file_name='releve.csv', file_digest='0' * 64, lines_total=2, lines_unmatched=2)
+    settlement.lines = [SettlementLine(line_number=number, transaction_reference=f'T{number}', amount=1000,
+                                       paid_at=datetime.utcnow(), reason='Aucun crédit correspondant')
+                        for number in (2, 3)]
+    db.session.add(settlement)
+    db.session.commit()
+
+
+@pytest.fixture(scope='module')
+def ids(app):
+    # The client with the most credits, so per-credit queries would show
+    client_id = db.session.execute(
+        select(Credit.client_id).group_by(Credit.client_id).order_by(func.count().desc(), Credit.client_id).limit(1)
+    ).scalar()
+    return {
+        'client': client_id,
+        'credit': db.session.execute(select(Credit.id).where(Credit.client_id == client_id).limit(1)).scalar(),
+        'account': db.session.execute(select(func.min(SavingsAccount.id))).scalar(),
+        'payment': db.session.execute(select(func.min(MobilePayment.id))).scalar(),
+        'settlement': db.session.execute(select(func.min(SettlementFile.id))).scalar(),
+    }
+
+
+@pytest.fixture(scope='module')
+def client(app):
+    client = app.test_client()
+    response = client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 302
+    return client
+
+
+def _budgeted_endpoints(app):
+    return sorted(endpoint for endpoint, view in app.view_functions.items() if hasattr(view, 'query_budget'))
+
+
+def test_every_budgeted_view_has_a_url(app):
+    assert sorted(URLS) == _budgeted_endpoints(app)
+
+
+@pytest.mark.parametrize('endpoint', sorted(URLS))
+def test_view_stays_within_budget(client, ids, endpoint):
+    response = client.get(URLS[endpoint].format(**ids))
+    # Reading the body runs streamed exports to the end, where their budget is checked
+    response.get_data()
+    assert response.status_code == 200
+
+
+def test_streamed_export_is_checked_after_its_body(app, client):
+    view = app.view_functions['export_credits']
+    budget = view.query_budget
+    view.query_budget = 1
+    try:
+        response = client.get('/export/credits')
+        with pytest.raises(QueryBudgetExceeded):
+            response.get_data()
+    finally:
+        view.query_budget = budget
@@ -0,0 +1,25 @@
+"""Amounts of Wave and Orange Money settlement lines, as the operators' exports write them."""
+import pytest
+from settlements import parse_amount
+
+
+@pytest.mark.parametrize('text, amount', [
+    ('10000', 10000),
+    ('10 000', 10000),
+    ('10 000 FCFA', 10000),
+    ('10.000', 10000),
+    ('1.500.000', 1500000),
+    ('1,500', 1500),
+    ('1,500,000 XOF', 1500000),
+    ('10.000,50', 10000.5),
+    ('1,000,000.75', 1000000.75),
+    ('10,5', 10.5),
+    ('12.50', 12.5),
+])
+def test_parse_amount(text, amount):
+    assert parse_amount(text) == amount
+
+
+@pytest.mark.parametrize('text', ['', 'abc', '1.500.00', '1.50.000', '10..000'])
+def test_parse_amount_rejects_malformed_amounts(text):
+    assert parse_amount(text) is None
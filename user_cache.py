@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from models import db, User
+from reference_data import cache_version
+
+_lock = threading.Lock()
+_entries = OrderedDict()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+_COLUMNS = [attr.key for attr in inspect(User).column_attrs]
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def _cached_values(user_id, now, version):
+    with _lock:
+        entry = _entries.get(user_id)
+        if entry is None:
+            return None
+        stored_at, stored_version, values = entry
+        if stored_version != version or now - stored_at > current_app.config.get('USER_CACHE_TTL', 60):
+            del _entries[user_id]
+            return None
+        _entries.move_to_end(user_id)
+        return values
+
+
+def _store(user, now, version):
+    values = {key: getattr(user, key) for key in _COLUMNS}
+    size = current_app.config.get('USER_CACHE_SIZE', 1024)
+    with _lock:
+        _entries[user.id] = (now, version, values)
+        _entries.move_to_end(user.id)
+        while len(_entries) > size:
+            _entries.popitem(last=False)
+            _stats['evictions'] += 1
+
+
+def load_cached_user(user_id):
+    """User for Flask-Login's user loader, from this process's cache when possible.
+
+    A cached user is rebuilt from its column values and merged into the
+    request's session without a SELECT, so ``current_user`` is the
+    session's own instance and can be modified and committed as usual.
+    Entries live ``USER_CACHE_TTL`` seconds and are dropped as soon as
+    the 'users' version of ``cache_versions`` changes, which every write
+    to a user bumps, so a deactivated or demoted user loses their old
+    role in every process on their next request.
+    """
+    if not current_app.config.get('USER_CACHE_TTL', 60):
+        return db.session.get(User, user_id)
+
+    now = time.monotonic()
+    # Read before the user: a write committed in between only leaves newer values under an older version
+    version = cache_version('users')
+    values = _cached_values(user_id, now, version)
+    if values is None:
+        _count('misses')
+        user = db.session.get(User, user_id)
+        if user is not None:
+            _store(user, now, version)
+        return user
+
+    _count('hits')
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def invalidate_user(user_id):
+    with _lock:
+        if _entries.pop(user_id, None) is not None:
+            _stats['invalidations'] += 1
+
+
+def user_cache_stats():
+    with _lock:
+        stats = dict(_stats, size=len(_entries))
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups * 100 if lookups else 0
+    return stats
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidate_users_on_flush(session, flush_context):
+    user_ids = {obj.id for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+                if isinstance(obj, User) and obj.id is not None}
+    if user_ids:
+        for user_id in user_ids:
+            invalidate_user(user_id)
+        session.info.setdefault('changed_user_ids', set()).update(user_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_users_on_commit(session):
+    # A concurrent request may have cached the old row between flush and commit
+    for user_id in session.info.pop('changed_user_ids', ()):
+        invalidate_user(user_id)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_changed_users(session, previous_transaction):
+    session.info.pop('changed_user_ids', None)